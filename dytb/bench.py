@@ -0,0 +1,164 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Throughput benchmark of the input pipelines"""
+
+import csv
+import itertools
+import json
+import time
+import numpy as np
+import tensorflow as tf
+
+from . import __version__
+from .inputs.interfaces import InputType
+
+# fields of a benchmark result, in the order of the csv columns
+FIELDS = [
+    "dataset", "pipeline", "input_type", "batch_size", "num_threads",
+    "augmentation", "num_steps", "examples_per_sec", "latency_mean_ms",
+    "latency_p50_ms", "latency_p90_ms", "latency_p99_ms", "dytb_version",
+    "time"
+]
+
+
+def bench_inputs(dataset,
+                 input_type,
+                 batch_size,
+                 augmentation_fn=None,
+                 num_steps=100,
+                 warmup_steps=10):
+    """Measure the throughput of the input pipeline of dataset, without a model.
+    Args:
+        dataset: implementation of the Input interface
+        input_type: InputType enum
+        batch_size: the batch size
+        augmentation_fn: if present, the augmentation applied to the input data
+        num_steps: number of measured batches
+        warmup_steps: number of batches read before the measurement, to fill
+                      the queues and the buffers of the pipeline
+    Returns:
+        result: dict {"pipeline", "examples_per_sec", "latency_mean_ms",
+                "latency_p50_ms", "latency_p90_ms", "latency_p99_ms"}
+    """
+    InputType.check(input_type)
+    with tf.Graph().as_default():
+        with tf.device('/cpu:0'):
+            batch = dataset.inputs(
+                input_type=input_type,
+                batch_size=batch_size,
+                augmentation_fn=augmentation_fn)
+            # evaluate the batch without copying it out of the runtime
+            step = tf.group(*batch)
+
+        init = [
+            tf.variables_initializer(tf.global_variables() +
+                                     tf.local_variables()),
+            tf.tables_initializer()
+        ]
+        with tf.Session(config=tf.ConfigProto(
+                allow_soft_placement=True)) as sess:
+            sess.run(init)
+            coord = tf.train.Coordinator()
+            threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+            latencies = []
+            try:
+                for _ in range(warmup_steps):
+                    sess.run(step)
+                start = time.time()
+                for _ in range(num_steps):
+                    step_start = time.time()
+                    sess.run(step)
+                    latencies.append(time.time() - step_start)
+                duration = time.time() - start
+            finally:
+                coord.request_stop()
+                coord.join(threads, stop_grace_period_secs=5)
+
+    latencies = np.array(latencies) * 1000
+    return {
+        # the pipeline in use: the default of the dataset, if not chosen.
+        # None for the inputs without a pipeline option
+        "pipeline": getattr(dataset, "_pipeline", None),
+        "examples_per_sec": num_steps * batch_size / duration,
+        "latency_mean_ms": float(np.mean(latencies)),
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p90_ms": float(np.percentile(latencies, 90)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def sweep_inputs(dataset_fn,
+                 input_type,
+                 batch_sizes,
+                 num_threads=(None, ),
+                 augmentations=None,
+                 num_steps=100,
+                 warmup_steps=10):
+    """Run bench_inputs for every combination of batch size, number of
+    threads and augmentation.
+    Args:
+        dataset_fn: function(num_threads) -> implementation of the Input
+                    interface. num_threads is None for the default value
+        input_type: InputType enum
+        batch_sizes: list of batch sizes
+        num_threads: list of number of threads of the pipeline
+        augmentations: dict {name: augmentation_fn}. A None augmentation_fn
+                       disables the augmentation.
+                       Default: {"none": None}
+        num_steps: number of measured batches of every run
+        warmup_steps: number of batches read before every measurement
+    Returns:
+        results: list of dicts, with the keys in FIELDS
+    """
+    if augmentations is None:
+        augmentations = {"none": None}
+
+    results = []
+    for threads, batch_size, name in itertools.product(
+            num_threads, batch_sizes, sorted(augmentations)):
+        dataset = dataset_fn(threads)
+        result = bench_inputs(
+            dataset,
+            input_type,
+            batch_size,
+            augmentation_fn=augmentations[name],
+            num_steps=num_steps,
+            warmup_steps=warmup_steps)
+        result.update({
+            "dataset": dataset.name,
+            "input_type": str(input_type),
+            "batch_size": batch_size,
+            "num_threads": threads,
+            "augmentation": name,
+            "num_steps": num_steps,
+            "dytb_version": __version__,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        print('{dataset} ({pipeline}) {input_type} batch_size={batch_size} '
+              'num_threads={num_threads} augmentation={augmentation}: '
+              '{examples_per_sec:.1f} examples/sec, '
+              'p50 {latency_p50_ms:.2f} ms, p99 {latency_p99_ms:.2f} ms'.format(
+                  **result))
+        results.append(result)
+    return results
+
+
+def write_results(results, path):
+    """Write the results of sweep_inputs in path.
+    The format is csv if path ends with .csv, json otherwise.
+    Args:
+        results: list of results
+        path: the destination file
+    """
+    with open(path, 'w') as output:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(output, FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump(results, output, indent=2, sort_keys=True)
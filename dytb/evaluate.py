@@ -16,7 +16,9 @@ def evaluate(metric,
              dataset,
              input_type,
              batch_size,
-             augmentation_fn=None):
+             augmentation_fn=None,
+             exact=False,
+             tta=None):
     """Eval the model, restoring weight found in checkpoint_path, using the dataset.
     Args:
         metric: the metric to evaluate. The usual dictionary with the fn and its properties
@@ -26,6 +28,10 @@ def evaluate(metric,
         input_type: InputType enum
         batch_size: evaluate in batch of size batch_size
         augmentation_fn: if present, applies the augmentation to the input data
+        exact: if True, every example is read exactly once and the result
+               does not depend on the batch size
+        tta: if present, the test time augmentation dictionary
+             {"views": [view, ...], "reduce": "mean" | "max"}. See dytb.evaluators.tta
     Returns:
         value: scalar value representing the evaluation of the model,
                on the dataset, fetching values of the specified input_type
@@ -33,10 +39,17 @@ def evaluate(metric,
     InputType.check(input_type)
     model.evaluator.dataset = dataset
     return model.evaluator.eval(metric, checkpoint_path, input_type, batch_size,
-                                augmentation_fn)
+                                augmentation_fn, exact, tta)
 
 
-def stats(checkpoint_path, model, dataset, batch_size, augmentation_fn=None):
+def stats(checkpoint_path,
+          model,
+          dataset,
+          batch_size,
+          augmentation_fn=None,
+          exact=False,
+          max_workers=1,
+          tta=None):
     """Eval the model, restoring weight found in checkpoint_path, using the dataset.
     Args:
         checkpoint_path: path of the trained model checkpoint directory
@@ -44,8 +57,79 @@ def stats(checkpoint_path, model, dataset, batch_size, augmentation_fn=None):
         dataset: implementation of the Input interface
         batch_size: evaluate in batch of size batch_size
         augmentation_fn: if present, applies the augmentation to the input data
+        exact: if True, every example is read exactly once and the result
+               does not depend on the batch size
+        max_workers: maximum number of worker processes to use to evaluate
+                     the splits in parallel, one per split: at most 3
+        tta: if present, the test time augmentation dictionary
+             {"views": [view, ...], "reduce": "mean" | "max"}. See dytb.evaluators.tta
     Returns:
         dict: a dictionary with the statistics measured
     """
     model.evaluator.dataset = dataset
-    return model.evaluator.stats(checkpoint_path, batch_size, augmentation_fn)
+    return model.evaluator.stats(checkpoint_path, batch_size, augmentation_fn,
+                                 exact, max_workers, tta)
+
+
+def extract_features(checkpoint_path, model, dataset, input_type, layer_names,
+                     output_dir, batch_size):
+    """Restore the model from checkpoint_path and extract the features of the
+    layers named layer_names, for every example of the input_type split of dataset.
+    Args:
+        checkpoint_path: path of the trained model checkpoint directory
+        model: implementation of the Model interface
+        dataset: implementation of the Input interface
+        input_type: InputType enum
+        layer_names: list of strings, the names of the layers to extract
+        output_dir: the directory where to save the memory mapped .npy files
+        batch_size: extract the features in batch of size batch_size
+    Returns:
+        paths: dict {name: path} of the created .npy files. Features and labels
+               can be loaded with numpy.load(path, mmap_mode='r')
+    """
+    InputType.check(input_type)
+    model.evaluator.dataset = dataset
+    return model.evaluator.extract_dataset_features(
+        checkpoint_path, input_type, layer_names, output_dir, batch_size)
+
+
+def dump_predictions(checkpoint_path, model, dataset, input_type, output_dir,
+                     batch_size):
+    """Restore the model from checkpoint_path and save its predictions,
+    for every example of the input_type split of dataset.
+    Args:
+        checkpoint_path: path of the trained model checkpoint directory
+        model: implementation of the Model interface
+        dataset: implementation of the Input interface
+        input_type: InputType enum
+        output_dir: the directory where to save the memory mapped .npy files
+        batch_size: run the model in batch of size batch_size
+    Returns:
+        paths: dict {name: path} of the created .npy files, to use with
+               evaluate_predictions
+    """
+    InputType.check(input_type)
+    model.evaluator.dataset = dataset
+    return model.evaluator.dump_predictions(checkpoint_path, input_type,
+                                            output_dir, batch_size)
+
+
+def evaluate_predictions(paths, model, dataset, metrics=None):
+    """Measure the metrics on the predictions saved by dump_predictions,
+    using NumPy only: the model is not executed.
+    Args:
+        paths: dict {name: path}, the return value of dump_predictions
+        model: implementation of the Model interface
+        dataset: implementation of the Input interface
+        metrics: list of metrics to evaluate, elements of model.evaluator.metrics.
+                 If None, every metric with a NumPy implementation is evaluated
+    Returns:
+        dict: {metric_name: value}
+    """
+    model.evaluator.dataset = dataset
+    if metrics is None:
+        metrics = [
+            metric for metric in model.evaluator.metrics
+            if metric.get("np_fn") is not None
+        ]
+    return model.evaluator.eval_predictions(metrics, paths)
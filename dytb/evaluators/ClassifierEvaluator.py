@@ -9,16 +9,20 @@
 
 from .Evaluator import Evaluator
 from .metrics import accuracy_op, confusion_matrix_op
+from . import np_metrics
 
 
 class ClassifierEvaluator(Evaluator):
     """ClassifierEvaluator is the evaluation object for a Classifier model"""
 
+    SUPPORTS_TTA = True
+
     @property
     def metrics(self):
         """Returns a list of dict with keys:
         {
             "fn": function
+            "np_fn": NumPy implementation of fn
             "name": name
             "positive_trend_sign": sign that we like to see when things go well
             "model_selection": boolean, True if the metric has to be measured to select the model
@@ -29,6 +33,7 @@ class ClassifierEvaluator(Evaluator):
         """
         return [{
             "fn": accuracy_op,
+            "np_fn": np_metrics.accuracy,
             "name": "accuracy",
             "positive_trend_sign": +1,
             "model_selection": True,
@@ -37,6 +42,8 @@ class ClassifierEvaluator(Evaluator):
         }, {
             "fn":
             lambda logits, labels: confusion_matrix_op(logits, labels, self.dataset.num_classes),
+            "np_fn":
+            lambda logits, labels: np_metrics.confusion_matrix(logits, labels, self.dataset.num_classes),
             "name":
             "confusion_matrix",
             "positive_trend_sign":
@@ -9,6 +9,7 @@
 
 from .Evaluator import Evaluator
 from .metrics import iou_op
+from . import np_metrics
 
 
 class DetectorEvaluator(Evaluator):
@@ -19,6 +20,7 @@ class DetectorEvaluator(Evaluator):
         """Returns a list of dict with keys:
         {
             "fn": function
+            "np_fn": NumPy implementation of fn
             "name": name
             "positive_trend_sign": sign that we like to see when things go well
             "model_selection": boolean, True if the metric has to be measured to select the model
@@ -29,6 +31,7 @@ class DetectorEvaluator(Evaluator):
         """
         return [{
             "fn": iou_op,
+            "np_fn": np_metrics.iou,
             "name": "IoU",
             "positive_trend_sign": +1,
             "model_selection": True,
@@ -8,20 +8,141 @@
 """Define the interface to implement to define an evaluator"""
 
 import math
+import multiprocessing
+import os
 from abc import abstractproperty, ABCMeta
+from contextlib import contextmanager
 import numpy as np
 import tensorflow as tf
 from ..inputs.interfaces import InputType
-from ..models.utils import variables_to_restore
+from ..inputs.processing import single_pass
+from ..models.utils import variables_to_restore, legalize_name, picklable_copy
+from ..models.collections import LOSSES, REQUIRED_NON_TRAINABLES, SCALAR_SUMMARIES, MEDIA_SUMMARIES
+from .ResultsCache import ResultsCache
+from .np_metrics import Accumulator
+from . import tta as tta_views
+
+
+@contextmanager
+def _isolated_collections():
+    """Empty the collections populated by the models while building
+    a graph and restore their content on exit.
+    Useful when a model is built more than once in the same graph: the losses
+    and the summaries of the second model doesn't pollute the collections of the
+    first one and the shared variables are not added twice.
+    """
+    collections = (LOSSES, REQUIRED_NON_TRAINABLES, SCALAR_SUMMARIES,
+                   MEDIA_SUMMARIES)
+    saved = {}
+    for collection in collections:
+        collection_ref = tf.get_collection_ref(collection)
+        saved[collection] = list(collection_ref)
+        del collection_ref[:]
+    try:
+        yield
+    finally:
+        for collection in collections:
+            collection_ref = tf.get_collection_ref(collection)
+            del collection_ref[:]
+            collection_ref.extend(saved[collection])
+
+
+def _worst_value(metric):
+    """Returns the worst possible value for the metric, with respect to its
+    positive_trend_sign.
+    Args:
+        metric: an element of Evaluator.metrics
+    Returns:
+        +inf if the metric should decrease, -inf otherwise
+    """
+    sign = math.copysign(1, metric["positive_trend_sign"])
+    return float('inf') if sign < 0 else float("-inf")
+
+
+def _checkpoint_file(checkpoint_path):
+    """Returns the checkpoint file to restore.
+    Args:
+        checkpoint_path: path of a checkpoint directory or of a checkpoint file
+    Returns:
+        the latest checkpoint file if checkpoint_path is a directory,
+        checkpoint_path if it's a checkpoint file, None if no checkpoint is found
+    """
+    ckpt = tf.train.get_checkpoint_state(checkpoint_path)
+    if ckpt and ckpt.model_checkpoint_path:
+        return ckpt.model_checkpoint_path
+    if tf.gfile.Exists(checkpoint_path + '.index'):
+        return checkpoint_path
+    return None
+
+
+def _head(tensors, size):
+    """Returns the first size elements of tensors.
+    Args:
+        tensors: a tensor or a list of tensors
+        size: scalar tensor, the number of elements to keep
+    Returns:
+        the sliced tensor or the list of sliced tensors
+    """
+    if isinstance(tensors, list):
+        return [tensor[:size] for tensor in tensors]
+    return tensors[:size]
+
+
+def _reduce(metric, value_sum, steps):
+    """Reduce the sum of the values measured over steps batches.
+    Args:
+        metric: an element of Evaluator.metrics
+        value_sum: the sum of the measured values
+        steps: the number of valid (not NaN) measured values, or the number of
+               examples if the values are weighted by the batch size
+    Returns:
+        the average of the values if metric["average"], the sum otherwise
+    """
+    if not metric["average"]:
+        return value_sum
+    return value_sum / steps if steps > 0 else float('nan')
+
+
+def _stats_worker(model, dataset, cache, session_config, checkpoint_path,
+                  input_type, batch_size, augmentation_fn, exact, tta):
+    """Evaluate every metric of the model evaluator on the input_type split.
+    Executed into a worker process by Evaluator.stats.
+    Returns:
+        values: dict {metric["name"]: value}
+        hits, misses: the counters of the cache of the worker,
+                      0 if the cache is disabled
+    """
+    evaluator = model.evaluator
+    evaluator.dataset = dataset
+    evaluator.cache = cache
+    evaluator.session_config = session_config
+    values = evaluator.eval_all(
+        evaluator.metrics,
+        checkpoint_path,
+        input_type,
+        batch_size,
+        augmentation_fn,
+        exact,
+        tta=tta)
+    if cache is None:
+        return values, 0, 0
+    return values, evaluator.cache.hits, evaluator.cache.misses
 
 
 class Evaluator(object, metaclass=ABCMeta):
     """Evaluator is the class in charge of evaluate the models"""
 
+    # True if the predictions of the model don't depend on the geometry of
+    # the input (e.g. class scores): only then the predictions of the views
+    # of the test time augmentation can be reduced together
+    SUPPORTS_TTA = False
+
     def __init__(self):
         self._model = None
         self._dataset = None
         self._visualizations = []
+        self._cache = ResultsCache()
+        self._session_config = tf.ConfigProto(allow_soft_placement=True)
 
     @property
     def model(self):
@@ -49,6 +170,33 @@ class Evaluator(object, metaclass=ABCMeta):
         """
         self._dataset = dataset
 
+    @property
+    def cache(self):
+        """Returns the cache of the evaluation results. None if disabled"""
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        """Set the cache of the evaluation results
+        Args:
+            cache: ResultsCache object or None to disable the cache
+        """
+        self._cache = cache
+
+    @property
+    def session_config(self):
+        """Returns the tf.ConfigProto of the evaluation sessions"""
+        return self._session_config
+
+    @session_config.setter
+    def session_config(self, session_config):
+        """Set the configuration of the evaluation sessions
+        Args:
+            session_config: tf.ConfigProto, e.g. with gpu_options.allow_growth
+                            to share the GPU with a training process
+        """
+        self._session_config = session_config
+
     @property
     def visualizations(self):
         """Returns a list of dict with keys:
@@ -72,6 +220,8 @@ class Evaluator(object, metaclass=ABCMeta):
         """Returns a list of dict with keys:
         {
             "fn": function(predictions, targets)
+            "np_fn": optional, NumPy implementation of fn, used to measure the metric
+                     on predictions already computed (see eval_predictions)
             "name": name
             "positive_trend_sign": sign that we like to see when things go well
             "model_selection": boolean, True if the metric has to be measured to select the model
@@ -86,7 +236,9 @@ class Evaluator(object, metaclass=ABCMeta):
              checkpoint_path,
              input_type,
              batch_size,
-             augmentation_fn=None):
+             augmentation_fn=None,
+             exact=False,
+             tta=None):
         """Eval the model, restoring weight found in checkpoint_path, using the dataset.
         Args:
             metric: the metric to evaluate, a single element of self.metrics
@@ -94,47 +246,140 @@ class Evaluator(object, metaclass=ABCMeta):
             input_type: InputType enum
             batch_size: evaluate in batch of size batch_size
             augmentation_fn: if present, applies the augmentation to the input data
+            exact: if True, see eval_all
+            tta: if present, test time augmentation. See eval_all
 
         Returns:
             value: scalar value representing the evaluation of the metric on the restored model
                    on the dataset, fetching values of the specified input_type.
         """
+        values = self.eval_all(
+            [metric],
+            checkpoint_path,
+            input_type,
+            batch_size,
+            augmentation_fn,
+            exact,
+            tta=tta)
+        if values is None:
+            return None
+        return values[metric["name"]]
+
+    def eval_all(self,
+                 metrics,
+                 checkpoint_path,
+                 input_type,
+                 batch_size,
+                 augmentation_fn=None,
+                 exact=False,
+                 max_examples=None,
+                 tta=None):
+        """Eval every metric in metrics, restoring weight found in checkpoint_path,
+        using the dataset.
+        The graph is built and the checkpoint is restored once: every batch is fed
+        to the model once and every metric is computed on the same predictions.
+        Args:
+            metrics: list of metrics to evaluate, elements of self.metrics
+            checkpoint_path: path of the trained model checkpoint directory, or path
+                             of a checkpoint file
+            input_type: InputType enum
+            batch_size: evaluate in batch of size batch_size
+            augmentation_fn: if present, applies the augmentation to the input data
+            exact: if True, every example of the split is read exactly once
+                   (the input batches are not shuffled and only the first examples
+                   of the last batch are measured). The metrics are accumulated as
+                   sums weighted by the number of examples and reduced at the end:
+                   the result does not depend on the batch size.
+            max_examples: if present, evaluates only the first max_examples examples
+                          of the split. When the split is shuffled, that's a
+                          random subsample of the split. The results are not cached.
+            tta: if present, a dictionary {"views": [view, ...], "reduce": "mean" | "max"}
+                 (see dytb.evaluators.tta). Every input batch is expanded into
+                 its views, the model runs on the views as a single batch and its
+                 predictions are reduced over the views before measuring the metrics.
+                 Supported only by the evaluators with SUPPORTS_TTA (classifiers).
+
+        Returns:
+            values: dict {metric["name"]: value} where value is the evaluation of the metric
+                    on the restored model on the dataset, fetching values of the
+                    specified input_type.
+        """
         InputType.check(input_type)
+        if tta is not None:
+            self._check_tta(tta)
+
+        # Resolve the checkpoint once: the same checkpoint is restored and
+        # cached, even if a new checkpoint is saved in the meantime
+        checkpoint_file = _checkpoint_file(checkpoint_path)
+        if checkpoint_file is None:
+            print('[!] No checkpoint file found')
+            return {metric["name"]: _worst_value(metric) for metric in metrics}
 
+        if self._cache is None or max_examples is not None:
+            return self._eval_all(metrics, checkpoint_file, input_type,
+                                  batch_size, augmentation_fn, exact,
+                                  max_examples, tta)
+
+        keys = [
+            self._cache.key(self._model, self.dataset, input_type, metric,
+                            batch_size, augmentation_fn, exact, tta)
+            for metric in metrics
+        ]
+        cached = self._cache.get(checkpoint_file, keys)
+        to_measure = [
+            metric for metric, value in zip(metrics, cached) if value is None
+        ]
+
+        metric_values = {}
+        if to_measure:
+            metric_values = self._eval_all(
+                to_measure,
+                checkpoint_file,
+                input_type,
+                batch_size,
+                augmentation_fn,
+                exact,
+                tta=tta)
+            if metric_values is None:
+                return None
+            self._cache.put(checkpoint_file, [
+                key for key, value in zip(keys, cached) if value is None
+            ], [metric_values[metric["name"]] for metric in to_measure])
+
+        for metric, value in zip(metrics, cached):
+            if value is not None:
+                metric_values[metric["name"]] = value
+        return metric_values
+
+    def _eval_all(self,
+                  metrics,
+                  checkpoint_file,
+                  input_type,
+                  batch_size,
+                  augmentation_fn,
+                  exact,
+                  max_examples=None,
+                  tta=None):
+        """Eval every metric in metrics, restoring the checkpoint_file,
+        without using the cache.
+        See eval_all for arguments and return value description."""
         with tf.Graph().as_default():
-            # Get inputs and targets: inputs is an input batch
-            # target could be either an array of elements or a tensor.
-            # it could be [label] or [label, attr1, attr2, ...]
-            # or Tensor, where tensor is a standard tensorflow Tensor with
-            # its own shape
-            with tf.device('/cpu:0'):
-                inputs, *targets = self.dataset.inputs(
-                    input_type=input_type,
-                    batch_size=batch_size,
-                    augmentation_fn=augmentation_fn)
-
-            # Build a Graph that computes the predictions from the
-            # inference model.
-            # Preditions is an array of predictions with the same cardinality of
-            # targets
-            _, *predictions = self._model.get(
-                inputs,
-                self.dataset.num_classes,
-                train_phase=False,
-                l2_penalty=0.0)
+            if exact:
+                single_pass()
 
-            if len(predictions) != len(targets):
-                print(("{}.get 2nd return value and {}.inputs 2nd return "
-                       "value must have the same cardinality but got: {} vs {}"
-                      ).format(self._model.name, self.dataset.name,
-                               len(predictions), len(targets)))
+            tower = self._tower(input_type, batch_size, augmentation_fn, tta)
+            if tower is None:
                 return
+            inputs, predictions, targets = tower
 
-            if len(predictions) == 1:
-                predictions = predictions[0]
-                targets = targets[0]
+            # number of valid examples in the current batch
+            valid_ = tf.placeholder_with_default(
+                tf.shape(inputs)[0], shape=(), name="valid_")
+            if exact:
+                predictions = _head(predictions, valid_)
+                targets = _head(targets, valid_)
 
-            metric_fn = metric["fn"](predictions, targets)
+            metric_fns = [metric["fn"](predictions, targets) for metric in metrics]
 
             saver = tf.train.Saver(variables_to_restore())
             init = [
@@ -142,18 +387,12 @@ class Evaluator(object, metaclass=ABCMeta):
                     tf.global_variables() + tf.local_variables()),
                 tf.tables_initializer()
             ]
-            with tf.Session(config=tf.ConfigProto(
-                    allow_soft_placement=True)) as sess:
-                ckpt = tf.train.get_checkpoint_state(checkpoint_path)
-                if ckpt and ckpt.model_checkpoint_path:
-                    saver.restore(sess, ckpt.model_checkpoint_path)
-                else:
-                    print('[!] No checkpoint file found')
-                    sign = math.copysign(1, metric["positive_trend_sign"])
-                    return float('inf') if sign < 0 else float("-inf")
+            with tf.Session(config=self._session_config) as sess:
+                saver.restore(sess, checkpoint_file)
 
                 # Start the queue runners
                 coord = tf.train.Coordinator()
+                metric_values = None
                 try:
                     threads = []
                     for queue_runner in tf.get_collection(
@@ -163,59 +402,207 @@ class Evaluator(object, metaclass=ABCMeta):
                                 sess, coord=coord, daemon=True, start=True))
                     sess.run(init)
 
-                    num_iter = int(
-                        math.ceil(
-                            self.dataset.num_examples(input_type) / batch_size))
-                    step = 0
-                    metric_value_sum = 0.0
-                    while step < num_iter and not coord.should_stop():
-                        step += 1
-                        value = sess.run(metric_fn)
-                        # metrics can sometimes have NaN
-                        # (think about a metric that excludes a certain class and the input batch
-                        # has only element of that class into)
-                        # NaN, not being a number, are excluded from the calculation of the metric
-                        if np.any(np.isnan(value)):
-                            step -= 1
-                        else:
-                            metric_value_sum += value
-                    avg_metric_value = metric_value_sum / step if metric[
-                        "average"] else metric_value_sum
+                    metric_values = self._measure(
+                        sess,
+                        metrics,
+                        metric_fns,
+                        input_type,
+                        batch_size,
+                        coord,
+                        valid_=valid_ if exact else None,
+                        max_examples=max_examples)
                 except Exception as exc:
                     coord.request_stop(exc)
                 finally:
                     coord.request_stop()
 
                 coord.join(threads)
-            return avg_metric_value
+            return metric_values
+
+    def build_in_graph(self,
+                       metrics,
+                       visualizations,
+                       input_type,
+                       batch_size,
+                       augmentation_fn=None):
+        """Build into the current default graph an evaluation tower that shares
+        the variables of the model already defined in the graph (e.g. the model
+        under training). The evaluation can thus be executed within the session
+        that holds the variables, without saving and restoring a checkpoint.
+        This method must be called before the queue runners of the session are started.
+        Args:
+            metrics: list of metrics to evaluate, elements of self.metrics
+            visualizations: list of visualizations to evaluate, elements of
+                            self.visualizations
+            input_type: InputType enum
+            batch_size: evaluate in batch of size batch_size
+            augmentation_fn: if present, applies the augmentation to the input data
+
+        Returns:
+            metrics_fn: function(sess, max_examples=None) that returns the dict
+                        {metric["name"]: value}, evaluating the metrics on the whole
+                        input_type split or on its first max_examples examples
+            visualizations_fn: function(sess) that returns the dict {viz["name"]: image}
+                               evaluating the visualizations **for a single step**
+            None if the model and the dataset are not compatible
+        """
+        InputType.check(input_type)
+
+        with _isolated_collections():
+            with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                tower = self._tower(input_type, batch_size, augmentation_fn)
+                if tower is None:
+                    return
+                inputs, predictions, targets = tower
+
+                metric_fns = [
+                    metric["fn"](predictions, targets) for metric in metrics
+                ]
+                viz_fns = [
+                    viz["fn"](inputs, predictions, targets)
+                    for viz in visualizations
+                ]
+
+        def metrics_fn(sess, max_examples=None):
+            """Evaluate the metrics using the session sess"""
+            return self._measure(
+                sess,
+                metrics,
+                metric_fns,
+                input_type,
+                batch_size,
+                max_examples=max_examples)
+
+        def visualizations_fn(sess):
+            """Evaluate the visualizations using the session sess"""
+            return {
+                viz["name"]: value
+                for viz, value in zip(visualizations, sess.run(viz_fns))
+            }
+
+        return metrics_fn, visualizations_fn
+
+    def build_streaming(self, metrics, predictions, targets):
+        """Build into the current default graph the streaming version of metrics:
+        the metrics are measured on predictions and targets already defined into the
+        graph (e.g. the ones of the model under training) and their values are
+        accumulated into local variables, batch after batch.
+        Args:
+            metrics: list of metrics to evaluate, elements of self.metrics.
+                     The metric ops must have a fully defined shape
+            predictions: the predictions of the model
+            targets: the targets of the predictions
+        Returns:
+            values: dict {metric["name"]: tensor}, the metrics reduced over the
+                    accumulated batches
+            update_op: the op that measures the metrics on the current batch and
+                       accumulates the values
+            reset_op: the op that resets the accumulators
+        """
+        batch_size = tf.cast(
+            tf.shape(targets[0] if isinstance(targets, list) else targets)[0],
+            tf.float32)
+
+        values = {}
+        update_ops = []
+        accumulators = []
+        with _isolated_collections():
+            with tf.variable_scope("streaming_metrics"):
+                for metric in metrics:
+                    value = tf.cast(metric["fn"](predictions, targets),
+                                    tf.float32)
+                    value_sum = tf.Variable(
+                        tf.zeros(value.shape),
+                        trainable=False,
+                        collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                        name=legalize_name(metric["name"]) + "_sum")
+                    count = tf.Variable(
+                        0.,
+                        trainable=False,
+                        collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                        name=legalize_name(metric["name"]) + "_count")
+                    accumulators.extend([value_sum, count])
+
+                    # NaN values are excluded from the calculation of the metric
+                    is_valid = tf.logical_not(
+                        tf.reduce_any(tf.is_nan(value)))
+                    weight = batch_size if metric["average"] else 1.
+                    update_ops.append(
+                        value_sum.assign_add(
+                            tf.cond(is_valid, lambda: value * weight,
+                                    lambda: tf.zeros_like(value))))
+                    update_ops.append(
+                        count.assign_add(tf.cast(is_valid, tf.float32) * weight))
+
+                    if metric["average"]:
+                        values[metric["name"]] = value_sum / tf.maximum(
+                            count, 1.)
+                    else:
+                        values[metric["name"]] = value_sum
 
-    def stats(self, checkpoint_path, batch_size, augmentation_fn=None):
-        """Run the eval method on the model, see eval for arguments
+        return values, tf.group(*update_ops), tf.variables_initializer(
+            accumulators)
+
+    def stats(self,
+              checkpoint_path,
+              batch_size,
+              augmentation_fn=None,
+              exact=False,
+              max_workers=1,
+              tta=None):
+        """Run the eval_all method on the model, see eval_all for arguments
         and return value description.
         Moreover, adds informations about the model and returns the whole information
         in a dictionary.
+        Args:
+            max_workers: if greater than 1, every split is evaluated in its own
+                         worker process, with its own graph and session.
+                         A split is never shared by workers: at most 3
+                         processes (train, validation and test) are used.
+                         augmentation_fn must be picklable and the device placement
+                         of the caller is not inherited by the workers.
+                         The views of tta must be picklable too.
         Returns:
             dict
         """
+        input_types = (InputType.train, InputType.validation, InputType.test)
+        if tta is not None:
+            self._check_tta(tta)
+        if max_workers <= 1:
+            return {
+                str(input_type): self.eval_all(
+                    self.metrics,
+                    checkpoint_path,
+                    input_type,
+                    batch_size,
+                    augmentation_fn,
+                    exact,
+                    tta=tta)
+                for input_type in input_types
+            }
+
+        model = picklable_copy(self._model)
+
+        # spawn: tensorflow does not support forking a process that already
+        # initialized its runtime
+        with multiprocessing.get_context("spawn").Pool(
+                processes=min(max_workers, len(input_types))) as pool:
+            results = pool.starmap(_stats_worker, [
+                (model, self.dataset, self._cache, self._session_config,
+                 checkpoint_path, input_type, batch_size, augmentation_fn,
+                 exact, tta)
+                for input_type in input_types
+            ])
+
+        # every worker counted the hits and misses of its copy of the cache
+        if self._cache is not None:
+            hits, misses = self._cache.hits, self._cache.misses
+            for _, worker_hits, worker_misses in results:
+                self._cache.add_counters(worker_hits - hits,
+                                         worker_misses - misses)
         return {
-            "train": {
-                metric["name"]:
-                self.eval(metric, checkpoint_path, InputType.train, batch_size,
-                          augmentation_fn)
-                for metric in self.metrics
-            },
-            "validation": {
-                metric["name"]:
-                self.eval(metric, checkpoint_path, InputType.validation,
-                          batch_size, augmentation_fn)
-                for metric in self.metrics
-            },
-            "test": {
-                metric["name"]:
-                self.eval(metric, checkpoint_path, InputType.test, batch_size,
-                          augmentation_fn)
-                for metric in self.metrics
-            },
+            str(input_type): values
+            for input_type, (values, _, _) in zip(input_types, results)
         }
 
     def visualize(self,
@@ -239,37 +626,10 @@ class Evaluator(object, metaclass=ABCMeta):
         InputType.check(input_type)
 
         with tf.Graph().as_default():
-            # Get inputs and targets: inputs is an input batch
-            # target could be either an array of elements or a tensor.
-            # it could be [label] or [label, attr1, attr2, ...]
-            # or Tensor, where tensor is a standard tensorflow Tensor with
-            # its own shape
-            with tf.device('/cpu:0'):
-                inputs, *targets = self.dataset.inputs(
-                    input_type=input_type,
-                    batch_size=batch_size,
-                    augmentation_fn=augmentation_fn)
-
-            # Build a Graph that computes the predictions from the
-            # inference model.
-            # Preditions is an array of predictions with the same cardinality of
-            # targets
-            _, *predictions = self._model.get(
-                inputs,
-                self.dataset.num_classes,
-                train_phase=False,
-                l2_penalty=0.0)
-
-            if len(predictions) != len(targets):
-                print(("{}.get 2nd return value and {}.inputs 2nd return "
-                       "value must have the same cardinality but got: {} vs {}"
-                      ).format(self._model.name, self.dataset.name,
-                               len(predictions), len(targets)))
+            tower = self._tower(input_type, batch_size, augmentation_fn)
+            if tower is None:
                 return
-
-            if len(predictions) == 1:
-                predictions = predictions[0]
-                targets = targets[0]
+            inputs, predictions, targets = tower
 
             saver = tf.train.Saver(variables_to_restore())
 
@@ -279,8 +639,7 @@ class Evaluator(object, metaclass=ABCMeta):
                     tf.global_variables() + tf.local_variables()),
                 tf.tables_initializer()
             ]
-            with tf.Session(config=tf.ConfigProto(
-                    allow_soft_placement=True)) as sess:
+            with tf.Session(config=self._session_config) as sess:
                 ckpt = tf.train.get_checkpoint_state(checkpoint_path)
                 if ckpt and ckpt.model_checkpoint_path:
                     saver.restore(sess, ckpt.model_checkpoint_path)
@@ -308,6 +667,132 @@ class Evaluator(object, metaclass=ABCMeta):
                 coord.join(threads)
         return None
 
+    def _check_tta(self, tta):
+        """Check if tta is a valid tta dictionary for the evaluated model.
+        Raises:
+            ValueError if tta is not valid
+        """
+        if not self.SUPPORTS_TTA:
+            raise ValueError(
+                "{} does not support test time augmentation: the predictions "
+                "of the views can't be reduced together".format(
+                    self.__class__.__name__))
+        tta_views.check(tta)
+
+    def _tower(self, input_type, batch_size, augmentation_fn=None, tta=None):
+        """Build, into the current default graph, the input pipeline and the
+        inference graph of the model in evaluation mode (train_phase=False).
+        Args:
+            input_type: InputType enum
+            batch_size: evaluate in batch of size batch_size
+            augmentation_fn: if present, applies the augmentation to the input data
+            tta: if present, the test time augmentation dictionary. See eval_all
+        Returns:
+            inputs, predictions, targets. None if the model and the dataset are not
+            compatible.
+        """
+        # Get inputs and targets: inputs is an input batch
+        # target could be either an array of elements or a tensor.
+        # it could be [label] or [label, attr1, attr2, ...]
+        # or Tensor, where tensor is a standard tensorflow Tensor with
+        # its own shape
+        with tf.device('/cpu:0'):
+            inputs, *targets = self.dataset.inputs(
+                input_type=input_type,
+                batch_size=batch_size,
+                augmentation_fn=augmentation_fn)
+
+        # Build a Graph that computes the predictions from the
+        # inference model.
+        # Preditions is an array of predictions with the same cardinality of
+        # targets
+        def model_fn(inputs):
+            """Returns the predictions of the model on inputs"""
+            _, *predictions = self._model.get(
+                inputs,
+                self.dataset.num_classes,
+                train_phase=False,
+                l2_penalty=0.0)
+            return predictions
+
+        if tta is None:
+            predictions = model_fn(inputs)
+        else:
+            predictions = tta_views.apply(model_fn, inputs, tta)
+
+        if len(predictions) != len(targets):
+            print(("{}.get 2nd return value and {}.inputs 2nd return "
+                   "value must have the same cardinality but got: {} vs {}"
+                  ).format(self._model.name, self.dataset.name,
+                           len(predictions), len(targets)))
+            return None
+
+        if len(predictions) == 1:
+            predictions = predictions[0]
+            targets = targets[0]
+
+        return inputs, predictions, targets
+
+    def _measure(self,
+                 sess,
+                 metrics,
+                 metric_fns,
+                 input_type,
+                 batch_size,
+                 coord=None,
+                 valid_=None,
+                 max_examples=None):
+        """Run the metric_fns ops, one step per batch, until the whole input_type
+        split (or its first max_examples examples) has been evaluated.
+        Args:
+            sess: the session to use
+            metrics: list of metrics, elements of self.metrics
+            metric_fns: the ops of metrics, with the same order
+            input_type: InputType enum
+            batch_size: the batch size of the input ops
+            coord: optional tf.train.Coordinator to use to stop the loop
+            valid_: optional placeholder of the number of valid examples in the batch.
+                    If present the metric_fns are measured only on the valid examples
+                    and the averaged metrics are weighted by the number of valid examples.
+            max_examples: optional, the maximum number of examples to evaluate
+        Returns:
+            values: dict {metric["name"]: value}
+        """
+        num_examples = self.dataset.num_examples(input_type)
+        if max_examples is not None:
+            num_examples = min(num_examples, max_examples)
+        num_iter = int(math.ceil(num_examples / batch_size))
+        step = 0
+        metric_value_sums = [0.0] * len(metrics)
+        metric_steps = [0] * len(metrics)
+        while step < num_iter and (coord is None or not coord.should_stop()):
+            step += 1
+            if valid_ is None:
+                weight = 1
+                values = sess.run(metric_fns)
+            else:
+                # the last batch contains examples of the next epoch: skip them
+                weight = min(batch_size, num_examples - (step - 1) * batch_size)
+                values = sess.run(metric_fns, feed_dict={valid_: weight})
+            for idx, value in enumerate(values):
+                # metrics can sometimes have NaN
+                # (think about a metric that excludes a certain class and the input
+                # batch has only element of that class into)
+                # NaN, not being a number, are excluded from the calculation of the
+                # metric
+                if not np.any(np.isnan(value)):
+                    if metrics[idx]["average"]:
+                        metric_value_sums[idx] += value * weight
+                        metric_steps[idx] += weight
+                    else:
+                        metric_value_sums[idx] += value
+                        metric_steps[idx] += 1
+        return {
+            metric["name"]: _reduce(metric, metric_value_sums[idx],
+                                    metric_steps[idx])
+            for idx, metric in enumerate(metrics)
+        }
+
     def extract_features(self,
                          checkpoint_path,
                          inputs,
@@ -329,8 +814,7 @@ class Evaluator(object, metaclass=ABCMeta):
 
         # Evaluate the inputs in the current default graph
         # then user a placeholder to inject the computed values into the new graph
-        with tf.Session(config=tf.ConfigProto(
-                allow_soft_placement=True)) as sess:
+        with tf.Session(config=self._session_config) as sess:
             evaluated_inputs = sess.run(inputs)
 
         # Create a new graph to not making dirty the default graph after subsequent
@@ -352,8 +836,7 @@ class Evaluator(object, metaclass=ABCMeta):
                 tf.tables_initializer()
             ]
             features = np.zeros(layer.shape)
-            with tf.Session(config=tf.ConfigProto(
-                    allow_soft_placement=True)) as sess:
+            with tf.Session(config=self._session_config) as sess:
                 ckpt = tf.train.get_checkpoint_state(checkpoint_path)
                 if ckpt and ckpt.model_checkpoint_path:
                     # Restores from checkpoint
@@ -368,3 +851,205 @@ class Evaluator(object, metaclass=ABCMeta):
                     })
 
             return features
+
+    def extract_dataset_features(self, checkpoint_path, input_type,
+                                 layer_names, output_dir, batch_size):
+        """Restore model parameters from checkpoint_path, once. Stream every example
+        of the input_type split through the model and save the values extracted by the
+        layers named `layer_names`, together with the targets, into .npy files.
+        The files are memory mapped and filled batch by batch: the memory usage
+        does not depend on the size of the dataset.
+        Args:
+            checkpoint_path: path of the trained model checkpoint directory
+            input_type: InputType enum
+            layer_names: list of strings, the names of the layers to extract from model
+            output_dir: the directory where to save the .npy files
+            batch_size: extract the features in batch of size batch_size
+        Returns:
+            paths: dict {name: path} of the created .npy files, where name is an
+                   element of layer_names or "labels" ("labels_<idx>" if the
+                   dataset returns more than one target)
+        """
+        return self._dump(checkpoint_path, input_type, output_dir, batch_size,
+                          layer_names)
+
+    def dump_predictions(self, checkpoint_path, input_type, output_dir,
+                         batch_size):
+        """Restore model parameters from checkpoint_path, once. Stream every example
+        of the input_type split through the model and save the predictions,
+        together with the targets, into memory mapped .npy files.
+        The metrics can then be measured offline, using eval_predictions.
+        Args:
+            checkpoint_path: path of the trained model checkpoint directory
+            input_type: InputType enum
+            output_dir: the directory where to save the .npy files
+            batch_size: run the model in batch of size batch_size
+        Returns:
+            paths: dict {name: path} of the created .npy files, where name is
+                   "predictions" or "labels" ("predictions_<idx>" and "labels_<idx>"
+                   if the model returns more than one prediction)
+        """
+        return self._dump(checkpoint_path, input_type, output_dir, batch_size,
+                          [], with_predictions=True)
+
+    def eval_predictions(self, metrics, paths, chunk_size=10000):
+        """Measure the metrics on the predictions saved by dump_predictions,
+        without running the model. The files are read chunk by chunk.
+        Args:
+            metrics: list of metrics to evaluate, elements of self.metrics.
+                     Every metric must have the "np_fn" key.
+            paths: dict {name: path}, the return value of dump_predictions
+            chunk_size: number of examples read from disk at a time.
+                        The NaN values are excluded chunk by chunk, like the
+                        in-graph evaluation excludes them batch by batch: use
+                        the evaluation batch size to get the same values
+        Returns:
+            dict: {metric_name: value}
+        Raises:
+            ValueError if a metric has no NumPy implementation
+        """
+        for metric in metrics:
+            if metric.get("np_fn") is None:
+                raise ValueError("Metric {} has no NumPy implementation".format(
+                    metric["name"]))
+
+        def _load(prefix):
+            if prefix in paths:
+                return [np.load(paths[prefix], mmap_mode='r')]
+            return [
+                np.load(paths["{}_{}".format(prefix, idx)], mmap_mode='r')
+                for idx in range(
+                    len([name for name in paths if name.startswith(prefix)]))
+            ]
+
+        predictions = _load("predictions")
+        targets = _load("labels")
+        if len(predictions) != len(targets):
+            raise ValueError(
+                "predictions and labels must have the same cardinality but got: {} vs {}".
+                format(len(predictions), len(targets)))
+
+        accumulators = [
+            Accumulator(metric["np_fn"], metric["average"])
+            for metric in metrics
+        ]
+        num_examples = len(targets[0])
+        for offset in range(0, num_examples, chunk_size):
+            predictions_chunk = [
+                np.asarray(array[offset:offset + chunk_size])
+                for array in predictions
+            ]
+            targets_chunk = [
+                np.asarray(array[offset:offset + chunk_size])
+                for array in targets
+            ]
+            if len(predictions_chunk) == 1:
+                predictions_chunk = predictions_chunk[0]
+                targets_chunk = targets_chunk[0]
+            for accumulator in accumulators:
+                accumulator.update(predictions_chunk, targets_chunk)
+
+        return {
+            metric["name"]: accumulator.value
+            for metric, accumulator in zip(metrics, accumulators)
+        }
+
+    def _dump(self,
+              checkpoint_path,
+              input_type,
+              output_dir,
+              batch_size,
+              layer_names,
+              with_predictions=False):
+        """Stream every example of the input_type split through the model restored
+        from checkpoint_path and save the values of the layers named layer_names,
+        the targets and (if with_predictions) the predictions into .npy files.
+        See extract_dataset_features and dump_predictions."""
+        InputType.check(input_type)
+
+        with tf.Graph().as_default() as graph:
+            # read every example exactly once
+            single_pass()
+            tower = self._tower(input_type, batch_size)
+            if tower is None:
+                return
+            _, predictions, targets = tower
+            if not isinstance(targets, list):
+                predictions = [predictions]
+                targets = [targets]
+
+            def _names(prefix, tensors):
+                if len(tensors) == 1:
+                    return [prefix]
+                return [
+                    "{}_{}".format(prefix, idx) for idx in range(len(tensors))
+                ]
+
+            # This will raise an exception if a layer name is not found
+            layers = [graph.get_tensor_by_name(name) for name in layer_names]
+            names = list(layer_names)
+            if with_predictions:
+                layers += predictions
+                names += _names("predictions", predictions)
+            layers += targets
+            names += _names("labels", targets)
+
+            saver = tf.train.Saver(variables_to_restore())
+            init = [
+                tf.variables_initializer(
+                    tf.global_variables() + tf.local_variables()),
+                tf.tables_initializer()
+            ]
+            with tf.Session(config=self._session_config) as sess:
+                checkpoint_file = _checkpoint_file(checkpoint_path)
+                if checkpoint_file is None:
+                    print('[!] No checkpoint file found')
+                    return None
+                saver.restore(sess, checkpoint_file)
+
+                if not tf.gfile.Exists(output_dir):
+                    tf.gfile.MakeDirs(output_dir)
+                paths = {
+                    name: os.path.join(output_dir, "{}.npy".format(
+                        legalize_name(name).replace("/", "_")))
+                    for name in names
+                }
+
+                # Start the queue runners
+                coord = tf.train.Coordinator()
+                try:
+                    threads = []
+                    for queue_runner in tf.get_collection(
+                            tf.GraphKeys.QUEUE_RUNNERS):
+                        threads.extend(
+                            queue_runner.create_threads(
+                                sess, coord=coord, daemon=True, start=True))
+                    sess.run(init)
+
+                    num_examples = self.dataset.num_examples(input_type)
+                    arrays = {}
+                    offset = 0
+                    while offset < num_examples and not coord.should_stop():
+                        values = sess.run(layers)
+                        # the last batch contains examples of the next epoch
+                        valid = min(batch_size, num_examples - offset)
+                        for name, value in zip(names, values):
+                            if name not in arrays:
+                                arrays[name] = np.lib.format.open_memmap(
+                                    paths[name],
+                                    mode='w+',
+                                    dtype=value.dtype,
+                                    shape=(num_examples, ) + value.shape[1:])
+                            arrays[name][offset:offset + valid] = value[:valid]
+                        offset += valid
+
+                    for array in arrays.values():
+                        array.flush()
+                    del arrays
+                except Exception as exc:
+                    coord.request_stop(exc)
+                finally:
+                    coord.request_stop()
+
+                coord.join(threads)
+            return paths
@@ -0,0 +1,287 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Persistent cache of the evaluation results"""
+
+import fcntl
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from enum import Enum
+import numpy as np
+import tensorflow as tf
+
+
+class ResultsCache(object):
+    """ResultsCache stores on disk the values of the metrics measured on a checkpoint.
+    The results are saved in a json file, placed into the checkpoint directory.
+    Every file holds the results of a single checkpoint of its directory:
+    when a different checkpoint (different path, global step or content) is
+    cached, the cached results are invalidated."""
+
+    FILENAME = 'evaluations.json'
+
+    def __init__(self):
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        """Returns the number of values found in cache"""
+        return self._hits
+
+    @property
+    def misses(self):
+        """Returns the number of values not found in cache"""
+        return self._misses
+
+    def add_counters(self, hits, misses):
+        """Add the hits and the misses counted by a copy of the cache
+        used by another process"""
+        self._hits += hits
+        self._misses += misses
+
+    @staticmethod
+    def _describe(value):
+        """Returns the string that identifies value: numbers, strings, enums,
+        functions and containers or objects made of them.
+        Returns None if value can't be identified (e.g. a lambda)"""
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return repr(value)
+        if isinstance(value, Enum):
+            return str(value)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            items = [ResultsCache._describe(item) for item in value]
+            if None in items:
+                return None
+            if isinstance(value, (set, frozenset)):
+                items = sorted(items)
+            return "[{}]".format(",".join(items))
+        if isinstance(value, dict):
+            items = [(ResultsCache._describe(key),
+                      ResultsCache._describe(item))
+                     for key, item in value.items()]
+            if None in [part for item in items for part in item]:
+                return None
+            return "{{{}}}".format(",".join(
+                "{}:{}".format(key, item) for key, item in sorted(items)))
+        if inspect.isfunction(value):
+            return ResultsCache._function_name(value)
+        if hasattr(value, "__dict__"):
+            attributes = ResultsCache._describe(vars(value))
+            if attributes is None:
+                return None
+            return "{}.{}{}".format(
+                type(value).__module__, type(value).__qualname__, attributes)
+        return None
+
+    @staticmethod
+    def _function_name(function):
+        """Returns the qualified name of function, followed by the values of the
+        variables of its closure (e.g. the parameters of random_crop(padding)).
+        None if function is a lambda or its closure can't be identified"""
+        name = getattr(function, "__qualname__", "<lambda>")
+        if "<lambda>" in name:
+            return None
+        name = "{}.{}".format(function.__module__, name)
+        closure = getattr(function, "__closure__", None)
+        if not closure:
+            return name
+
+        parameters = []
+        for variable, cell in zip(function.__code__.co_freevars, closure):
+            try:
+                value = ResultsCache._describe(cell.cell_contents)
+            except ValueError:
+                # empty cell
+                return None
+            if value is None:
+                return None
+            parameters.append("{}={}".format(variable, value))
+        return "{}({})".format(name, ",".join(parameters))
+
+    @staticmethod
+    def _dataset_name(dataset):
+        """Returns the name of the dataset followed by the hash of its
+        configuration (e.g. the shape and the seed of a Synthetic input).
+        None if the configuration can't be identified"""
+        config = ResultsCache._describe(vars(dataset))
+        if config is None:
+            return None
+        return "{}#{}".format(dataset.name,
+                              hashlib.sha1(config.encode()).hexdigest()[:12])
+
+    @staticmethod
+    def key(model,
+            dataset,
+            input_type,
+            metric,
+            batch_size,
+            augmentation_fn,
+            exact,
+            tta=None):
+        """Build the key that identifies an evaluation of a checkpoint.
+        Args:
+            model: implementation of the Model interface
+            dataset: implementation of the Input interface
+            input_type: InputType enum
+            metric: element of the evaluator metrics
+            batch_size: the batch size used to evaluate
+            augmentation_fn: the augmentation applied to the input data
+            exact: boolean, the exact evaluation flag
+            tta: the test time augmentation dictionary
+        Returns:
+            key: string, or None if the evaluation can't be cached (the
+                 augmentation function, a view or the configuration of the
+                 dataset can't be identified)
+        """
+        functions = [augmentation_fn] if augmentation_fn is not None else []
+        if tta is not None:
+            functions += tta["views"]
+        names = [ResultsCache._function_name(fn) for fn in functions]
+        dataset_name = ResultsCache._dataset_name(dataset)
+        if None in names or dataset_name is None:
+            return None
+
+        augmentation = names[0] if augmentation_fn is not None else "identity"
+        key = "{}/{}/{}/{}/batch_size={}/augmentation={}/exact={}".format(
+            model.name, dataset_name, input_type, metric["name"], batch_size,
+            augmentation, exact)
+        if tta is not None:
+            views = names[1:] if augmentation_fn is not None else names
+            key += "/tta={}:{}".format(
+                tta.get("reduce", "mean"), ",".join(views))
+        return key
+
+    @staticmethod
+    def checkpoint_identity(checkpoint_file):
+        """Returns the identity of the checkpoint.
+        Args:
+            checkpoint_file: path of the checkpoint file
+        Returns:
+            identity: dict {"path", "global_step", "hash"} or None if the
+                      checkpoint does not exist.
+                      The hash is the sha1 of the checkpoint index, that contains
+                      the checksums of every saved tensor.
+        """
+        path = checkpoint_file
+        step = path.split('-')[-1]
+        index = path + '.index'
+        if not tf.gfile.Exists(index):
+            # V1 checkpoint format: a single file
+            index = path
+        if not tf.gfile.Exists(index):
+            return None
+        sha1 = hashlib.sha1()
+        with tf.gfile.GFile(index, 'rb') as index_file:
+            sha1.update(index_file.read())
+
+        return {
+            "path": path,
+            "global_step": int(step) if step.isdigit() else None,
+            "hash": sha1.hexdigest()
+        }
+
+    def _filename(self, checkpoint_file):
+        """Returns the path of the cache file of checkpoint_file"""
+        return os.path.join(os.path.dirname(checkpoint_file), self.FILENAME)
+
+    @contextmanager
+    def _lock(self, checkpoint_file):
+        """Hold the exclusive lock of the cache file of checkpoint_file:
+        the processes that update the same cache file do it one at a time"""
+        with open(self._filename(checkpoint_file) + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self, checkpoint_file):
+        """Returns the content of the cache file of checkpoint_file"""
+        filename = self._filename(checkpoint_file)
+        if not tf.gfile.Exists(filename):
+            return {"checkpoint": None, "results": {}}
+        with tf.gfile.GFile(filename, 'r') as cache_file:
+            try:
+                return json.loads(cache_file.read())
+            except ValueError:
+                return {"checkpoint": None, "results": {}}
+
+    def get(self, checkpoint_file, keys):
+        """Search keys in the cache of checkpoint_file.
+        Args:
+            checkpoint_file: path of the checkpoint file
+            keys: list of keys, built with key()
+        Returns:
+            values: list of values with the same order of keys. A None element
+                    means a cache miss
+        """
+        identity = self.checkpoint_identity(checkpoint_file)
+        cache = self._load(checkpoint_file) if identity else {}
+        results = cache.get("results", {}) if cache.get(
+            "checkpoint") == identity else {}
+
+        values = []
+        for key in keys:
+            if key is not None and key in results:
+                self._hits += 1
+                value = results[key]
+                values.append(
+                    np.array(value) if isinstance(value, list) else value)
+            else:
+                self._misses += 1
+                values.append(None)
+        return values
+
+    def put(self, checkpoint_file, keys, values):
+        """Save the values of keys in the cache of checkpoint_file.
+        If the cache refers to a different checkpoint, it's invalidated.
+        Args:
+            checkpoint_file: path of the checkpoint file
+            keys: list of keys, built with key()
+            values: the values to save, with the same order of keys
+        """
+        identity = self.checkpoint_identity(checkpoint_file)
+        if identity is None:
+            return
+
+        filename = self._filename(checkpoint_file)
+        try:
+            # read, merge and replace the file holding the lock: concurrent
+            # writers (parallel workers, the watcher) don't lose their results
+            with self._lock(checkpoint_file):
+                cache = self._load(checkpoint_file)
+                if cache.get("checkpoint") != identity:
+                    cache = {"checkpoint": identity, "results": {}}
+
+                for key, value in zip(keys, values):
+                    if key is not None:
+                        cache["results"][key] = np.asarray(value).tolist()
+
+                descriptor, tmp = tempfile.mkstemp(
+                    dir=os.path.dirname(filename), prefix=self.FILENAME + '.')
+                with os.fdopen(descriptor, 'w') as cache_file:
+                    cache_file.write(
+                        json.dumps(cache, indent=2, sort_keys=True))
+                os.rename(tmp, filename)
+        except (OSError, tf.errors.OpError) as exc:
+            print('[!] Unable to write the evaluation cache {}: {}'.format(
+                filename, exc))
+
+    def invalidate(self, checkpoint_file):
+        """Remove the cached results of the directory of checkpoint_file.
+        Args:
+            checkpoint_file: path of the checkpoint file
+        """
+        filename = self._filename(checkpoint_file)
+        with self._lock(checkpoint_file):
+            if tf.gfile.Exists(filename):
+                tf.gfile.Remove(filename)
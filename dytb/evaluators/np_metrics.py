@@ -0,0 +1,162 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""NumPy implementation of the metrics defined in metrics.py.
+The metrics work on the predictions already computed (e.g. dumped on disk by
+Evaluator.dump_predictions) and do not require TensorFlow."""
+
+import numpy as np
+
+
+def _squeeze_logits(logits):
+    """Handle fully convolutional classifiers: [batch_size, 1, 1, num_classes]
+    logits become [batch_size, num_classes] logits"""
+    logits = np.asarray(logits)
+    if logits.ndim == 4 and logits.shape[1:3] == (1, 1):
+        return logits.reshape(logits.shape[0], logits.shape[3])
+    return logits
+
+
+def top_k(logits, k):
+    """Returns the indices of the k largest logits of every row, in
+    descending order of logit.
+    Args:
+        logits: a [batch_size, 1,1, num_classes] array or
+                a [batch_size, num_classes] array
+        k: number of indices to extract
+    Returns:
+        indices: a [batch_size, k] array
+    """
+    logits = _squeeze_logits(logits)
+    # select the k largest (unordered) in linear time, then sort only them
+    indices = np.argpartition(-logits, k - 1, axis=1)[:, :k]
+    rows = np.arange(logits.shape[0])[:, None]
+    order = np.argsort(-logits[rows, indices], axis=1, kind='mergesort')
+    return indices[rows, order]
+
+
+def in_top_k(logits, labels, k):
+    """Same of tf.nn.in_top_k: True if the logit of the label is among the k
+    largest logits of its row. Ties are considered in the top k.
+    Args:
+        logits: a [batch_size, 1,1, num_classes] array or
+                a [batch_size, num_classes] array
+        labels: a [batch_size] array
+        k: number of top elements to look at
+    Returns:
+        in_top_k: a [batch_size] boolean array
+    """
+    logits = _squeeze_logits(logits)
+    labels = np.asarray(labels)
+    label_logits = logits[np.arange(logits.shape[0]), labels]
+    return np.sum(logits > label_logits[:, None], axis=1) < k
+
+
+def accuracy(logits, labels, k=1):
+    """Accuracy between predictions (logits) and labels.
+    Args:
+        logits: a [batch_size, 1,1, num_classes] array or
+                a [batch_size, num_classes] array
+        labels: a [batch_size] array
+        k: the label is correctly predicted if is in the top-k logits
+    Returns:
+        accuracy: float
+    """
+    return float(np.mean(in_top_k(logits, labels, k)))
+
+
+def confusion_matrix(logits, labels, num_classes):
+    """Confusion matrix between the predictions and the labels.
+    Rows are the labels, columns the predicted labels (top-1).
+    Args:
+        logits: a [batch_size, 1,1, num_classes] array or
+                a [batch_size, num_classes] array
+        labels: a [batch_size] array
+        num_classes: number of classes
+    Returns:
+        confusion_matrix: a [num_classes, num_classes] int32 array
+    """
+    predicted_labels = np.argmax(_squeeze_logits(logits), axis=1)
+    labels = np.asarray(labels, dtype=np.int64)
+    return np.bincount(
+        labels * num_classes + predicted_labels,
+        minlength=num_classes * num_classes).reshape(
+            num_classes, num_classes).astype(np.int32)
+
+
+def iou(real_coordinates, coordinates):
+    """Average intersection over union between a batch of real_coordinates
+    and a batch of coordinates.
+    Args:
+        real_coordinates: array with shape [batch_size, 4] (ymin, xmin, ymax, xmax).
+                          Additional columns (e.g. the label) are ignored
+        coordinates: array with shape [batch_size, 4] (ymin, xmin, ymax, xmax).
+                     Additional columns (e.g. the label) are ignored
+    Returns:
+        iou: average intersection over union in the batch
+    """
+    real_coordinates = np.asarray(real_coordinates, dtype=np.float64)[:, :4]
+    coordinates = np.asarray(coordinates, dtype=np.float64)[:, :4]
+    area_orig = (real_coordinates[:, 2] - real_coordinates[:, 0]) * (
+        real_coordinates[:, 3] - real_coordinates[:, 1])
+    area_pred = (coordinates[:, 2] - coordinates[:, 0]) * (
+        coordinates[:, 3] - coordinates[:, 1])
+
+    intersection_min = np.maximum(coordinates[:, :2], real_coordinates[:, :2])
+    intersection_max = np.minimum(coordinates[:, 2:], real_coordinates[:, 2:])
+    intersection_area = np.prod(
+        np.maximum(intersection_max - intersection_min, 0), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(
+            np.mean(intersection_area /
+                    (area_orig + area_pred - intersection_area)))
+
+
+class Accumulator(object):
+    """Accumulator measures a metric incrementally, batch by batch.
+    The averaged metrics are weighted by the number of examples in the batch:
+    the accumulated value is the same of the metric measured on every example
+    at once. Like the in-graph evaluation, the NaN values of a batch are
+    excluded from the calculation of the metric."""
+
+    def __init__(self, np_fn, average):
+        """Initialize the accumulator.
+        Args:
+            np_fn: function(predictions, targets) that computes the metric
+            average: boolean, true if the metric is an average over the examples.
+                     If false the values of the batches are added
+        """
+        self._np_fn = np_fn
+        self._average = average
+        self._sum = 0.
+        self._count = 0
+
+    def update(self, predictions, targets):
+        """Measure the metric on a batch and accumulate its value.
+        Args:
+            predictions: array (or list of arrays) of predictions
+            targets: array (or list of arrays) of targets
+        """
+        value = np.asarray(self._np_fn(predictions, targets))
+        if np.any(np.isnan(value)):
+            return
+        batch_size = len(targets[0] if isinstance(targets, list) else targets)
+        if self._average:
+            self._sum = self._sum + value * batch_size
+        else:
+            self._sum = self._sum + value
+        self._count += batch_size
+
+    @property
+    def value(self):
+        """Returns the value of the metric on the examples seen so far"""
+        if not self._average:
+            return self._sum
+        if self._count == 0:
+            return float('nan')
+        return self._sum / self._count
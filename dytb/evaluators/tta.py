@@ -0,0 +1,123 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Test time augmentation: views of a batch of images.
+A view is a function that transforms a [batch_size, height, width, depth]
+batch into a batch with the same shape.
+A tta dictionary {"views": [view, ...], "reduce": "mean" | "max"} tells the
+evaluator to run the model on every view of the batch, at once, and to reduce
+the predictions of the views."""
+
+import tensorflow as tf
+
+# fraction of the image side kept by the crop views
+CROP_FRACTION = 0.875
+
+REDUCTIONS = {"mean": tf.reduce_mean, "max": tf.reduce_max}
+
+
+def identity(images):
+    """The original batch"""
+    return images
+
+
+def flip_left_right(images):
+    """Flip horizontally every image of the batch"""
+    return tf.reverse(images, [2])
+
+
+def flip_up_down(images):
+    """Flip vertically every image of the batch"""
+    return tf.reverse(images, [1])
+
+
+def _crop(images, ymin, xmin):
+    """Crop the CROP_FRACTION of every image of the batch, starting from
+    the normalized coordinates (ymin, xmin), and resize the crops to the
+    original size"""
+    shape = tf.shape(images)
+    batch_size = shape[0]
+    box = tf.constant([ymin, xmin, ymin + CROP_FRACTION, xmin + CROP_FRACTION])
+    boxes = tf.tile(tf.expand_dims(box, 0), [batch_size, 1])
+    crops = tf.image.crop_and_resize(
+        tf.cast(images, tf.float32), boxes, tf.range(batch_size),
+        shape[1:3])
+    crops.set_shape(images.shape)
+    return tf.cast(crops, images.dtype)
+
+
+def central_crop(images):
+    """Central crop of every image of the batch"""
+    return _crop(images, (1 - CROP_FRACTION) / 2, (1 - CROP_FRACTION) / 2)
+
+
+def top_left_crop(images):
+    """Top left crop of every image of the batch"""
+    return _crop(images, 0., 0.)
+
+
+def top_right_crop(images):
+    """Top right crop of every image of the batch"""
+    return _crop(images, 0., 1 - CROP_FRACTION)
+
+
+def bottom_left_crop(images):
+    """Bottom left crop of every image of the batch"""
+    return _crop(images, 1 - CROP_FRACTION, 0.)
+
+
+def bottom_right_crop(images):
+    """Bottom right crop of every image of the batch"""
+    return _crop(images, 1 - CROP_FRACTION, 1 - CROP_FRACTION)
+
+
+# Predefined lists of views
+VIEWS = {
+    "flip": [identity, flip_left_right],
+    "crops": [
+        central_crop, top_left_crop, top_right_crop, bottom_left_crop,
+        bottom_right_crop
+    ],
+    "flip_crops": [
+        identity, flip_left_right, central_crop, top_left_crop,
+        top_right_crop, bottom_left_crop, bottom_right_crop
+    ],
+}
+
+
+def check(tta):
+    """Check if tta is a valid tta dictionary.
+    Raises:
+        ValueError if tta is not valid
+    """
+    if not tta.get("views"):
+        raise ValueError("tta must contain a not empty list of views")
+    if tta.get("reduce", "mean") not in REDUCTIONS:
+        raise ValueError("Invalid tta reduction {}. Valid values are: {}".format(
+            tta["reduce"], set(REDUCTIONS)))
+
+
+def apply(model_fn, images, tta):
+    """Run model_fn on every view of images, as a single batch, and reduce
+    the predictions of the views.
+    Args:
+        model_fn: function(inputs) -> list of predictions, where every
+                  prediction has the batch size as first dimension
+        images: the [batch_size, height, width, depth] input batch
+        tta: dictionary {"views": list of views, "reduce": "mean" | "max"}
+    Returns:
+        predictions: the list of predictions, reduced over the views
+    """
+    check(tta)
+    num_views = len(tta["views"])
+    reduce_fn = REDUCTIONS[tta.get("reduce", "mean")]
+    views = tf.concat([view(images) for view in tta["views"]], axis=0)
+    return [
+        reduce_fn(
+            tf.stack(tf.split(prediction, num_views, axis=0)), axis=0)
+        for prediction in model_fn(views)
+    ]
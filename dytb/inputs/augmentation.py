@@ -0,0 +1,195 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Batched augmentations.
+Every augmentation works on a whole [batch_size, height, width, depth] float
+batch, with values in [-1, 1], at once: the random parameters are drawn for
+every example of the batch, but the ops are executed once per batch.
+The inputs apply them after batching (apply)."""
+
+import tensorflow as tf
+
+
+def batched(augmentation_fn):
+    """Mark augmentation_fn as an augmentation that works on batches"""
+    augmentation_fn.batched = True
+    return augmentation_fn
+
+
+def apply(augmentation_fn, images):
+    """Apply augmentation_fn to the batch of images.
+    Args:
+        augmentation_fn: a batched augmentation, or a function that
+                         augments a single image (applied with map_fn), or None
+        images: [batch_size, height, width, depth] tensor
+    Returns:
+        the augmented batch
+    """
+    if augmentation_fn is None:
+        return images
+    if getattr(augmentation_fn, "batched", False):
+        return augmentation_fn(images)
+    return tf.map_fn(augmentation_fn, images)
+
+
+def _coin(images):
+    """Returns a [batch_size] boolean tensor, True with probability 0.5"""
+    return tf.random_uniform([tf.shape(images)[0]]) < 0.5
+
+
+@batched
+def identity(images):
+    """No augmentation"""
+    return images
+
+
+@batched
+def random_flip_left_right(images):
+    """Flip horizontally every image of the batch with probability 0.5"""
+    return tf.where(_coin(images), tf.reverse(images, [2]), images)
+
+
+@batched
+def random_flip_up_down(images):
+    """Flip vertically every image of the batch with probability 0.5"""
+    return tf.where(_coin(images), tf.reverse(images, [1]), images)
+
+
+def random_crop(padding=4):
+    """Returns the batched augmentation that pads every image with padding
+    zeros per side and crops it back to the original size at a random offset.
+    Args:
+        padding: number of pixels added to every side
+    """
+
+    @batched
+    def _random_crop(images):
+        shape = tf.shape(images)
+        batch_size, height, width = shape[0], shape[1], shape[2]
+        padded = tf.pad(images, [[0, 0], [padding, padding],
+                                 [padding, padding], [0, 0]])
+        offsets = tf.to_float(
+            tf.random_uniform(
+                [batch_size, 2], maxval=2 * padding + 1, dtype=tf.int32))
+        # crop_and_resize boxes that select exactly height x width pixels
+        padded_height = tf.to_float(height + 2 * padding - 1)
+        padded_width = tf.to_float(width + 2 * padding - 1)
+        y_min = offsets[:, 0] / padded_height
+        x_min = offsets[:, 1] / padded_width
+        y_max = (offsets[:, 0] + tf.to_float(height - 1)) / padded_height
+        x_max = (offsets[:, 1] + tf.to_float(width - 1)) / padded_width
+        crops = tf.image.crop_and_resize(
+            padded,
+            tf.stack([y_min, x_min, y_max, x_max], axis=1),
+            tf.range(batch_size),
+            tf.stack([height, width]))
+        crops.set_shape(images.shape)
+        return crops
+
+    return _random_crop
+
+
+def color_jitter(brightness=0.2, contrast=0.2, saturation=0.2):
+    """Returns the batched augmentation that randomly changes the brightness,
+    the contrast and (for RGB images) the saturation of every image.
+    Args:
+        brightness: maximum delta added to the pixels
+        contrast: the contrast factor is in [1 - contrast, 1 + contrast]
+        saturation: the saturation factor is in [1 - saturation, 1 + saturation]
+    """
+
+    def _factor(images, max_delta, offset):
+        return tf.random_uniform(
+            [tf.shape(images)[0], 1, 1, 1],
+            minval=offset - max_delta,
+            maxval=offset + max_delta)
+
+    @batched
+    def _color_jitter(images):
+        images = images + _factor(images, brightness, 0.)
+        mean = tf.reduce_mean(images, axis=[1, 2, 3], keep_dims=True)
+        images = (images - mean) * _factor(images, contrast, 1.) + mean
+        if images.shape[-1].value == 3:
+            gray = tf.image.rgb_to_grayscale(images)
+            images = (images - gray) * _factor(images, saturation, 1.) + gray
+        return tf.clip_by_value(images, -1., 1.)
+
+    return _color_jitter
+
+
+def cutout(size=8):
+    """Returns the batched augmentation that sets to zero a size x size square,
+    centered in a random point of every image.
+    Args:
+        size: the side of the square
+    """
+
+    @batched
+    def _cutout(images):
+        shape = tf.shape(images)
+        batch_size, height, width = shape[0], shape[1], shape[2]
+        center_y = tf.random_uniform(
+            [batch_size, 1, 1], maxval=height, dtype=tf.int32)
+        center_x = tf.random_uniform(
+            [batch_size, 1, 1], maxval=width, dtype=tf.int32)
+        rows = tf.reshape(tf.range(height), [1, -1, 1])
+        cols = tf.reshape(tf.range(width), [1, 1, -1])
+        inside = tf.logical_and(
+            tf.logical_and(rows >= center_y - size // 2,
+                           rows < center_y - size // 2 + size),
+            tf.logical_and(cols >= center_x - size // 2,
+                           cols < center_x - size // 2 + size))
+        return images * tf.expand_dims(1. - tf.to_float(inside), -1)
+
+    return _cutout
+
+
+def compose(augmentations):
+    """Returns the batched augmentation that applies every augmentation
+    of the list, in order"""
+
+    @batched
+    def _compose(images):
+        for augmentation_fn in augmentations:
+            images = apply(augmentation_fn, images)
+        return images
+
+    return _compose
+
+
+# Augmentations selectable by name
+AUGMENTATIONS = {
+    "identity": identity,
+    "flip_lr": random_flip_left_right,
+    "flip_ud": random_flip_up_down,
+    "crop": random_crop(),
+    "color_jitter": color_jitter(),
+    "cutout": cutout(),
+}
+
+
+def get(names):
+    """Returns the batched augmentation described by names.
+    Args:
+        names: comma separated names of AUGMENTATIONS, applied in order.
+               E.g. "crop,flip_lr"
+    Returns:
+        the batched augmentation
+    Raises:
+        ValueError if a name is not in AUGMENTATIONS
+    """
+    augmentations = []
+    for name in names.split(","):
+        name = name.strip().lower()
+        if name not in AUGMENTATIONS:
+            raise ValueError(
+                "Invalid augmentation {}. Valid values are: {}".format(
+                    name, sorted(AUGMENTATIONS)))
+        augmentations.append(AUGMENTATIONS[name])
+    if len(augmentations) == 1:
+        return augmentations[0]
+    return compose(augmentations)
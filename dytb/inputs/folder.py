@@ -0,0 +1,287 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Input of a directory tree of images: root/<split>/<class>/<image>"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from .processing import SINGLE_PASS, array_store, build_cached_batch, cached_arrays, default_num_threads, prepare
+from .images import read_image, uint8_to_float
+from . import augmentation
+from .interfaces import Input, InputType
+
+# extensions of the indexed images, lower case
+EXTENSIONS = {".jpg": "jpg", ".jpeg": "jpg", ".png": "png"}
+
+
+def _scan_directory(directory):
+    """Returns the sorted paths, relative to directory, of the images found in
+    the directory tree"""
+    paths = []
+    for current, _, files in os.walk(directory):
+        for filename in files:
+            if os.path.splitext(filename)[1].lower() in EXTENSIONS:
+                paths.append(
+                    os.path.relpath(os.path.join(current, filename), directory))
+    return sorted(paths)
+
+
+class ImageFolder(Input):
+    """Images of a directory tree, with a class per subdirectory:
+    root/train/<class>/<image>, root/validation/<class>/<image> and
+    root/test/<class>/<image>. A missing split has no examples.
+    Subclass it to use the tree from dytb_train, e.g.
+
+        class MyDataset(ImageFolder):
+            def __init__(self):
+                super().__init__("/data/my_dataset", shape=(64, 64, 3))
+    """
+
+    def __init__(self,
+                 root,
+                 shape=(64, 64, 3),
+                 add_input_to_label=False,
+                 pipeline="dataset",
+                 num_threads=None,
+                 cache_dir=None,
+                 name=None):
+        """Args:
+            root: the directory of the splits
+            shape: every image is resized to (height, width, depth)
+            add_input_to_label: if True, the label is the list [label, image]
+            pipeline: the input pipeline to use: "dataset" (the images are read
+                      and decoded at every epoch) or "cache" (the resized
+                      images are decoded once, stored in a memory mapped store
+                      and shared by every graph and process)
+            num_threads: number of threads used to decode the images.
+                         Default: processing.default_num_threads()
+            cache_dir: the directory of the index, of the manifest and of
+                       the stores. Default: root
+            name: the name of the input source. Default: the name of root
+        """
+        if pipeline not in ("dataset", "cache"):
+            raise ValueError(
+                "Invalid pipeline {}. Valid values are: {}".format(
+                    pipeline, ("dataset", "cache")))
+        self._root = os.path.abspath(root)
+        self._data_dir = os.path.abspath(cache_dir or root)
+        self._name = name or os.path.basename(self._root)
+        self._image_height, self._image_width, self._image_depth = shape
+        self._add_input_to_label = add_input_to_label
+        self._pipeline = pipeline
+        self._num_threads = num_threads
+
+    @property
+    def name(self):
+        """Returns the name of the input source"""
+        return self._name
+
+    def num_examples(self, input_type):
+        """Returns the number of examples per the specified input_type
+
+        Args:
+            input_type: InputType enum
+        """
+        InputType.check(input_type)
+        return self.prepare()["num_examples"][str(input_type)]
+
+    @property
+    def num_classes(self):
+        """Returns the number of classes"""
+        return len(self.prepare()["classes"])
+
+    def prepare(self):
+        """Index the tree, once per process.
+        Returns:
+            the manifest: {"classes", "num_examples", "fingerprint"}
+        """
+        return prepare(self._data_dir, self._build_index)
+
+    def _index_filename(self, split):
+        """Returns the path of the index of split"""
+        return os.path.join(self._data_dir, '{}.index.json'.format(split))
+
+    def _build_index(self):
+        """Scan every class directory of every split in parallel and write
+        the index of the images of every split.
+        Returns:
+            manifest: {"classes": sorted class names,
+                       "num_examples": {split: count},
+                       "fingerprint": {split: sha1 of the index}}
+        """
+        splits = [str(input_type) for input_type in InputType]
+        classes = sorted({
+            entry.name
+            for split in splits
+            if os.path.isdir(os.path.join(self._root, split))
+            for entry in os.scandir(os.path.join(self._root, split))
+            if entry.is_dir()
+        })
+        if not classes:
+            raise ValueError('Failed to find a class directory in ' +
+                             self._root)
+
+        directories = [(split, label)
+                       for split in splits
+                       for label in range(len(classes))]
+        with ThreadPoolExecutor(default_num_threads()) as pool:
+            scans = pool.map(_scan_directory, [
+                os.path.join(self._root, split, classes[label])
+                for split, label in directories
+            ])
+            index = {split: {"paths": [], "labels": []} for split in splits}
+            for (split, label), paths in zip(directories, scans):
+                index[split]["paths"].extend(
+                    os.path.join(classes[label], path) for path in paths)
+                index[split]["labels"].extend([label] * len(paths))
+
+        manifest = {"classes": classes, "num_examples": {}, "fingerprint": {}}
+        for split in splits:
+            content = json.dumps(index[split])
+            with open(self._index_filename(split) + '.tmp', 'w') as output:
+                output.write(content)
+            os.rename(self._index_filename(split) + '.tmp',
+                      self._index_filename(split))
+            manifest["num_examples"][split] = len(index[split]["labels"])
+            manifest["fingerprint"][split] = hashlib.sha1(
+                content.encode()).hexdigest()
+        return manifest
+
+    def _index(self, split):
+        """Returns the absolute paths of the images of split, the is_png flag
+        of every image and the int32 labels"""
+        with open(self._index_filename(split)) as index:
+            index = json.load(index)
+        paths = [
+            os.path.join(self._root, split, path) for path in index["paths"]
+        ]
+        is_png = [
+            EXTENSIONS[os.path.splitext(path)[1].lower()] == "png"
+            for path in paths
+        ]
+        return paths, is_png, np.array(index["labels"], dtype=np.int32)
+
+    def _decode(self, path, is_png):
+        """Read the image in path with read_image and resize it.
+        Returns:
+            the [height, width, depth] uint8 image
+        """
+        image = tf.cond(
+            is_png,
+            lambda: read_image(path, self._image_depth, "png", scale=False),
+            lambda: read_image(path, self._image_depth, "jpg", scale=False))
+        image.set_shape([None, None, self._image_depth])
+        image = tf.image.resize_images(
+            image, [self._image_height, self._image_width])
+        return tf.image.convert_image_dtype(image, tf.uint8, saturate=True)
+
+    def _load_resized(self, split):
+        """Decode and resize every image of split, in a separate graph.
+        Returns:
+            images: [num_examples, height, width, depth] uint8 array
+            labels: [num_examples] int32 array
+        """
+        paths, is_png, labels = self._index(split)
+        images = np.empty(
+            [len(labels), self._image_height, self._image_width,
+             self._image_depth],
+            dtype=np.uint8)
+        with tf.Graph().as_default():
+            dataset = tf.data.Dataset.from_tensor_slices((paths, is_png)).map(
+                self._decode,
+                num_parallel_calls=self._num_threads or default_num_threads())
+            batch = dataset.batch(256).prefetch(2).make_one_shot_iterator(
+            ).get_next()
+            with tf.Session(config=tf.ConfigProto(
+                    device_count={'GPU': 0})) as sess:
+                offset = 0
+                while offset < len(labels):
+                    values = sess.run(batch)
+                    images[offset:offset + len(values)] = values
+                    offset += len(values)
+        print('{} {} images decoded'.format(len(labels), split))
+        return images, labels
+
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
+        """Construct the batches of the images of a split.
+
+        Args:
+            input_type: InputType enum
+            batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: ignored: the examples are shuffled by path or
+                by index, the whole split at once.
+        Returns:
+            images: Images. 4D tensor of [batch_size, height, width, depth] size.
+            labels: tensor with batch_size labels
+        """
+        InputType.check(input_type)
+        manifest = self.prepare()
+        split = str(input_type)
+        if manifest["num_examples"][split] == 0:
+            raise ValueError('Failed to find the images of {} in {}'.format(
+                split, self._root))
+
+        def _batch(images, labels):
+            """Converts the batch of uint8 images to float and augments it"""
+            images = augmentation.apply(augmentation_fn,
+                                        uint8_to_float(images))
+            if self._add_input_to_label:
+                return images, labels, images
+            return images, labels
+
+        num_threads = self._num_threads or default_num_threads()
+        shuffle = input_type == InputType.train and not tf.get_collection(
+            SINGLE_PASS)
+        with tf.variable_scope("{}_input".format(input_type)):
+            if self._pipeline == "cache":
+                # Decode the split once and slice the batches from the memory
+                # mapped store. The store changes with the index and the shape
+                store = os.path.join(self._data_dir, '{}-{}x{}x{}-{}.store'.format(
+                    split, self._image_height, self._image_width,
+                    self._image_depth, manifest["fingerprint"][split][:12]))
+                images, labels = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: self._load_resized(split)))
+                return build_cached_batch(
+                    images,
+                    labels,
+                    batch_size,
+                    shuffle=shuffle,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            # Read and decode the images in parallel at every epoch
+            paths, is_png, labels = self._index(split)
+            dataset = tf.data.Dataset.from_tensor_slices((paths, is_png,
+                                                          labels))
+            if shuffle:
+                # the buffer holds only the paths: shuffle the whole split
+                dataset = dataset.shuffle(len(labels))
+            # every batch is full: the last batch of an epoch is completed with
+            # the first examples of the next one (the same behavior of build_batch)
+            dataset = dataset.repeat().map(
+                lambda path, png, label: (self._decode(path, png), label),
+                num_parallel_calls=num_threads)
+            dataset = dataset.batch(batch_size).map(
+                lambda images, labels: tuple(_batch(images, labels)),
+                num_parallel_calls=num_threads).prefetch(2)
+
+            row = list(dataset.make_one_shot_iterator().get_next())
+            for tensor in row:
+                tensor.set_shape([batch_size] + tensor.shape.as_list()[1:])
+            return row
@@ -65,6 +65,17 @@ def scale_image(image):
     return image
 
 
+def uint8_to_float(images):
+    """Returns the uint8 images converted to float32 tensors with values in [-1, 1].
+    Args:
+        images: uint8 tensor: an image or a batch of images
+    """
+    # Convert from [0, 255] -> [0, 1]
+    images = tf.divide(tf.cast(images, tf.float32), 255.0)
+    # Convert from [0, 1] -> [-1, 1]
+    return scale_image(images)
+
+
 def read_image_jpg(image_path, depth=3, scale=True):
     """Reads the image from image_path (tf.string tensor) [jpg image].
     Cast the result to float32 and if scale=True scale it in [-1,1]
@@ -81,6 +92,78 @@ def read_image_jpg(image_path, depth=3, scale=True):
     return image
 
 
+# DCT scaling factors supported by the JPEG decoder, largest first
+JPEG_RATIOS = (8, 4, 2)
+
+
+def _crop_window(shape, bbox):
+    """Returns the [y, x, height, width] int32 crop window of the normalized
+    box bbox [y_min, x_min, y_max, x_max] in an image with shape [height, width]"""
+    shape = tf.to_float(shape)
+    y_min = tf.clip_by_value(tf.floor(bbox[0] * shape[0]), 0, shape[0] - 1)
+    x_min = tf.clip_by_value(tf.floor(bbox[1] * shape[1]), 0, shape[1] - 1)
+    y_max = tf.clip_by_value(tf.ceil(bbox[2] * shape[0]), y_min + 1, shape[0])
+    x_max = tf.clip_by_value(tf.ceil(bbox[3] * shape[1]), x_min + 1, shape[1])
+    return tf.to_int32(tf.stack([y_min, x_min, y_max - y_min, x_max - x_min]))
+
+
+def read_image_jpg_crop(image_path,
+                        bbox,
+                        size,
+                        depth=3,
+                        scale=True,
+                        dct_scaling=True):
+    """Reads from image_path (tf.string tensor) [jpg image] the crop of the
+    normalized box bbox and resizes it to size.
+    Only the crop window is decoded. If dct_scaling is True and the crop is at
+    least 2, 4 or 8 times larger than size, the jpeg is decoded at 1/2, 1/4 or
+    1/8 of its resolution by the decoder itself.
+    Cast the result to float32 and if scale=True scale it in [-1,1]
+    using scale_image. Otherwise the values are in [0,1]
+    Args:
+        image_path: tf.string tensor, the path of the jpeg image
+        bbox: float tensor [y_min, x_min, y_max, x_max] with coordinates in [0,1].
+              [0, 0, 1, 1] is the whole image
+        size: [height, width] of the returned image
+        depth: number of channels of the returned image
+        scale: if True, the values are in [-1, 1]
+        dct_scaling: if True, enable the reduced resolution decode
+    Return:
+        the [height, width, depth] float32 crop
+    """
+    contents = tf.read_file(image_path)
+    shape = tf.image.extract_jpeg_shape(contents)[:2]
+    window = _crop_window(shape, bbox)
+
+    def _decode(ratio):
+        def _fn():
+            # the decoder crops the image scaled by 1/ratio
+            scaled_shape = (shape + ratio - 1) // ratio
+            return tf.image.decode_and_crop_jpeg(
+                contents,
+                _crop_window(scaled_shape, bbox),
+                channels=depth,
+                ratio=ratio)
+
+        return _fn
+
+    if dct_scaling:
+        crop = tf.case(
+            [(tf.logical_and(window[2] >= ratio * size[0],
+                             window[3] >= ratio * size[1]), _decode(ratio))
+             for ratio in JPEG_RATIOS],
+            default=_decode(1),
+            exclusive=False)
+    else:
+        crop = _decode(1)()
+
+    crop.set_shape([None, None, depth])
+    image = tf.divide(tf.image.resize_images(crop, size), 255.0)
+    if scale:
+        image = scale_image(image)
+    return image
+
+
 def read_image_png(image_path, depth=3, scale=True):
     """Reads the image from image_path (tf.string tensor) [jpg image].
     Cast the result to float32 and if scale=True scale it in [-1,1]
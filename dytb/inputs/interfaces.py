@@ -15,7 +15,11 @@ class Input(object, metaclass=ABCMeta):
     """Input is the interface that classifiers must implement"""
 
     @abstractmethod
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for evaluation using the Reader ops.
 
         Args:
@@ -23,6 +27,9 @@ class Input(object, metaclass=ABCMeta):
             batch_size: Number of elements per batch.
             augmentation_fn: function that accepts an input value,
                 perform augmentation and returns the value
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the examples. Implementations that don't
+                shuffle can ignore it.
 
         Returns:
             elements:  tensor of with batch_size elements
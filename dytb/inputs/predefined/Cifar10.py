@@ -14,16 +14,43 @@ import sys
 import tarfile
 
 from six.moves import urllib
+import numpy as np
 import tensorflow as tf
-from ..processing import build_batch
-from ..images import scale_image
+from ..processing import array_store, build_batch, build_cached_batch, build_dataset_batch, build_filename_queue, cached_arrays, check_pipeline, prepare, read_records, shuffle_records
+from ..images import uint8_to_float
+from .. import augmentation
 from ..interfaces import Input, InputType
 
 
 class Cifar10(Input):
     """Routine for decoding the CIFAR-10 binary file format."""
 
-    def __init__(self, add_input_to_label=False):
+    def __init__(self,
+                 add_input_to_label=False,
+                 pipeline="queue",
+                 num_threads=None,
+                 num_readers=None,
+                 decode_blocks=False):
+        """Args:
+            add_input_to_label: if True, the label is the list [label, image]
+            pipeline: the input pipeline to use: "queue" (queue runners),
+                      "dataset" (tf.data) or "cache" (the split is decoded
+                      once in memory and shared by every graph)
+            num_threads: number of threads used to preprocess the examples.
+                         Default: processing.default_num_threads()
+            num_readers: number of parallel readers of the data files.
+                         The "queue" pipeline joins the records of the readers,
+                         the "dataset" pipeline interleaves them: a reader
+                         reads a whole file, so num_readers is capped by the
+                         number of files of the split.
+                         Default: one reader per file
+            decode_blocks: if True, every data file is decoded at once,
+                           with a single decode_raw. Requires the "dataset"
+                           pipeline
+        """
+        check_pipeline(pipeline)
+        if decode_blocks and pipeline != "dataset":
+            raise ValueError("decode_blocks requires the dataset pipeline")
         # Global constants describing the CIFAR-10 data set.
         self._name = 'CIFAR-10'
         self._image_height = 32
@@ -38,8 +65,11 @@ class Cifar10(Input):
         self._data_dir = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'data', 'Cifar10')
         self._data_url = 'http://www.cs.toronto.edu/~kriz/cifar-10-binary.tar.gz'
-        self._maybe_download_and_extract()
         self._add_input_to_label = add_input_to_label
+        self._pipeline = pipeline
+        self._num_threads = num_threads
+        self._num_readers = num_readers
+        self._decode_blocks = decode_blocks
 
     def num_examples(self, input_type):
         """Returns the number of examples per the specified input_type
@@ -65,8 +95,8 @@ class Cifar10(Input):
         """Returns the name of the input source"""
         return self._name
 
-    def _read(self, filename_queue):
-        """Reads and parses examples from CIFAR10 data files.
+    def _read_record(self, filename_queue):
+        """Reads a record from the CIFAR10 data files.
 
       Recommendation: if you want N-way read parallelism, call this function
       N times.  This will give you N independent Readers reading different
@@ -77,16 +107,37 @@ class Cifar10(Input):
         filename_queue: A queue of strings with the filenames to read from.
 
       Returns:
-        An object representing a single example, with the following fields:
-          height: number of rows in the result (32)
-          width: number of columns in the result (32)
-          depth: number of color channels in the result (3)
-          key: a scalar string Tensor describing the filename & record number
-            for this example.
-          label: an int32 Tensor with the label in the range 0..9.
-          image: a [height, width, depth] uint8 Tensor with the image data
+        value: a scalar string tensor, the record. Decode it with _decode
       """
 
+        # Read a record, getting filenames from the filename_queue.  No
+        # header or footer in the CIFAR-10 format, so we leave header_bytes
+        # and footer_bytes at their default of 0.
+        reader = tf.FixedLengthRecordReader(record_bytes=self._record_bytes())
+        _, value = reader.read(filename_queue)
+        return value
+
+    def _record_bytes(self):
+        """Returns the length of a record: a label followed by the image"""
+        label_bytes = 1  # 2 for CIFAR-100
+        return label_bytes + (
+            self._image_height * self._image_width * self._image_depth)
+
+    def _decode(self, value):
+        """Decode a record read from the CIFAR10 data files.
+        Args:
+            value: a scalar string tensor, the record
+        Returns:
+            An object representing a single example, with the following fields:
+              height: number of rows in the result (32)
+              width: number of columns in the result (32)
+              depth: number of color channels in the result (3)
+              key: a scalar string Tensor describing the filename & record number
+                for this example.
+              label: an int32 Tensor with the label in the range 0..9.
+              image: a [height, width, depth] uint8 Tensor with the image data
+        """
+
         # Dimensions of the images in the CIFAR-10 dataset.
         # See http://www.cs.toronto.edu/~kriz/cifar.html for a description of the
         # input format.
@@ -102,13 +153,6 @@ class Cifar10(Input):
         # Every record consists of a label followed by the image, with a
         # fixed number of bytes for each.
         label_bytes = 1  # 2 for CIFAR-100
-        record_bytes = label_bytes + image_bytes
-
-        # Read a record, getting filenames from the filename_queue.  No
-        # header or footer in the CIFAR-10 format, so we leave header_bytes
-        # and footer_bytes at their default of 0.
-        reader = tf.FixedLengthRecordReader(record_bytes=record_bytes)
-        _, value = reader.read(filename_queue)
 
         # Convert from a string to a vector of uint8 that is record_bytes long.
         record_bytes = tf.decode_raw(value, tf.uint8)
@@ -124,28 +168,73 @@ class Cifar10(Input):
             [result["depth"], result["height"], result["width"]])
 
         # Convert from [depth, height, width] to [height, width, depth].
-        image = tf.cast(tf.transpose(depth_major, [1, 2, 0]), tf.float32)
-
-        # Convert from [0, 255] -> [0, 1]
-        image = tf.divide(image, 255.0)
-
-        # Convert from [0, 1] -> [-1, 1]
-        result["image"] = scale_image(image)
+        # The image stays uint8: it's converted to float once per batch.
+        result["image"] = tf.transpose(depth_major, [1, 2, 0])
 
         return result
 
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+    def _decode_block(self, content):
+        """Decode the content of a whole data file with a single decode_raw.
+        Args:
+            content: a scalar string tensor, the content of the file
+        Returns:
+            An object with the following fields:
+                label: [num_records] int32 Tensor
+                image: [num_records, height, width, depth] uint8 Tensor
+        """
+        records = tf.reshape(
+            tf.decode_raw(content, tf.uint8), [-1, self._record_bytes()])
+        image_bytes = self._image_height * self._image_width * self._image_depth
+        label_bytes = self._record_bytes() - image_bytes
+        images = tf.reshape(records[:, label_bytes:], [
+            -1, self._image_depth, self._image_height, self._image_width
+        ])
+        return {
+            # the last label byte is the label (the fine label for CIFAR-100)
+            "label": tf.cast(records[:, label_bytes - 1], tf.int32),
+            "image": tf.transpose(images, [0, 2, 3, 1])
+        }
+
+    def _load_arrays(self, filenames):
+        """Decode every record of filenames at once.
+        Args:
+            filenames: list of the data files to read
+        Returns:
+            images: uint8 array with shape [num_examples, height, width, depth]
+            labels: int32 array with shape [num_examples]
+        """
+        records = np.concatenate([
+            np.fromfile(name, dtype=np.uint8) for name in filenames
+        ]).reshape([-1, self._record_bytes()])
+        image_bytes = self._image_height * self._image_width * self._image_depth
+        label_bytes = self._record_bytes() - image_bytes
+        images = records[:, label_bytes:].reshape([
+            -1, self._image_depth, self._image_height, self._image_width
+        ]).transpose([0, 2, 3, 1])
+        # the last label byte is the label (the fine label for CIFAR-100)
+        return images, records[:, label_bytes - 1].astype(np.int32)
+
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for CIFAR evaluation using the Reader ops.
 
         Args:
             input_type: InputType enum
             batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the encoded records.
 
         Returns:
             images: Images. 4D tensor of [batch_size, self._image_height, self._image_width, self._image_depth] size.
             labels: Labels. 1D tensor of [batch_size] size.
         """
         InputType.check(input_type)
+        self.prepare()
 
         if input_type == InputType.train:
             filenames = [
@@ -165,28 +254,103 @@ class Cifar10(Input):
             if not tf.gfile.Exists(name):
                 raise ValueError('Failed to find file: ' + name)
 
-        with tf.variable_scope("{}_input".format(input_type)):
-            # Create a queue that produces the filenames to read.
-            filename_queue = tf.train.string_input_producer(filenames)
+        # Ensure that the random shuffling has good mixing properties.
+        min_fraction_of_examples_in_queue = 0.4
+        min_queue_examples = int(
+            num_examples_per_epoch * min_fraction_of_examples_in_queue)
 
-            # Read examples from files in the filename queue.
-            read_input = self._read(filename_queue)
-            if augmentation_fn:
-                read_input["image"] = augmentation_fn(read_input["image"])
+        def _example(read_input):
+            """Returns the uint8 image and the label of the read example"""
+            return read_input["image"], read_input["label"]
 
-            # Ensure that the random shuffling has good mixing properties.
-            min_fraction_of_examples_in_queue = 0.4
-            min_queue_examples = int(
-                num_examples_per_epoch * min_fraction_of_examples_in_queue)
+        def _batch(images, labels):
+            """Converts the batch of uint8 images to float and augments it"""
+            images = uint8_to_float(images)
+            images = augmentation.apply(augmentation_fn, images)
+            if self._add_input_to_label:
+                return images, labels, images
+            return images, labels
 
-            # Generate a batch of images and labels by building up a queue of examples.
-            return build_batch(
-                read_input["image"],
-                read_input["label"] if not self._add_input_to_label else
-                [read_input["label"], read_input["image"]],
+        with tf.variable_scope("{}_input".format(input_type)):
+            if self._pipeline == "cache":
+                # Decode the split once per process and slice the batches
+                # from the memory mapped store shared by every process
+                store = os.path.join(self._data_dir, '{}.store'.format(
+                    'train' if input_type == InputType.train else 'test'))
+                images, labels = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: self._load_arrays(filenames)))
+                return build_cached_batch(
+                    images,
+                    labels,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            if self._pipeline == "dataset":
+                if self._decode_blocks:
+                    # every file is decoded at once: the records are
+                    # the decoded examples
+                    def dataset_fn(filename):
+                        return tf.data.Dataset.from_tensor_slices(
+                            self._decode_block(tf.read_file(filename)))
+
+                    parse_fn = _example
+                else:
+
+                    def dataset_fn(filename):
+                        return tf.data.FixedLengthRecordDataset(
+                            filename, self._record_bytes())
+
+                    parse_fn = lambda value: _example(self._decode(value))
+
+                # Read the files in parallel and decode the records in parallel
+                return build_dataset_batch(
+                    filenames,
+                    dataset_fn,
+                    parse_fn,
+                    min_queue_examples,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_readers=self._num_readers or len(filenames),
+                    num_threads=self._num_threads,
+                    record_bytes=self._record_bytes(),
+                    max_shuffle_bytes=max_shuffle_bytes,
+                    batch_fn=_batch)
+
+            # Create a queue that produces the filenames to read.
+            filename_queue = build_filename_queue(filenames)
+
+            # Read the records from files in the filename queue and shuffle
+            # them before decoding: the shuffle queue holds the encoded records.
+            value = shuffle_records(
+                read_records(self._read_record, filename_queue,
+                             self._num_readers or len(filenames)),
+                self._record_bytes(),
                 min_queue_examples,
                 batch_size,
-                shuffle=input_type == InputType.train)
+                shuffle=input_type == InputType.train,
+                max_shuffle_bytes=max_shuffle_bytes)
+            image, label = _example(self._decode(value))
+
+            # Generate a batch of the decoded images and labels.
+            return build_batch(
+                image,
+                label,
+                0,
+                batch_size,
+                shuffle=False,
+                num_threads=self._num_threads,
+                batch_fn=_batch)
+
+    def prepare(self):
+        """Download and convert the dataset, once per process.
+        Called by inputs(): constructing the input doesn't touch the disk.
+        Returns:
+            the manifest of the dataset (processing.prepare)
+        """
+        return prepare(self._data_dir, self._maybe_download_and_extract)
 
     def _maybe_download_and_extract(self):
         """Download and extract the tarball from Alex's website."""
@@ -11,15 +11,30 @@ import os
 
 import tensorflow as tf
 from tensorflow.contrib.learn.python.learn.datasets import mnist
-from ..processing import convert_to_tfrecords, build_batch
-from ..images import scale_image
+from ..processing import array_store, convert_to_tfrecords, build_batch, build_cached_batch, build_dataset_batch, build_filename_queue, cached_arrays, check_pipeline, prepare, read_tfrecords_arrays, shuffle_records, tfrecords_shards
+from ..images import uint8_to_float
+from .. import augmentation
 from ..interfaces import Input, InputType
 
 
 class MNIST(Input):
     """Routine for decoding the MNIST binary file format."""
 
-    def __init__(self, resize=(28, 28, 1), add_input_to_label=False):
+    def __init__(self,
+                 resize=(28, 28, 1),
+                 add_input_to_label=False,
+                 pipeline="queue",
+                 num_threads=None):
+        """Args:
+            resize: the (width, height, depth) of the returned images
+            add_input_to_label: if True, the label is the list [label, image]
+            pipeline: the input pipeline to use: "queue" (queue runners),
+                      "dataset" (tf.data) or "cache" (the split is decoded
+                      once in memory and shared by every graph)
+            num_threads: number of threads used to preprocess the examples.
+                         Default: processing.default_num_threads()
+        """
+        check_pipeline(pipeline)
         # Global constants describing the MNIST data set.
         self._name = 'MNIST'
         self._original_shape = (28, 28, 1)
@@ -35,8 +50,9 @@ class MNIST(Input):
 
         self._data_dir = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'data', 'MNIST')
-        self._maybe_download_and_extract()
         self._add_input_to_label = add_input_to_label
+        self._pipeline = pipeline
+        self._num_threads = num_threads
 
     def num_examples(self, input_type):
         """Returns the number of examples per the specified input_type
@@ -64,8 +80,8 @@ class MNIST(Input):
 
     # adapted from:
     # https://github.com/tensorflow/tensorflow/blob/r0.11/tensorflow/examples/how_tos/reading_data/fully_connected_reader.py
-    def _read(self, filename_queue):
-        """Reads and parses examples from MNIST data files.
+    def _read_record(self, filename_queue):
+        """Reads a record from the MNIST data files.
         Recommendation: if you want N-way read parallelism, call this function
         N times.  This will give you N independent Readers reading different
         files & positions within those files, which will give better mixing of
@@ -75,15 +91,30 @@ class MNIST(Input):
             filename_queue: A queue of strings with the filenames to read from.
 
         Returns:
-          An object representing a single example, with the following fields:
-              label: an int32 Tensor with the label in the range 0..9.
-              image: a [height, width, depth] uint8 Tensor with the image data
+          value: a scalar string tensor, the record. Decode it with _decode
         """
 
-        result = {'image': None, 'label': None}
-
         reader = tf.TFRecordReader()
         _, value = reader.read(filename_queue)
+        return value
+
+    def _record_bytes(self):
+        """Returns the approximate size of a serialized example:
+        the raw image and the overhead of the features"""
+        return mnist.IMAGE_PIXELS + 64
+
+    def _decode(self, value):
+        """Decode a record read from the MNIST TFRecords files.
+        Args:
+            value: a scalar string tensor, the serialized example
+        Returns:
+            An object representing a single example, with the following fields:
+                label: an int32 Tensor with the label in the range 0..9.
+                image: a [height, width, depth] uint8 Tensor with the image data
+        """
+
+        result = {'image': None, 'label': None}
+
         features = tf.parse_single_example(
             value,
             features={
@@ -99,85 +130,152 @@ class MNIST(Input):
         image.set_shape([mnist.IMAGE_PIXELS])
 
         # Reshape to a valid image
-        image = tf.reshape(image, self._original_shape)
-        # Resize to the selected shape
-        image = tf.squeeze(
-            tf.image.resize_bilinear(
-                tf.expand_dims(image, axis=0),
-                [self._image_height, self._image_width]),
-            axis=[0])
-
-        # Convert from [0, 255] -> [0, 1]
-        image = tf.divide(tf.cast(image, tf.float32), 255.0)
-        # Convert from [0, 1] -> [-1, 1]
-        result["image"] = scale_image(image)
+        # The image stays uint8: it's resized and converted to float
+        # once per batch.
+        result["image"] = tf.reshape(image, self._original_shape)
 
         # Convert label from a scalar uint8 tensor to an int32 scalar.
         result["label"] = tf.cast(features['label'], tf.int32)
         return result
 
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for MNIST evaluation using the Reader ops.
 
         Args:
             input_type: InputType enum.
             batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the encoded records.
 
         Returns:
             images: Images. 4D tensor of [batch_size, resize[0], resize[1], resize[2]] size.
             labels: Labels. 1D tensor of [batch_size] size.
         """
         InputType.check(input_type)
+        self.prepare()
 
         if input_type == InputType.train:
-            filename = os.path.join(self._data_dir, 'train.tfrecords')
             num_examples_per_epoch = self._num_examples_per_epoch_for_train
         elif input_type == InputType.validation:
-            filename = os.path.join(self._data_dir, 'validation.tfrecords')
             num_examples_per_epoch = self._num_examples_per_epoch_for_eval
         elif input_type == InputType.test:
-            filename = os.path.join(self._data_dir, 'test.tfrecords')
             num_examples_per_epoch = self._num_examples_per_epoch_for_test
+        filenames = tfrecords_shards(str(input_type), self._data_dir)
+
+        # Ensure that the random shuffling has good mixing properties.
+        min_fraction_of_examples_in_queue = 0.4
+        min_queue_examples = int(
+            num_examples_per_epoch * min_fraction_of_examples_in_queue)
+
+        def _example(read_input):
+            """Returns the uint8 image and the label of the read example"""
+            return read_input["image"], read_input["label"]
+
+        def _batch(images, labels):
+            """Converts the batch of uint8 images to float and augments it"""
+            images = uint8_to_float(images)
+            if self._original_shape[:2] != (self._image_height,
+                                            self._image_width):
+                images = tf.image.resize_bilinear(
+                    images, [self._image_height, self._image_width])
+            images = augmentation.apply(augmentation_fn, images)
+            if self._add_input_to_label:
+                return images, labels, images
+            return images, labels
 
         with tf.variable_scope("{}_input".format(input_type)):
-            # Create a queue that produces the filenames to read.
-            filename_queue = tf.train.string_input_producer([filename])
+            if self._pipeline == "cache":
+                # Decode the split once per process and slice the batches
+                # from the memory mapped store shared by every process
+                store = os.path.join(self._data_dir,
+                                     '{}.store'.format(input_type))
+                images, labels = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: read_tfrecords_arrays(
+                            filenames, self._original_shape)))
+                return build_cached_batch(
+                    images,
+                    labels,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            if self._pipeline == "dataset":
+                # Read the shards in parallel and decode the records in parallel
+                return build_dataset_batch(
+                    filenames,
+                    tf.data.TFRecordDataset,
+                    lambda value: _example(self._decode(value)),
+                    min_queue_examples,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_readers=len(filenames),
+                    num_threads=self._num_threads,
+                    record_bytes=self._record_bytes(),
+                    max_shuffle_bytes=max_shuffle_bytes,
+                    batch_fn=_batch)
 
-            # Read examples from files in the filename queue.
-            read_input = self._read(filename_queue)
-            if augmentation_fn:
-                read_input["image"] = augmentation_fn(read_input["image"])
+            # Create a queue that produces the filenames to read.
+            filename_queue = build_filename_queue(filenames)
 
-            # Ensure that the random shuffling has good mixing properties.
-            min_fraction_of_examples_in_queue = 0.4
-            min_queue_examples = int(
-                num_examples_per_epoch * min_fraction_of_examples_in_queue)
+            # Read the records from files in the filename queue and shuffle
+            # them before decoding: the shuffle queue holds the encoded records.
+            value = shuffle_records(
+                self._read_record(filename_queue),
+                self._record_bytes(),
+                min_queue_examples,
+                batch_size,
+                shuffle=input_type == InputType.train,
+                max_shuffle_bytes=max_shuffle_bytes)
+            image, label = _example(self._decode(value))
 
-            # Generate a batch of images and labels by building up a queue of examples.
+            # Generate a batch of the decoded images and labels.
             return build_batch(
-                read_input["image"],
-                read_input["label"] if not self._add_input_to_label else
-                [read_input["label"], read_input["image"]],
-                min_queue_examples,
+                image,
+                label,
+                0,
                 batch_size,
-                shuffle=input_type == InputType.train)
+                shuffle=False,
+                num_threads=self._num_threads,
+                batch_fn=_batch)
+
+    def prepare(self):
+        """Download and convert the dataset, once per process.
+        Called by inputs(): constructing the input doesn't touch the disk.
+        Returns:
+            the manifest of the dataset (processing.prepare)
+        """
+        return prepare(self._data_dir, self._maybe_download_and_extract)
 
     def _maybe_download_and_extract(self):
         """Download and extract the MNIST dataset"""
+        if all(
+                tfrecords_shards(name, self._data_dir) is not None
+                for name in ('train', 'validation', 'test')):
+            return
+
         data_sets = mnist.read_data_sets(
             self._data_dir,
             dtype=tf.uint8,
             reshape=False,
             validation_size=self._num_examples_per_epoch_for_eval)
 
-        # Convert to Examples and write the result to TFRecords.
-        if not tf.gfile.Exists(os.path.join(self._data_dir, 'train.tfrecords')):
-            convert_to_tfrecords(data_sets.train, 'train', self._data_dir)
+        # Convert to Examples and write the result to sharded TFRecords.
+        if tfrecords_shards('train', self._data_dir) is None:
+            convert_to_tfrecords(
+                data_sets.train, 'train', self._data_dir, num_shards=8)
 
-        if not tf.gfile.Exists(
-                os.path.join(self._data_dir, 'validation.tfrecords')):
-            convert_to_tfrecords(data_sets.validation, 'validation',
-                                 self._data_dir)
+        if tfrecords_shards('validation', self._data_dir) is None:
+            convert_to_tfrecords(
+                data_sets.validation, 'validation', self._data_dir, num_shards=2)
 
-        if not tf.gfile.Exists(os.path.join(self._data_dir, 'test.tfrecords')):
-            convert_to_tfrecords(data_sets.test, 'test', self._data_dir)
+        if tfrecords_shards('test', self._data_dir) is None:
+            convert_to_tfrecords(
+                data_sets.test, 'test', self._data_dir, num_shards=2)
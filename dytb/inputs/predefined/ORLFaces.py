@@ -16,15 +16,28 @@ from PIL import Image
 from six.moves import urllib
 import tensorflow as tf
 import numpy as np
-from ..processing import convert_to_tfrecords, build_batch
-from ..images import scale_image
+from ..processing import array_store, convert_to_tfrecords, build_batch, build_cached_batch, build_dataset_batch, build_filename_queue, cached_arrays, check_pipeline, prepare, read_tfrecords_arrays, shuffle_records, tfrecords_shards
+from ..images import uint8_to_float
+from .. import augmentation
 from ..interfaces import Input, InputType
 
 
 class ORLFaces(Input):
     """ORL Faces database input"""
 
-    def __init__(self, add_input_to_label=False):
+    def __init__(self,
+                 add_input_to_label=False,
+                 pipeline="queue",
+                 num_threads=None):
+        """Args:
+            add_input_to_label: if True, the label is the list [label, image]
+            pipeline: the input pipeline to use: "queue" (queue runners),
+                      "dataset" (tf.data) or "cache" (the split is decoded
+                      once in memory and shared by every graph)
+            num_threads: number of threads used to preprocess the examples.
+                         Default: processing.default_num_threads()
+        """
+        check_pipeline(pipeline)
         # Global constants describing the ORL Faces data set.
         self._name = 'ORL-Faces'
         self._image_width = 92
@@ -39,8 +52,9 @@ class ORLFaces(Input):
         self._data_dir = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'data', 'ORLFaces')
         self._data_url = 'http://www.cl.cam.ac.uk/Research/DTG/attarchive/pub/data/att_faces.zip'
-        self._maybe_download_and_extract()
         self._add_input_to_label = add_input_to_label
+        self._pipeline = pipeline
+        self._num_threads = num_threads
 
     def num_examples(self, input_type):
         """Returns the number of examples per the specified input_type
@@ -68,8 +82,8 @@ class ORLFaces(Input):
 
     # adapted from:
     # https://github.com/tensorflow/tensorflow/blob/r0.11/tensorflow/examples/how_tos/reading_data/fully_connected_reader.py
-    def _read(self, filename_queue):
-        """Reads and parses examples from MNIST data files.
+    def _read_record(self, filename_queue):
+        """Reads a record from MNIST data files.
         Recommendation: if you want N-way read parallelism, call this function
         N times.  This will give you N independent Readers reading different
         files & positions within those files, which will give better mixing of
@@ -79,15 +93,30 @@ class ORLFaces(Input):
             filename_queue: A queue of strings with the filenames to read from.
 
         Returns:
-          An object representing a single example, with the following fields:
-              label: an int32 Tensor with the label in the range 0..9.
-              image: a [height, width, depth] uint8 Tensor with the image data
+          value: a scalar string tensor, the record. Decode it with _decode
         """
 
-        result = {'image': None, 'label': None}
-
         reader = tf.TFRecordReader()
         _, value = reader.read(filename_queue)
+        return value
+
+    def _record_bytes(self):
+        """Returns the approximate size of a serialized example:
+        the raw image and the overhead of the features"""
+        return self._image_width * self._image_height * self._image_depth + 64
+
+    def _decode(self, value):
+        """Decode a record read from the ORL Faces TFRecords file.
+        Args:
+            value: a scalar string tensor, the serialized example
+        Returns:
+            An object representing a single example, with the following fields:
+                label: an int32 Tensor with the label in the range 0..9.
+                image: a [height, width, depth] uint8 Tensor with the image data
+        """
+
+        result = {'image': None, 'label': None}
+
         features = tf.parse_single_example(
             value,
             features={
@@ -103,58 +132,121 @@ class ORLFaces(Input):
         image.set_shape([self._image_width * self._image_height])
 
         #`Reshape to a valid image
-        image = tf.reshape(
+        # The image stays uint8: it's converted to float once per batch.
+        result["image"] = tf.reshape(
             image, (self._image_height, self._image_width, self._image_depth))
 
-        # Convert from [0, 255] -> [0, 1] floats.
-        image = tf.divide(tf.cast(image, tf.float32), 255.0)
-
-        # Convert from [0, 1] -> [-1, 1]
-        result["image"] = scale_image(image)
-
         # Convert label from a scalar uint8 tensor to an int32 scalar.
         result["label"] = tf.cast(features['label'], tf.int32)
 
         return result
 
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for ORL Faces evaluation using the Reader ops.
 
         Args:
             input_type: InputType enum.
             batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the encoded records.
 
         Returns:
             images: Images. 4D tensor of [batch_size, self._image_width, self._image_height, self._image_depth] size.
             labels: Labels. 1D tensor of [batch_size] size.
         """
         InputType.check(input_type)
+        self.prepare()
+
+        filenames = tfrecords_shards('faces', self._data_dir)
+        num_examples_per_epoch = self._num_examples_per_epoch_for_train
+
+        # Ensure that the random shuffling has good mixing properties.
+        min_fraction_of_examples_in_queue = 0.4
+        min_queue_examples = int(
+            num_examples_per_epoch * min_fraction_of_examples_in_queue)
+
+        def _example(read_input):
+            """Returns the uint8 image and the label of the read example"""
+            return read_input["image"], read_input["label"]
+
+        def _batch(images, labels):
+            """Converts the batch of uint8 images to float and augments it"""
+            images = uint8_to_float(images)
+            images = augmentation.apply(augmentation_fn, images)
+            if self._add_input_to_label:
+                return images, labels, images
+            return images, labels
 
         with tf.variable_scope("{}_input".format(input_type)):
-            filename = os.path.join(self._data_dir, 'faces.tfrecords')
-            num_examples_per_epoch = self._num_examples_per_epoch_for_train
+            if self._pipeline == "cache":
+                # Decode the split once per process and slice the batches
+                # from the memory mapped store shared by every process
+                store = os.path.join(self._data_dir, 'faces.store')
+                images, labels = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: read_tfrecords_arrays(
+                            filenames, (self._image_height, self._image_width,
+                                         self._image_depth))))
+                return build_cached_batch(
+                    images,
+                    labels,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            if self._pipeline == "dataset":
+                # Read the shards in parallel and decode the records in parallel
+                return build_dataset_batch(
+                    filenames,
+                    tf.data.TFRecordDataset,
+                    lambda value: _example(self._decode(value)),
+                    min_queue_examples,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_readers=len(filenames),
+                    num_threads=self._num_threads,
+                    record_bytes=self._record_bytes(),
+                    max_shuffle_bytes=max_shuffle_bytes,
+                    batch_fn=_batch)
 
             # Create a queue that produces the filenames to read.
-            filename_queue = tf.train.string_input_producer([filename])
-
-            # Read examples from files in the filename queue.
-            read_input = self._read(filename_queue)
-            if augmentation_fn:
-                read_input["image"] = augmentation_fn(read_input["image"])
+            filename_queue = build_filename_queue(filenames)
 
-            # Ensure that the random shuffling has good mixing properties.
-            min_fraction_of_examples_in_queue = 0.4
-            min_queue_examples = int(
-                num_examples_per_epoch * min_fraction_of_examples_in_queue)
+            # Read the records from files in the filename queue and shuffle
+            # them before decoding: the shuffle queue holds the encoded records.
+            value = shuffle_records(
+                self._read_record(filename_queue),
+                self._record_bytes(),
+                min_queue_examples,
+                batch_size,
+                shuffle=input_type == InputType.train,
+                max_shuffle_bytes=max_shuffle_bytes)
+            image, label = _example(self._decode(value))
 
-            # Generate a batch of images and labels by building up a queue of examples.
+            # Generate a batch of the decoded images and labels.
             return build_batch(
-                read_input["image"],
-                read_input["label"] if not self._add_input_to_label else
-                [read_input["label"], read_input["image"]],
-                min_queue_examples,
+                image,
+                label,
+                0,
                 batch_size,
-                shuffle=input_type == InputType.train)
+                shuffle=False,
+                num_threads=self._num_threads,
+                batch_fn=_batch)
+
+    def prepare(self):
+        """Download and convert the dataset, once per process.
+        Called by inputs(): constructing the input doesn't touch the disk.
+        Returns:
+            the manifest of the dataset (processing.prepare)
+        """
+        return prepare(self._data_dir, self._maybe_download_and_extract)
 
     def _maybe_download_and_extract(self):
         """Download and extract the ORL Faces dataset"""
@@ -184,8 +276,8 @@ class ORLFaces(Input):
                     os.path.join(dest_directory,
                                  filename.split('.')[-2]))
 
-        # Convert to Examples and write the result to TFRecords.
-        if not tf.gfile.Exists(os.path.join(self._data_dir, 'faces.tfrecords')):
+        # Convert to Examples and write the result to sharded TFRecords.
+        if tfrecords_shards('faces', self._data_dir) is None:
             images = []
             labels = []
 
@@ -201,4 +293,4 @@ class ORLFaces(Input):
             dataset.num_examples = self._num_examples_per_epoch_for_train
             dataset.images = np.array(images)
             dataset.labels = np.array(labels)
-            convert_to_tfrecords(dataset, 'faces', self._data_dir)
+            convert_to_tfrecords(dataset, 'faces', self._data_dir, num_shards=4)
@@ -7,25 +7,151 @@
 #licenses expressed under Section 1.12 of the MPL v2.
 """PASCAL VOC 2012"""
 
+import hashlib
+import json
+import multiprocessing
 import os
 import sys
 import tarfile
 import xml.etree.ElementTree as etree
-import csv
 from collections import defaultdict
 
+from PIL import Image
 from six.moves import urllib
+import numpy as np
 import tensorflow as tf
-from ..processing import build_batch
-from ..images import read_image_jpg
-from ..interfaces.Input import Input
-from ..interfaces.InputType import InputType
+from ..processing import array_store, build_batch, build_cached_batch, build_dataset_batch, build_filename_queue, cached_arrays, check_pipeline, default_num_threads, prepare, read_manifest, shuffle_records
+from ..images import read_image_jpg_crop, uint8_to_float
+from .. import augmentation
+from ..interfaces import Input, InputType
+
+# The boxes index (train.bboxes, val.bboxes) is a sequence of fixed length
+# records: the image name (VOC names are 11 characters long, e.g. 2008_000033)
+# followed by y_min, x_min, y_max, x_max, label as little endian float32.
+FILENAME_BYTES = 11
+BBOX_DTYPE = np.dtype([("filename", "S{}".format(FILENAME_BYTES)),
+                       ("bbox", "<f4", (5, ))])
+BBOX_RECORD_BYTES = BBOX_DTYPE.itemsize
+
+
+def decode_bbox_record(record):
+    """Decode a record of the boxes index.
+    Args:
+        record: a scalar string tensor, the record
+    Returns:
+        filename: scalar string tensor, the name of the image
+        bbox_and_label: float32 tensor [y_min, x_min, y_max, x_max, label]
+    """
+    filename = tf.substr(record, 0, FILENAME_BYTES)
+    bbox_and_label = tf.decode_raw(
+        tf.substr(record, FILENAME_BYTES, BBOX_RECORD_BYTES - FILENAME_BYTES),
+        tf.float32)
+    bbox_and_label.set_shape([5])
+    return filename, bbox_and_label
+
+
+def _parse_annotation(image_xml):
+    """Parse the XML annotation of an image.
+    Args:
+        image_xml: path of the annotation file
+    Returns:
+        list of (class name, difficult flag text, [y_min, x_min, y_max, x_max])
+        of every object, with the coordinates normalized in [0, 1].
+        The difficult flag is checked by the caller, after the class
+    """
+    root = etree.parse(image_xml).getroot()
+    size = root.find('size')
+    width = float(size.find('width').text)
+    height = float(size.find('height').text)
+
+    objects = []
+    for obj in root.iter('object'):
+        bndbox = obj.find('bndbox')
+        objects.append((obj.find('name').text, obj.findtext('difficult'), [
+            float(bndbox.find('ymin').text) / height,
+            float(bndbox.find('xmin').text) / width,
+            float(bndbox.find('ymax').text) / height,
+            float(bndbox.find('xmax').text) / width
+        ]))
+    return objects
+
+
+def _load_patches(image_path, boxes, height, width):
+    """Read a JPEG image and extract its patches.
+    Args:
+        image_path: path of the image
+        boxes: list of [y_min, x_min, y_max, x_max] normalized boxes.
+               A None box is the whole image
+        height, width: size of the patches
+    Returns:
+        list of [height, width, 3] uint8 patches, one per box
+    """
+    image = Image.open(image_path).convert('RGB')
+    image_width, image_height = image.size
+    patches = []
+    for box in boxes:
+        patch = image if box is None else image.crop(
+            (box[1] * image_width, box[0] * image_height,
+             box[3] * image_width, box[2] * image_height))
+        patches.append(
+            np.asarray(
+                patch.resize((width, height), Image.BILINEAR), dtype=np.uint8))
+    return patches
+
+
+def bboxes_patches(data_dir, current_set, height, width, crop):
+    """Extract the patch of every record of the boxes index of current_set.
+    Every image is decoded once, for all of its boxes, by a process pool.
+    Args:
+        data_dir: the directory of the boxes index and of VOCdevkit
+        current_set: "train" or "val"
+        height, width: size of the patches
+        crop: if True, the patch is the box resized, otherwise the whole image
+              resized (the normalized coordinates of the box don't change)
+    Returns:
+        images: [num_records, height, width, 3] uint8 array
+        bboxes_and_labels: [num_records, 5] float32 array
+    """
+    records = np.fromfile(
+        os.path.join(data_dir, '{}.bboxes'.format(current_set)),
+        dtype=BBOX_DTYPE)
+    rows = defaultdict(list)
+    for row, filename in enumerate(records["filename"]):
+        rows[filename].append(row)
+    filenames = list(rows)
+
+    jobs = [(os.path.join(data_dir, 'VOCdevkit', 'VOC2012', 'JPEGImages',
+                          filename.decode() + '.jpg'),
+             [records["bbox"][row][:4].tolist() if crop else None
+              for row in rows[filename]], height, width)
+            for filename in filenames]
+    images = np.empty([len(records), height, width, 3], dtype=np.uint8)
+    with multiprocessing.get_context('spawn').Pool(
+            default_num_threads()) as pool:
+        for filename, patches in zip(filenames,
+                                     pool.starmap(
+                                         _load_patches, jobs, chunksize=16)):
+            images[rows[filename]] = patches
+    return images, records["bbox"]
 
 
 class PASCALVOC2012Classification(Input):
     """Routine for decoding the PASCAL VOC 2012 binary file format."""
 
-    def __init__(self, add_input_to_label=False):
+    def __init__(self,
+                 add_input_to_label=False,
+                 pipeline="queue",
+                 num_threads=None):
+        """Args:
+            add_input_to_label: if True, the label is the list [label, image]
+            pipeline: the input pipeline to use: "queue" (queue runners),
+                      "dataset" (tf.data) or "cache" (the patches are cropped
+                      and resized once, stored in a memory mapped store and
+                      shared by every graph: no JPEG decoding at train time)
+            num_threads: number of threads used to read and decode the images.
+                         Default: processing.default_num_threads()
+        """
+        check_pipeline(pipeline)
         # Global constants describing the PASCAL VOC 2012 data set.
         # resize image to a fixed size
         # the resize dimension is an hyperparameter
@@ -53,8 +179,9 @@ class PASCALVOC2012Classification(Input):
         self._data_dir = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'data', 'PASCALVOC2012')
         self._data_url = 'http://pjreddie.com/media/files/VOCtrainval_11-May-2012.tar'
-        self._maybe_download_and_extract()
         self._add_input_to_label = add_input_to_label
+        self._pipeline = pipeline
+        self._num_threads = num_threads
 
     @property
     def name(self):
@@ -69,6 +196,12 @@ class PASCALVOC2012Classification(Input):
         """
         InputType.check(input_type)
 
+        # the number of boxes of the index built by prepare, if present
+        manifest = read_manifest(self._data_dir)
+        if manifest is not None and "num_examples" in manifest:
+            current_set = 'train' if input_type == InputType.train else 'val'
+            return manifest["num_examples"][current_set]
+
         if input_type == InputType.train:
             return self._num_examples_per_epoch_for_train
         elif input_type == InputType.test:
@@ -80,62 +213,74 @@ class PASCALVOC2012Classification(Input):
         """Returns the number of classes"""
         return self._num_classes
 
-    def _read_image_and_box(self, bboxes_csv):
-        """Extract the filename from the queue, read the image and
-        produce a single box
+    def _read_record(self, bboxes_index):
+        """Extract the filename from the queue and read a record of the file
         Returns:
-            image, box
+            record: a scalar string tensor, the box. Decode it with _decode
         """
 
-        reader = tf.TextLineReader(skip_header_lines=True)
-        _, row = reader.read(bboxes_csv)
-        # file ,y_min, x_min, y_max, x_max, label
-        record_defaults = [[""], [0.], [0.], [0.], [0.], [0.]]
-        # eg:
-        # 2008_000033,0.1831831831831832,0.208,0.7717717717717718,0.952,0
-        filename, y_min, x_min, y_max, x_max, label = tf.decode_csv(
-            row, record_defaults)
-        image_path = os.path.join(self._data_dir, 'VOCdevkit', 'VOC2012',
-                                  'JPEGImages') + "/" + filename + ".jpg"
+        reader = tf.FixedLengthRecordReader(record_bytes=BBOX_RECORD_BYTES)
+        _, record = reader.read(bboxes_index)
+        return record
 
-        # image is normalized in [-1,1], convert to #_image_depth depth
-        image = read_image_jpg(image_path, depth=self._image_depth)
-        return image, tf.stack([y_min, x_min, y_max, x_max, label])
+    @staticmethod
+    def _record_bytes():
+        """Returns the size of a record of the boxes index"""
+        return BBOX_RECORD_BYTES
 
-    def _read(self, filename_queue):
-        image, bbox_and_label = self._read_image_and_box(
-            filename_queue)  #bbox is a single box
-
-        bbox = bbox_and_label[:4]
-        label = tf.cast(bbox_and_label[-1], tf.int32)
-
-        image = tf.squeeze(
-            tf.image.crop_and_resize(
-                tf.expand_dims(image, axis=0),
-                tf.expand_dims(bbox, axis=0),
-                box_ind=[0],
-                crop_size=[self._image_height, self._image_width]),
-            axis=[0])
-        return image, label
+    def _decode(self, record):
+        """Decode a record of the boxes index: read from the image only the
+        box, resized.
+        Args:
+            record: a scalar string tensor, the record
+        Returns:
+            the image cropped to the box and resized, label
+        """
+        filename, bbox_and_label = decode_bbox_record(record)
+        image_path = os.path.join(self._data_dir, 'VOCdevkit', 'VOC2012',
+                                  'JPEGImages') + "/" + filename + ".jpg"
 
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+        # decode only the box, normalized in [-1,1], with #_image_depth depth
+        image = read_image_jpg_crop(
+            image_path,
+            bbox_and_label[:4], [self._image_height, self._image_width],
+            depth=self._image_depth)
+        return image, tf.cast(bbox_and_label[-1], tf.int32)
+
+    def _load_crops(self, current_set):
+        """Returns the uint8 patches of the boxes of current_set, cropped and
+        resized, and their int32 labels"""
+        images, bboxes_and_labels = bboxes_patches(
+            self._data_dir, current_set, self._image_height,
+            self._image_width, crop=True)
+        return images, bboxes_and_labels[:, 4].astype(np.int32)
+
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for PASCALVOC2012Classification evaluation using the Reader ops.
 
         Args:
             input_type: InputType enum
             batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the records of the boxes index.
         Returns:
             images: Images. 4D tensor of [batch_size, self._image_height, self._image_width, self._image_depth] size.
             labels: tensor with batch_size labels
         """
         InputType.check(input_type)
+        self.prepare()
 
         if input_type == InputType.train:
-            filenames = [os.path.join(self._data_dir, 'train.csv')]
-            num_examples_per_epoch = self._num_examples_per_epoch_for_train
+            filenames = [os.path.join(self._data_dir, 'train.bboxes')]
         else:
-            filenames = [os.path.join(self._data_dir, 'val.csv')]
-            num_examples_per_epoch = self._num_examples_per_epoch_for_eval
+            filenames = [os.path.join(self._data_dir, 'val.bboxes')]
+        num_examples_per_epoch = self.num_examples(input_type)
 
         for name in filenames:
             if not tf.gfile.Exists(name):
@@ -146,23 +291,86 @@ class PASCALVOC2012Classification(Input):
         min_queue_examples = int(
             num_examples_per_epoch * min_fraction_of_examples_in_queue)
 
+        def _augment(images, labels):
+            """Augments the batch of images"""
+            images = augmentation.apply(augmentation_fn, images)
+            if self._add_input_to_label:
+                return images, labels, images
+            return images, labels
+
+        def _batch(images, labels):
+            """Converts the batch of uint8 patches to float and augments it"""
+            return _augment(uint8_to_float(images), labels)
+
         with tf.variable_scope("{}_input".format(input_type)):
+            if self._pipeline == "cache":
+                # Crop and resize the patches once and slice the batches
+                # from the memory mapped store shared by every process
+                current_set = 'train' if input_type == InputType.train else 'val'
+                store = os.path.join(self._data_dir,
+                                     '{}.crops.store'.format(current_set))
+                images, labels = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: self._load_crops(current_set)))
+                return build_cached_batch(
+                    images,
+                    labels,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            if self._pipeline == "dataset":
+                # Read and decode the images in parallel
+                return build_dataset_batch(
+                    filenames,
+                    lambda filename: tf.data.FixedLengthRecordDataset(filename, BBOX_RECORD_BYTES),
+                    self._decode,
+                    min_queue_examples,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    record_bytes=self._record_bytes(),
+                    max_shuffle_bytes=max_shuffle_bytes,
+                    batch_fn=_augment)
+
             # Create a queue that produces the filenames to read.
-            filename_queue = tf.train.string_input_producer(filenames)
+            filename_queue = build_filename_queue(filenames)
 
-            image, label = self._read(filename_queue)
-            if augmentation_fn:
-                image = augmentation_fn(image)
+            # Shuffle the records before reading and decoding the images:
+            # the shuffle queue holds the records of the boxes index.
+            record = shuffle_records(
+                self._read_record(filename_queue),
+                self._record_bytes(),
+                min_queue_examples,
+                batch_size,
+                shuffle=input_type == InputType.train,
+                max_shuffle_bytes=max_shuffle_bytes)
+            image, label = self._decode(record)
 
             return build_batch(
                 image,
-                label if not self._add_input_to_label else [label, image],
-                min_queue_examples,
+                label,
+                0,
                 batch_size,
-                shuffle=input_type == InputType.train)
+                shuffle=False,
+                num_threads=self._num_threads,
+                batch_fn=_augment)
+
+    def prepare(self):
+        """Download and convert the dataset, once per process.
+        Called by inputs(): constructing the input doesn't touch the disk.
+        Returns:
+            the manifest of the dataset (processing.prepare)
+        """
+        return prepare(self._data_dir, self._maybe_download_and_extract)
 
     def _maybe_download_and_extract(self):
-        """Download and extract the tarball"""
+        """Download and extract the tarball and build the boxes index.
+        Returns:
+            {"num_examples": {"train": count, "val": count}}: the number of
+            boxes of every index
+        """
         dest_directory = self._data_dir
         if not os.path.exists(dest_directory):
             os.makedirs(dest_directory)
@@ -187,79 +395,92 @@ class PASCALVOC2012Classification(Input):
             print('Sucessfully extracted.')
 
         # Now self._data dir contains VOCDevkit folder
-        # Build train.csv and val.csv file in self._data_dir
-        csv_header = ["filename", "y_min", "x_min", "y_max", "x_max", "label"]
-        if os.path.exists(os.path.join(
-                self._data_dir, 'train.csv')) and os.path.exists(
-                    os.path.join(self._data_dir, 'val.csv')):
-            return
-
+        # Build the train.bboxes and val.bboxes index in self._data_dir,
+        # unless the annotations didn't change since the last build
         base_dir = os.path.join(
             self._data_dir,
             'VOCdevkit',
             'VOC2012',
         )
-
-        for current_set in ['train', 'val']:
-            csv_path = os.path.join(self._data_dir,
-                                    '{}.csv'.format(current_set))
-            with open(csv_path, mode='w') as csv_file:
-                # header
-                writer = csv.DictWriter(csv_file, csv_header)
-                writer.writeheader()
-                for current_class in self.CLASSES:
-                    lines = open(
-                        os.path.join(
-                            base_dir, 'ImageSets', 'Main', '{}_{}.txt'.format(
-                                current_class,
-                                current_set))).read().strip().split("\n")
-                    for line in lines:
+        sets = ['train', 'val']
+        manifest_path = os.path.join(self._data_dir, 'bboxes.json')
+        fingerprint = self._annotations_fingerprint(base_dir)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("fingerprint") == fingerprint and all(
+                    os.path.exists(
+                        os.path.join(self._data_dir, '{}.bboxes'.format(
+                            current_set))) for current_set in sets):
+                return {"num_examples": manifest["num_examples"]}
+
+        # (image, label id) of the positive lines of every class file
+        positives = {}
+        for current_set in sets:
+            positives[current_set] = []
+            for label_id, current_class in enumerate(self.CLASSES):
+                with open(
+                        os.path.join(base_dir, 'ImageSets', 'Main',
+                                     '{}_{}.txt'.format(
+                                         current_class,
+                                         current_set))) as class_file:
+                    for line in class_file:
                         splitted = line.split()
-                        if len(splitted) < 1:
-                            print(splitted, line, current_class)
-                        if splitted[1] == "-1":
+                        if len(splitted) < 2 or splitted[1] == "-1":
                             continue
-
-                        image_xml = os.path.join(base_dir, 'Annotations',
-                                                 '{}.xml'.format(splitted[0]))
-                        image_filename = splitted[0]
-
-                        # parse XML
-                        tree = etree.parse(image_xml)
-                        root = tree.getroot()
-                        size = root.find('size')
-                        width = float(size.find('width').text)
-                        height = float(size.find('height').text)
-
-                        for obj in root.iter('object'):
-                            # skip difficult & object.name not in current class
-                            label = obj.find('name').text
-                            if label != current_class:
-                                continue
-
-                            difficult = obj.find('difficult').text
-                            if int(difficult) == 1:
-                                continue
-
-                            bndbox = obj.find('bndbox')
-                            normalized_bbox = [
-                                # y_min
-                                float(bndbox.find('ymin').text) / height,
-                                # x_min
-                                float(bndbox.find('xmin').text) / width,
-                                # y_max
-                                float(bndbox.find('ymax').text) / height,
-                                # x_max
-                                float(bndbox.find('xmax').text) / width
-                            ]
-
-                            label_id = self.CLASSES.index(current_class)
-                            writer.writerow({
-                                "filename": image_filename,
-                                "y_min": normalized_bbox[0],
-                                "x_min": normalized_bbox[1],
-                                "y_max": normalized_bbox[2],
-                                "x_max": normalized_bbox[3],
-                                "label": label_id
-                            })
-            print('{}.csv created'.format(current_set))
+                        positives[current_set].append((splitted[0], label_id))
+
+        # Parse every annotation exactly once, in parallel
+        images = sorted({
+            image
+            for current_set in sets for image, _ in positives[current_set]
+        })
+        annotations_paths = [
+            os.path.join(base_dir, 'Annotations', '{}.xml'.format(image))
+            for image in images
+        ]
+        with multiprocessing.get_context('spawn').Pool(
+                default_num_threads()) as pool:
+            annotations = dict(
+                zip(images,
+                    pool.map(
+                        _parse_annotation, annotations_paths, chunksize=64)))
+
+        # the patches stores are built from the previous index
+        for store in tf.gfile.Glob(os.path.join(self._data_dir, '*.store')):
+            tf.gfile.DeleteRecursively(store)
+
+        counts = {}
+        for current_set in sets:
+            # skip object.name not in current class & difficult
+            boxes = [(image.encode(), bbox + [label_id])
+                     for image, label_id in positives[current_set]
+                     for name, difficult, bbox in annotations[image]
+                     if name == self.CLASSES[label_id] and
+                     int(difficult) != 1]
+            np.array(boxes, dtype=BBOX_DTYPE).tofile(
+                os.path.join(self._data_dir, '{}.bboxes'.format(current_set)))
+            counts[current_set] = len(boxes)
+            print('{}.bboxes created'.format(current_set))
+
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({
+                "fingerprint": fingerprint,
+                "num_examples": counts
+            }, manifest_file)
+        return {"num_examples": counts}
+
+    @staticmethod
+    def _annotations_fingerprint(base_dir):
+        """Returns the fingerprint of the annotations and of the class files:
+        the sha1 of their names, sizes and modification times"""
+        sha1 = hashlib.sha1()
+        for directory in [
+                os.path.join(base_dir, 'Annotations'),
+                os.path.join(base_dir, 'ImageSets', 'Main')
+        ]:
+            for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+                stat = entry.stat()
+                sha1.update("{}:{}:{}\n".format(entry.name, stat.st_size,
+                                                stat.st_mtime).encode())
+        return sha1.hexdigest()
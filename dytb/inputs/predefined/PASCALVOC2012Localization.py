@@ -8,32 +8,45 @@
 """PASCAL VOC 2012"""
 
 import os
-import sys
-import tarfile
-import xml.etree.ElementTree as etree
-import csv
-from collections import defaultdict
 
-from six.moves import urllib
 import tensorflow as tf
-from ..processing import build_batch
-from ..images import read_image_jpg
+from ..processing import array_store, build_batch, build_cached_batch, build_dataset_batch, build_filename_queue, cached_arrays, check_pipeline, shuffle_records
+from ..images import read_image_jpg_crop, uint8_to_float
+from .. import augmentation
 from ..interfaces import Input, InputType
-from ..PASCALVOC2012Classification import PASCALVOC2012Classification
+from .PASCALVOC2012Classification import BBOX_RECORD_BYTES, PASCALVOC2012Classification, bboxes_patches, decode_bbox_record
 
 
 class PASCALVOC2012Localization(Input):
     """Routine for decoding the PASCAL VOC 2012 binary file format."""
 
-    def __init__(self):
+    def __init__(self, pipeline="queue", num_threads=None):
+        """Args:
+            pipeline: the input pipeline to use: "queue" (queue runners),
+                      "dataset" (tf.data) or "cache" (the images are resized
+                      once, stored in a memory mapped store and shared by
+                      every graph: no JPEG decoding at train time)
+            num_threads: number of threads used to read and decode the images.
+                         Default: processing.default_num_threads()
+        """
+        check_pipeline(pipeline)
         self._name = 'PASCAL-VOC-2012-Localization'
+        # resize image to a fixed size
+        # the resize dimension is an hyperparameter
+        self._image_height = 150
+        self._image_width = 150
+        self._image_depth = 3
         # multiple boxes enable the return of a tensor
         # of boxes instead of a single box per image
         self._multiple_bboxes = False
 
-        # Use Classification dataset
-        # to extract shared features and download the dataset
+        # Use Classification dataset to extract shared features and
+        # download the dataset: constructing it doesn't prepare the dataset
         self._pascal = PASCALVOC2012Classification()
+        self._data_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'data', 'PASCALVOC2012')
+        self._pipeline = pipeline
+        self._num_threads = num_threads
 
     def num_examples(self, input_type):
         """Returns the number of examples per the specified input_type
@@ -53,53 +66,78 @@ class PASCALVOC2012Localization(Input):
         """Returns the name of the input source"""
         return self._name
 
-    def _read_image_and_box(self, bboxes_csv):
-        """Extract the filename from the queue, read the image and
+    def prepare(self):
+        """Download the dataset and build the boxes index, once per process.
+        Called by inputs(): constructing the input doesn't touch the disk.
+        Returns:
+            the manifest of the dataset (processing.prepare)
+        """
+        return self._pascal.prepare()
+
+    def _read_record(self, bboxes_index):
+        """Extract the filename from the queue and read a record of the file
+        Returns:
+            record: a scalar string tensor, the box. Decode it with _decode
+        """
+
+        reader = tf.FixedLengthRecordReader(record_bytes=BBOX_RECORD_BYTES)
+        _, record = reader.read(bboxes_index)
+        return record
+
+    @staticmethod
+    def _record_bytes():
+        """Returns the size of a record of the boxes index"""
+        return BBOX_RECORD_BYTES
+
+    def _decode(self, record):
+        """Decode a record of the boxes index, read the image and
         produce a single box
+        Args:
+            record: a scalar string tensor, the record
         Returns:
             image, [y_min, x_min, y_max, x_max, label]
         """
-
-        reader = tf.TextLineReader(skip_header_lines=True)
-        _, row = reader.read(bboxes_csv)
-        # file ,y_min, x_min, y_max, x_max, label
-        record_defaults = [[""], [0.], [0.], [0.], [0.], [0.]]
-        # eg:
-        # 2008_000033,0.1831831831831832,0.208,0.7717717717717718,0.952,0
-        filename, y_min, x_min, y_max, x_max, label = tf.decode_csv(
-            row, record_defaults)
+        filename, bbox_and_label = decode_bbox_record(record)
         image_path = os.path.join(self._data_dir, 'VOCdevkit', 'VOC2012',
                                   'JPEGImages') + "/" + filename + ".jpg"
 
-        # image is normalized in [-1,1]
-        image = read_image_jpg(image_path)
-        return image, tf.stack([y_min, x_min, y_max, x_max, label])
-
-    def inputs(self, input_type, batch_size, augmentation_fn=None):
+        # image is normalized in [-1,1] and resized: the normalized
+        # coordinates of the box do not change. Large images are decoded
+        # at a reduced resolution
+        image = read_image_jpg_crop(
+            image_path, [0., 0., 1., 1.],
+            [self._image_height, self._image_width],
+            depth=self._image_depth)
+        return image, bbox_and_label
+
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
         """Construct input for PASCALVOC2012 evaluation using the Reader ops.
 
         Args:
             input_type: InputType enum
             batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: if present, the maximum size in bytes of the
+                buffer used to shuffle the records of the boxes index.
         Returns:
             images: Images. 4D tensor of [batch_size, self._image_height, self._image_width, self._image_depth] size.
             labels: A tensor with shape [batch_size, num_bboxes_max, 5]. num_bboxes_max are the maximum bboxes found in the
             requested set (train/test/validation). Where the bbox is fake, a -1,-1,-1,-1,-1 value is present
         """
         InputType.check(input_type)
+        self.prepare()
 
+        # the boxes index created by PASCALVOC2012Classification
         if input_type == InputType.train:
-            filenames = [
-                os.path.join(self._data_dir, 'VOCdevkit', 'VOC2012',
-                             'ImageSets', 'Main', 'train.txt')
-            ]
-            num_examples_per_epoch = self._num_examples_per_epoch_for_train
+            filenames = [os.path.join(self._data_dir, 'train.bboxes')]
         else:
-            filenames = [
-                os.path.join(self._data_dir, 'VOCdevkit', 'VOC2012',
-                             'ImageSets', 'Main', 'val.txt')
-            ]
-            num_examples_per_epoch = self._num_examples_per_epoch_for_eval
+            filenames = [os.path.join(self._data_dir, 'val.bboxes')]
+        num_examples_per_epoch = self.num_examples(input_type)
 
         for name in filenames:
             if not tf.gfile.Exists(name):
@@ -110,17 +148,67 @@ class PASCALVOC2012Localization(Input):
         min_queue_examples = int(
             num_examples_per_epoch * min_fraction_of_examples_in_queue)
 
+        def _augment(images, bboxes):
+            """Augments the batch of images"""
+            return augmentation.apply(augmentation_fn, images), bboxes
+
+        def _batch(images, bboxes):
+            """Converts the batch of uint8 images to float and augments it"""
+            return _augment(uint8_to_float(images), bboxes)
+
         with tf.variable_scope("{}_input".format(input_type)):
+            if self._pipeline == "cache":
+                # Resize the images once and slice the batches
+                # from the memory mapped store shared by every process
+                current_set = 'train' if input_type == InputType.train else 'val'
+                store = os.path.join(self._data_dir,
+                                     '{}.resized.store'.format(current_set))
+                images, bboxes = cached_arrays(
+                    store, lambda: array_store(
+                        store, lambda: bboxes_patches(
+                            self._data_dir, current_set, self._image_height,
+                            self._image_width, crop=False)))
+                return build_cached_batch(
+                    images,
+                    bboxes,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    batch_fn=_batch)
+
+            if self._pipeline == "dataset":
+                # Read and decode the images in parallel
+                return build_dataset_batch(
+                    filenames,
+                    lambda filename: tf.data.FixedLengthRecordDataset(filename, BBOX_RECORD_BYTES),
+                    self._decode,
+                    min_queue_examples,
+                    batch_size,
+                    shuffle=input_type == InputType.train,
+                    num_threads=self._num_threads,
+                    record_bytes=self._record_bytes(),
+                    max_shuffle_bytes=max_shuffle_bytes,
+                    batch_fn=_augment)
+
             # Create a queue that produces the filenames to read.
-            filename_queue = tf.train.string_input_producer(filenames)
+            filename_queue = build_filename_queue(filenames)
 
-            image, bbox = self._read_image_and_box(filename_queue)
+            # Shuffle the records before reading and decoding the images:
+            # the shuffle queue holds the records of the boxes index.
+            record = shuffle_records(
+                self._read_record(filename_queue),
+                self._record_bytes(),
+                min_queue_examples,
+                batch_size,
+                shuffle=input_type == InputType.train,
+                max_shuffle_bytes=max_shuffle_bytes)
+            image, bbox = self._decode(record)
 
-            if augmentation_fn:
-                image = augmentation_fn(image)
             return build_batch(
                 image,
                 bbox,
-                min_queue_examples,
+                0,
                 batch_size,
-                shuffle=input_type == InputType.train)
+                shuffle=False,
+                num_threads=self._num_threads,
+                batch_fn=_augment)
@@ -0,0 +1,156 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Synthetic input: random examples generated in memory.
+Useful to measure the throughput of models and trainer without the
+effects of the data I/O, and without downloading any dataset."""
+
+import numpy as np
+import tensorflow as tf
+from ..processing import build_cached_batch, cached_arrays, check_pipeline
+from ..images import uint8_to_float
+from .. import augmentation
+from ..interfaces import Input, InputType
+
+# available target types
+TARGETS = ("label", "bbox", "input")
+
+
+class Synthetic(Input):
+    """Random images and targets, generated once and served from memory"""
+
+    def __init__(self,
+                 shape=(32, 32, 3),
+                 num_classes=10,
+                 num_examples=None,
+                 target="label",
+                 pipeline="cache",
+                 num_threads=None,
+                 seed=0):
+        """Args:
+            shape: the shape of an image: (height, width, depth)
+            num_classes: number of classes of the labels
+            num_examples: dict {InputType: number of examples}.
+                          Default: 50000 train, 10000 validation and test
+            target: "label": the label of the image.
+                    "bbox": [y_min, x_min, y_max, x_max, label] float32 tensor.
+                    "input": the label is the list [label, image]
+                    (the same of add_input_to_label=True of the other inputs)
+            pipeline: ignored: the examples are always served from memory,
+                      as the "cache" pipeline of the other inputs.
+                      Accepted (and validated) to be selected by --pipeline
+            num_threads: number of threads used to prepare the batches.
+                         Default: processing.default_num_threads()
+            seed: seed of the generated examples
+        """
+        check_pipeline(pipeline)
+        if target not in TARGETS:
+            raise ValueError("Invalid target {}. Valid values are: {}".format(
+                target, TARGETS))
+        if num_examples is None:
+            num_examples = {
+                InputType.train: 50000,
+                InputType.validation: 10000,
+                InputType.test: 10000
+            }
+
+        self._name = 'Synthetic'
+        self._image_height, self._image_width, self._image_depth = shape
+        self._num_classes = num_classes
+        self._num_examples = num_examples
+        self._target = target
+        self._num_threads = num_threads
+        self._seed = seed
+
+    def num_examples(self, input_type):
+        """Returns the number of examples per the specified input_type
+
+        Args:
+            input_type: InputType enum
+        """
+        InputType.check(input_type)
+        return self._num_examples[input_type]
+
+    @property
+    def num_classes(self):
+        """Returns the number of classes"""
+        return self._num_classes
+
+    @property
+    def name(self):
+        """Returns the name of the input source"""
+        return self._name
+
+    def _generate(self, input_type):
+        """Generate the examples of input_type.
+        Returns:
+            images: [num_examples, height, width, depth] uint8 array
+            targets: [num_examples] int32 labels or
+                     [num_examples, 5] float32 boxes and labels
+        """
+        # a different stream of examples for every input type
+        random = np.random.RandomState(
+            [self._seed, list(InputType).index(input_type)])
+        num_examples = self.num_examples(input_type)
+        images = random.randint(
+            0,
+            256,
+            size=(num_examples, self._image_height, self._image_width,
+                  self._image_depth),
+            dtype=np.uint8)
+        labels = random.randint(0, self._num_classes, size=num_examples)
+        if self._target != "bbox":
+            return images, labels.astype(np.int32)
+
+        corners = np.sort(random.uniform(size=(num_examples, 2, 2)), axis=1)
+        bboxes = np.concatenate(
+            [corners[:, 0], corners[:, 1], labels[:, None]], axis=1)
+        return images, bboxes.astype(np.float32)
+
+    def inputs(self,
+               input_type,
+               batch_size,
+               augmentation_fn=None,
+               max_shuffle_bytes=None):
+        """Construct the batches of random examples.
+        The examples are generated once per process and the batches are
+        sliced from memory.
+
+        Args:
+            input_type: InputType enum
+            batch_size: Number of images per batch.
+            augmentation_fn: function that accepts an image, perform augmentation
+                and returns the image
+            max_shuffle_bytes: ignored: the examples are shuffled by index.
+
+        Returns:
+            images: Images. 4D tensor of [batch_size, height, width, depth] size.
+            targets: tensor of batch_size elements, depending on the target
+        """
+        InputType.check(input_type)
+
+        def _batch(images, targets):
+            """Converts the batch of uint8 images to float and augments it"""
+            images = uint8_to_float(images)
+            images = augmentation.apply(augmentation_fn, images)
+            if self._target == "input":
+                return images, targets, images
+            return images, targets
+
+        with tf.variable_scope("{}_input".format(input_type)):
+            images, targets = cached_arrays(
+                (self._name, self._seed, self._image_height,
+                 self._image_width, self._image_depth, self._num_classes,
+                 self.num_examples(input_type), self._target == "bbox",
+                 str(input_type)), lambda: self._generate(input_type))
+            return build_cached_batch(
+                images,
+                targets,
+                batch_size,
+                shuffle=input_type == InputType.train,
+                num_threads=self._num_threads,
+                batch_fn=_batch)
@@ -7,12 +7,158 @@
 #licenses expressed under Section 1.12 of the MPL v2.
 """Utils to dataset preprocessing"""
 
+import fcntl
+import json
 import os
 import multiprocessing
+import time
+import numpy as np
 import tensorflow as tf
 
+# available input pipelines
+PIPELINES = ("queue", "dataset", "cache")
 
-def build_batch(image, label, min_queue_examples, batch_size, shuffle):
+# arrays decoded by cached_arrays, shared by every graph of the process
+_CACHED_ARRAYS = {}
+
+# manifests read by read_manifest, by data directory
+_MANIFESTS = {}
+
+# data directories of the datasets prepared by the current process
+_PREPARED = set()
+
+# name of the manifest written by prepare, in the data directory
+MANIFEST = 'manifest.json'
+
+# name of the collection that, when not empty, disables the shuffling
+# of the batches built by build_batch in the current graph.
+# Used by the evaluators to read every example of a split exactly once.
+SINGLE_PASS = 'single_pass'
+
+
+def single_pass():
+    """Disable the shuffling of the batches built by build_batch into the
+    current default graph: the first num_examples elements dequeued are
+    exactly one epoch of the input.
+    Must be called before building the input pipeline."""
+    tf.add_to_collection(SINGLE_PASS, True)
+
+
+def check_pipeline(pipeline):
+    """Check if pipeline is a valid input pipeline name.
+    Raises:
+        ValueError if pipeline is not valid
+    """
+    if pipeline not in PIPELINES:
+        raise ValueError("Invalid pipeline {}. Valid values are: {}".format(
+            pipeline, PIPELINES))
+
+
+def default_num_threads():
+    """Returns the default number of threads used to preprocess the examples"""
+    num_preprocess_threads = multiprocessing.cpu_count()
+    if num_preprocess_threads > 2:
+        num_preprocess_threads -= 2
+    return num_preprocess_threads
+
+
+def _shuffle_capacity(min_queue_examples, batch_size, record_bytes,
+                      max_shuffle_bytes):
+    """Returns the number of records to keep in a shuffle buffer of at most
+    max_shuffle_bytes bytes (if not None)"""
+    capacity = min_queue_examples + 3 * batch_size
+    if max_shuffle_bytes is not None:
+        capacity = min(capacity, max(1, max_shuffle_bytes // record_bytes))
+    return capacity
+
+
+def build_filename_queue(filenames):
+    """Create the queue of the filenames to read, for the readers of read_records.
+    The order of the files is shuffled at every epoch, unless single_pass has
+    been called on the current graph: the files are read in the given order.
+    Args:
+        filenames: list of the files to read
+    Returns:
+        the filename queue
+    """
+    return tf.train.string_input_producer(
+        filenames, shuffle=not tf.get_collection(SINGLE_PASS))
+
+
+def read_records(read_fn, filename_queue, num_readers):
+    """Create num_readers readers of the files in filename_queue.
+    Args:
+        read_fn: function(filename_queue) -> record, creates a reader
+        filename_queue: the queue of the filenames to read
+        num_readers: number of parallel readers.
+            Ignored (1) if single_pass has been called on the current graph:
+            a single reader reads the files in order.
+    Returns:
+        records: list of the records read by every reader. Merge them with
+                 shuffle_records
+    """
+    if tf.get_collection(SINGLE_PASS):
+        num_readers = 1
+    return [read_fn(filename_queue) for _ in range(max(1, num_readers))]
+
+
+def shuffle_records(record,
+                    record_bytes,
+                    min_queue_examples,
+                    batch_size,
+                    shuffle,
+                    max_shuffle_bytes=None):
+    """Shuffle the records read by a reader, before decoding them.
+    The shuffle queue holds the encoded records: the memory used to shuffle is
+    a fraction of the memory required to shuffle the decoded (float32) examples.
+    Build the batch of the decoded records with build_batch(shuffle=False).
+    Args:
+        record: scalar string tensor, the record read by a reader, or
+            the list of the records read by parallel readers (read_records).
+            Every reader enqueues its records in the same queue.
+        record_bytes: (approximate) size in bytes of a record
+        min_queue_examples: int32, minimum number of records to retain
+           in the queue (the same value of build_batch)
+        batch_size: Number of images per batch.
+        shuffle: boolean indicating whether to shuffle the records.
+            Ignored if single_pass has been called on the current graph.
+        max_shuffle_bytes: if present, the maximum size in bytes of the
+            shuffle queue. Lower values reduce the memory and the mixing.
+    Returns:
+        record: the shuffled record
+    """
+    records = record if isinstance(record, list) else [record]
+    shuffle = shuffle and not tf.get_collection(SINGLE_PASS)
+    if not shuffle and len(records) == 1:
+        return records[0]
+
+    capacity = _shuffle_capacity(min_queue_examples, batch_size, record_bytes,
+                                 max_shuffle_bytes)
+    if shuffle:
+        queue = tf.RandomShuffleQueue(
+            capacity=capacity,
+            min_after_dequeue=max(capacity - 3 * batch_size, capacity // 2),
+            dtypes=[records[0].dtype],
+            shapes=[records[0].shape])
+    else:
+        # join the records of the readers, like tf.train.batch_join
+        queue = tf.FIFOQueue(
+            capacity=3 * batch_size,
+            dtypes=[records[0].dtype],
+            shapes=[records[0].shape])
+    tf.train.add_queue_runner(
+        tf.train.QueueRunner(queue,
+                             [queue.enqueue([value]) for value in records]))
+    return queue.dequeue()
+
+
+def build_batch(image,
+                label,
+                min_queue_examples,
+                batch_size,
+                shuffle,
+                num_threads=None,
+                batch_fn=None):
     """Construct a queued batch of images and labels.
     Args:
         image: 3-D Tensor of [height, width, 3] of type.float32.
@@ -21,6 +167,13 @@ def build_batch(image, label, min_queue_examples, batch_size, shuffle):
            in the queue that provides of batches of examples.
         batch_size: Number of images per batch.
         shuffle: boolean indicating whether to use a shuffling queue.
+            Ignored if single_pass has been called on the current graph.
+        num_threads: number of threads that enqueue the examples.
+            Default: default_num_threads().
+            Ignored (1) if single_pass has been called on the current graph.
+        batch_fn: function(images, *labels) -> tuple of batches. If present, it's
+            applied to every batch by background threads, before the batch is
+            dequeued. E.g.: convert a batch of uint8 images to float32.
 
     Returns:
         images: Images. 4D tensor of [batch_size, height, width, 3] size.
@@ -28,60 +181,478 @@ def build_batch(image, label, min_queue_examples, batch_size, shuffle):
     """
     # Create a queue that shuffles the examples, and then
     # read 'batch_size' images + labels from the example queue.
-    num_preprocess_threads = multiprocessing.cpu_count()
-    if num_preprocess_threads > 2:
-        num_preprocess_threads -= 2
+    num_preprocess_threads = num_threads or default_num_threads()
 
     if isinstance(label, list):
         row = [image] + label
     else:
         row = [image, label]
 
-    if shuffle:
-        return tf.train.shuffle_batch(
+    single = bool(tf.get_collection(SINGLE_PASS))
+    if single:
+        # parallel enqueuers reorder the examples
+        num_preprocess_threads = 1
+    if shuffle and not single:
+        batch = tf.train.shuffle_batch(
             row,
             batch_size=batch_size,
             num_threads=num_preprocess_threads,
             capacity=min_queue_examples + 3 * batch_size,
             min_after_dequeue=min_queue_examples)
+    else:
+        batch = tf.train.batch(
+            row,
+            batch_size=batch_size,
+            num_threads=num_preprocess_threads,
+            capacity=min_queue_examples + 3 * batch_size)
+
+    if batch_fn is None:
+        return batch
 
+    # Process the batches in background and enqueue the results.
+    # A single thread preserves the order of the batches in single pass mode.
     return tf.train.batch(
-        row,
+        list(batch_fn(*batch)),
         batch_size=batch_size,
         num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size)
+        capacity=3 * batch_size,
+        enqueue_many=True)
+
+
+def build_dataset_batch(filenames,
+                        dataset_fn,
+                        parse_fn,
+                        min_queue_examples,
+                        batch_size,
+                        shuffle,
+                        num_readers=1,
+                        num_threads=None,
+                        drop_remainder=False,
+                        prefetch=2,
+                        record_bytes=None,
+                        max_shuffle_bytes=None,
+                        batch_fn=None):
+    """Construct a batch of examples using a tf.data pipeline.
+    The files are read in parallel and interleaved, the records are parsed
+    in parallel, batched and prefetched.
+    tf.data.Dataset.interleave reads its inputs in a single thread: every
+    reader prefetches its records in its own background thread, hence
+    num_readers files are read at the same time.
+    Args:
+        filenames: list of the files to read, or of the elements passed to
+            dataset_fn (e.g. the indices of ranges of records of a file)
+        dataset_fn: function(filename) -> tf.data.Dataset of the records of filename
+        parse_fn: function(record) -> (image, label), where label is a tensor
+            or a list of tensors like [label, attrA, ... ]. Must apply the augmentations.
+        min_queue_examples: int32, size of the shuffle buffer.
+        batch_size: Number of images per batch.
+        shuffle: boolean indicating whether to shuffle the files and the examples.
+            Ignored if single_pass has been called on the current graph.
+        num_readers: number of files read at the same time.
+            Ignored (1) if single_pass has been called on the current graph.
+        num_threads: number of parallel calls of parse_fn.
+            Default: default_num_threads()
+        drop_remainder: if False, every batch is full: the last batch of an epoch
+            is completed with the first examples of the next one (the same behavior
+            of build_batch). If True, every epoch is batched on its own and its
+            last incomplete batch is dropped.
+        prefetch: number of batches to prepare in background
+        record_bytes: (approximate) size in bytes of a record. Required if
+            max_shuffle_bytes is present.
+        max_shuffle_bytes: if present, the maximum size in bytes of the
+            shuffle buffer. The buffer holds the records before parse_fn.
+        batch_fn: function(images, *labels) -> tuple of batches. If present, it's
+            applied to every batch, in parallel, before the prefetch.
+
+    Returns:
+        images: Images. 4D tensor of [batch_size, height, width, 3] size.
+        labels: Labels. 1D tensor of [batch_size] size containing the elements of labels
+    """
+    single = bool(tf.get_collection(SINGLE_PASS))
+    shuffle = shuffle and not single
+    # an epoch is read in the files order when reading a single file at a time
+    cycle_length = 1 if single else max(1, min(num_readers, len(filenames)))
+
+    files = tf.data.Dataset.from_tensor_slices(filenames)
+    if shuffle:
+        files = files.shuffle(len(filenames))
+    if not drop_remainder:
+        files = files.repeat()
+
+    if cycle_length > 1:
+        # the prefetch runs every reader of the cycle in its own thread
+        dataset = files.interleave(
+            lambda filename: dataset_fn(filename).prefetch(batch_size),
+            cycle_length=cycle_length,
+            block_length=1)
+    else:
+        dataset = files.interleave(
+            dataset_fn, cycle_length=cycle_length, block_length=1)
+
+    if shuffle:
+        # shuffle the records before decoding them
+        dataset = dataset.shuffle(
+            _shuffle_capacity(min_queue_examples, batch_size, record_bytes,
+                              max_shuffle_bytes))
+
+    def _parse(record):
+        image, label = parse_fn(record)
+        if isinstance(label, list):
+            return tuple([image] + label)
+        return image, label
+
+    dataset = dataset.map(
+        _parse, num_parallel_calls=num_threads or default_num_threads())
+    dataset = dataset.batch(batch_size)
+    if drop_remainder:
+        dataset = dataset.filter(
+            lambda *row: tf.equal(tf.shape(row[0])[0], batch_size)).repeat()
+    if batch_fn is not None:
+        dataset = dataset.map(
+            lambda *row: tuple(batch_fn(*row)),
+            num_parallel_calls=num_threads or default_num_threads())
+    dataset = dataset.prefetch(prefetch)
 
+    row = list(dataset.make_one_shot_iterator().get_next())
+    # every batch is full
+    for tensor in row:
+        tensor.set_shape([batch_size] + tensor.shape.as_list()[1:])
+    return row
 
-def convert_to_tfrecords(dataset, name, data_dir):
-    """ Converts the dataset in a TFRecord file with name.tfrecords.
-    Save it into data_dir."""
 
-    def _int64_feature(value):
-        return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+def _labels_array(labels):
+    """Returns labels as a contiguous array of int32 (class ids)
+    or float32 (e.g. boxes)"""
+    labels = np.asarray(labels)
+    if np.issubdtype(labels.dtype, np.floating):
+        return np.ascontiguousarray(labels, dtype=np.float32)
+    return np.ascontiguousarray(labels, dtype=np.int32)
 
-    def _bytes_feature(value):
-        return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
 
+def cached_arrays(key, load_fn):
+    """Returns the arrays of the examples identified by key.
+    The arrays are decoded by load_fn the first time key is requested and
+    kept in memory: every graph of the process shares them.
+    Args:
+        key: hashable that identifies the examples, e.g. the tuple of filenames
+        load_fn: function() -> (images, labels) numpy arrays
+    Returns:
+        images, labels: contiguous numpy arrays
+    """
+    if key not in _CACHED_ARRAYS:
+        images, labels = load_fn()
+        _CACHED_ARRAYS[key] = (np.ascontiguousarray(images),
+                               _labels_array(labels))
+    return _CACHED_ARRAYS[key]
+
+
+def write_array_store(path, images, labels):
+    """Write images and labels in a memory mappable store: the directory path
+    with the raw uint8 images, the raw int32 or float32 labels and a JSON header.
+    The store is written in a temporary directory and renamed: concurrent
+    writers don't corrupt it and readers never see it incomplete.
+    Args:
+        path: the directory of the store
+        images: uint8 array with shape [num_examples, height, width, depth]
+        labels: array with shape [num_examples] or [num_examples, ...]
+    """
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    labels = _labels_array(labels)
+    tmp = "{}.tmp-{}".format(path, os.getpid())
+    if not os.path.exists(tmp):
+        os.makedirs(tmp)
+    images.tofile(os.path.join(tmp, 'images.bin'))
+    labels.tofile(os.path.join(tmp, 'labels.bin'))
+    with open(os.path.join(tmp, 'header.json'), 'w') as header:
+        json.dump({
+            "num_examples": len(labels),
+            "image_shape": list(images.shape[1:]),
+            "images_dtype": "uint8",
+            "label_shape": list(labels.shape[1:]),
+            "labels_dtype": labels.dtype.name
+        }, header)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # another process created the store first
+        tf.gfile.DeleteRecursively(tmp)
+
+
+def read_array_store(path):
+    """Memory map the store written by write_array_store.
+    The arrays are read only and backed by the page cache: every process that
+    maps the same store shares a single copy of the data.
+    Args:
+        path: the directory of the store
+    Returns:
+        images, labels: the read only memory mapped arrays, or None if the
+                        store does not exist
+    """
+    header_file = os.path.join(path, 'header.json')
+    if not os.path.exists(header_file):
+        return None
+    with open(header_file) as header:
+        header = json.load(header)
+    num_examples = header["num_examples"]
+    images = np.memmap(
+        os.path.join(path, 'images.bin'),
+        dtype=header["images_dtype"],
+        mode='r',
+        shape=tuple([num_examples] + header["image_shape"]))
+    labels = np.memmap(
+        os.path.join(path, 'labels.bin'),
+        dtype=header["labels_dtype"],
+        mode='r',
+        shape=tuple([num_examples] + header.get("label_shape", [])))
+    return images, labels
+
+
+def array_store(path, load_fn):
+    """Returns the memory mapped arrays of the store in path.
+    If the store does not exist, it's created with the arrays returned by load_fn.
+    The store is built at the first use of the pipeline that needs it, not when
+    the dataset is prepared: processes that need the same missing store hold
+    an exclusive lock on path.lock, the first builds it and the others wait
+    for it and map it.
+    Args:
+        path: the directory of the store
+        load_fn: function() -> (images, labels) numpy arrays
+    Returns:
+        images, labels: the read only memory mapped arrays
+    """
+    arrays = read_array_store(path)
+    if arrays is not None:
+        return arrays
+
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if read_array_store(path) is None:
+                images, labels = load_fn()
+                write_array_store(path, images, labels)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return read_array_store(path)
+
+
+def read_tfrecords_arrays(filenames, shape):
+    """Decode the examples of the TFRecords files written by convert_to_tfrecords.
+    Args:
+        filenames: list of the files to read
+        shape: the shape of an image
+    Returns:
+        images: uint8 array with shape [num_examples] + shape
+        labels: int32 array with shape [num_examples]
+    """
+    images, labels = [], []
+    for filename in filenames:
+        for record in tf.python_io.tf_record_iterator(filename):
+            feature = tf.train.Example.FromString(record).features.feature
+            images.append(feature['image_raw'].bytes_list.value[0])
+            labels.append(feature['label'].int64_list.value[0])
+    images = np.frombuffer(b''.join(images), dtype=np.uint8)
+    return images.reshape([-1] + list(shape)), np.array(labels, dtype=np.int32)
+
+
+def build_cached_batch(images,
+                       labels,
+                       batch_size,
+                       shuffle,
+                       num_threads=None,
+                       prefetch=2,
+                       batch_fn=None):
+    """Construct a batch of examples slicing the arrays of a split kept in memory.
+    Only the indices of the examples flow through the tf.data pipeline: no file
+    is read and no record is decoded after the first call of cached_arrays.
+    Args:
+        images: numpy array with shape [num_examples, height, width, depth]
+        labels: numpy array with shape [num_examples]
+        batch_size: Number of images per batch.
+        shuffle: boolean indicating whether to shuffle the examples.
+            Ignored if single_pass has been called on the current graph.
+        num_threads: number of batches sliced in parallel.
+            Default: default_num_threads()
+        prefetch: number of batches to prepare in background
+        batch_fn: function(images, labels) -> tuple of batches. If present, it's
+            applied to every batch, in parallel, before the prefetch.
+
+    Returns:
+        images: Images. 4D tensor of [batch_size, height, width, depth] size.
+        labels: Labels. 1D tensor of [batch_size] size containing the elements of labels
+    """
+    num_examples = len(labels)
+    dataset = tf.data.Dataset.range(num_examples)
+    if shuffle and not tf.get_collection(SINGLE_PASS):
+        # the buffer holds only the indices: shuffle the whole split
+        dataset = dataset.shuffle(num_examples)
+    # every batch is full: the last batch of an epoch is completed with
+    # the first examples of the next one (the same behavior of build_batch)
+    dataset = dataset.repeat().batch(batch_size)
+
+    def _slice(indices):
+        return images[indices], labels[indices]
+
+    def _gather(indices):
+        row = tf.py_func(
+            _slice, [indices],
+            [tf.as_dtype(images.dtype),
+             tf.as_dtype(labels.dtype)],
+            stateful=False)
+        row[0].set_shape([None] + list(images.shape[1:]))
+        row[1].set_shape([None] + list(labels.shape[1:]))
+        if batch_fn is not None:
+            return tuple(batch_fn(*row))
+        return tuple(row)
+
+    dataset = dataset.map(
+        _gather, num_parallel_calls=num_threads or default_num_threads())
+    dataset = dataset.prefetch(prefetch)
+
+    row = list(dataset.make_one_shot_iterator().get_next())
+    for tensor in row:
+        tensor.set_shape([batch_size] + tensor.shape.as_list()[1:])
+    return row
+
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _write_shard(filename, images, labels):
+    """Serialize images and labels in the TFRecord file filename.
+    Returns the number of written records"""
+    rows, cols, depth = images.shape[1:4]
+    with tf.python_io.TFRecordWriter(filename) as writer:
+        for image, label in zip(images, labels):
+            example = tf.train.Example(
+                features=tf.train.Features(
+                    feature={
+                        'height': _int64_feature(rows),
+                        'width': _int64_feature(cols),
+                        'depth': _int64_feature(depth),
+                        'label': _int64_feature(int(label)),
+                        'image_raw': _bytes_feature(image.tobytes())
+                    }))
+            writer.write(example.SerializeToString())
+    return len(labels)
+
+
+def _index_filename(name, data_dir):
+    """Returns the path of the index of the shards of name"""
+    return os.path.join(data_dir, name + '.index.json')
+
+
+def convert_to_tfrecords(dataset, name, data_dir, num_shards=1,
+                         num_workers=None):
+    """Converts the dataset in num_shards TFRecord files
+    name-<shard>-of-<num_shards>.tfrecords, written in parallel by a pool of
+    processes, and save them into data_dir.
+    The index name.index.json, written when every shard is complete, contains
+    the filename and the number of records of every shard: use tfrecords_shards
+    to read it.
+    Args:
+        dataset: object with the images (a [num_examples, height, width, depth]
+                 uint8 array), labels and num_examples attributes
+        name: the name of the converted split
+        data_dir: the destination directory
+        num_shards: number of files to write
+        num_workers: number of processes that write the shards.
+                     Default: min(num_shards, default_num_threads())
+    """
     if dataset.images.shape[0] != dataset.num_examples:
         raise ValueError('Images size {} does not match label size {}.'.format(
             dataset.images.shape[0], dataset.num_examples))
-    rows = dataset.images.shape[1]
-    cols = dataset.images.shape[2]
-    depth = dataset.images.shape[3]
-
-    filename = os.path.join(data_dir, name + '.tfrecords')
-    print('Writing', filename)
-    writer = tf.python_io.TFRecordWriter(filename)
-    for index in range(dataset.num_examples):
-        image_raw = dataset.images[index].tostring()
-        example = tf.train.Example(
-            features=tf.train.Features(
-                feature={
-                    'height': _int64_feature(rows),
-                    'width': _int64_feature(cols),
-                    'depth': _int64_feature(depth),
-                    'label': _int64_feature(int(dataset.labels[index])),
-                    'image_raw': _bytes_feature(image_raw)
-                }))
-        writer.write(example.SerializeToString())
-    writer.close()
+
+    # contiguous shards: reading them in order reads the dataset in order
+    bounds = np.linspace(0, dataset.num_examples, num_shards + 1).astype(int)
+    shards = [(os.path.join(data_dir, '{}-{:05d}-of-{:05d}.tfrecords'.format(
+        name, shard, num_shards)), dataset.images[begin:end],
+               dataset.labels[begin:end])
+              for shard, (begin, end) in enumerate(zip(bounds, bounds[1:]))]
+    print('Writing', len(shards), 'shards of', name)
+
+    num_workers = num_workers or min(num_shards, default_num_threads())
+    if num_workers > 1:
+        # spawn: the workers can't share the TensorFlow runtime of the parent
+        with multiprocessing.get_context('spawn').Pool(num_workers) as pool:
+            counts = pool.starmap(_write_shard, shards)
+    else:
+        counts = [_write_shard(*shard) for shard in shards]
+
+    with open(_index_filename(name, data_dir), 'w') as index:
+        json.dump({
+            "num_examples": int(sum(counts)),
+            "shards": [{
+                "filename": os.path.basename(shard[0]),
+                "num_examples": count
+            } for shard, count in zip(shards, counts)]
+        }, index, indent=2)
+
+
+def tfrecords_shards(name, data_dir):
+    """Returns the paths of the shards of name written by convert_to_tfrecords
+    in data_dir, in order, or None if the conversion is not complete"""
+    index_file = _index_filename(name, data_dir)
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file) as index:
+        index = json.load(index)
+    return [
+        os.path.join(data_dir, shard["filename"]) for shard in index["shards"]
+    ]
+
+
+def read_manifest(data_dir):
+    """Returns the manifest written by prepare in data_dir, without preparing
+    the dataset, or None if the dataset has never been prepared"""
+    data_dir = os.path.abspath(data_dir)
+    if data_dir not in _MANIFESTS:
+        manifest_file = os.path.join(data_dir, MANIFEST)
+        if not os.path.exists(manifest_file):
+            return None
+        with open(manifest_file) as manifest:
+            try:
+                _MANIFESTS[data_dir] = json.load(manifest)
+            except ValueError:
+                return None
+    return _MANIFESTS[data_dir]
+
+
+def prepare(data_dir, prepare_fn):
+    """Prepare (download, extract, convert) the dataset in data_dir, once
+    per process. Processes that prepare the same data_dir at the same time
+    hold an exclusive lock on data_dir/.prepare.lock: the first does the work,
+    the others wait for it and find the dataset ready.
+    Args:
+        data_dir: the directory of the dataset
+        prepare_fn: function() -> dict of metadata or None.
+                    Must skip the work already done by a previous call.
+    Returns:
+        manifest: the dict returned by prepare_fn, with the "prepared" time.
+                  Saved in data_dir/MANIFEST and read back by read_manifest
+    """
+    data_dir = os.path.abspath(data_dir)
+    if data_dir in _PREPARED:
+        return _MANIFESTS[data_dir]
+
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, '.prepare.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = dict(prepare_fn() or {})
+            manifest["prepared"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            manifest_file = os.path.join(data_dir, MANIFEST)
+            with open(manifest_file + '.tmp', 'w') as output:
+                json.dump(manifest, output, indent=2, sort_keys=True)
+            os.rename(manifest_file + '.tmp', manifest_file)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    _MANIFESTS[data_dir] = manifest
+    _PREPARED.add(data_dir)
+    return manifest
@@ -7,6 +7,7 @@
 #licenses expressed under Section 1.12 of the MPL v2.
 """Utils for models creation"""
 
+import copy
 import re
 import tensorflow as tf
 from .collections import SCALAR_SUMMARIES, REQUIRED_NON_TRAINABLES
@@ -22,6 +23,21 @@ def legalize_name(name):
     return re.sub(r"[^\w|/]", "_", name)
 
 
+def picklable_copy(model):
+    """Returns a shallow copy of model that can be sent to another process.
+    The model info contains the training arguments (that are not picklable)
+    and the evaluator is bound to the model: the copy has none of them.
+    Args:
+        model: implementation of the Model interface
+    Returns:
+        model: the copy of model
+    """
+    model = copy.copy(model)
+    model.info = {}
+    model._evaluator = None  # pylint: disable=protected-access
+    return model
+
+
 def tf_log(summary, collection=SCALAR_SUMMARIES):
     """Add tf.summary object to collection named collection"""
     tf.add_to_collection(collection, summary)
@@ -9,6 +9,7 @@
 
 import os
 import tensorflow as tf
+from .inputs import augmentation
 from .inputs.interfaces import InputType
 from .trainer.Trainer import Trainer
 
@@ -99,8 +100,10 @@ def _parse_hyperparameters(hyperparams=None):
                 "augmentation": {
                     # The name of the augmentation: identity disables the augmentations
                     "name": "identity",
-                    # The function of the augmentation: fn(x) where x is the orignnal sample
-                    "fn": lambda x: x,
+                    # The function of the augmentation: fn(x) where x is the orignnal sample,
+                    # or a batched augmentation of dytb.inputs.augmentation, that
+                    # augments the whole batch at once
+                    "fn": augmentation.identity,
                     # The multiplicative factor of the training set: online data augmentation
                     # can generate a potentially infinite number of training samples.
                     # However, the generated samples starts to look "similar" after
@@ -177,12 +180,66 @@ def _parse_surgery(surgery=None):
     return args
 
 
+def _parse_evaluation(evaluation=None):
+    """Check if every parameter passed in evaluation is valid
+    for the evaluation performed during the training process.
+
+    Returns:
+        evaluation: the same dictionary with default values added if needed
+    Raises:
+        ValueError if evaluation values are not valid
+    """
+    if evaluation is None:
+        evaluation = {}
+
+    available_keys = {"mode", "train_metrics", "train_examples"}
+    difference = evaluation.keys() - available_keys
+    if difference:
+        raise ValueError(
+            "{} are not valid keys for {}. Valid keys are: {}".format(
+                difference, "evaluation", available_keys))
+
+    args = {
+        # checkpoint: at the end of every epoch the model is saved and
+        # then restored into a new graph to be evaluated.
+        # session: the evaluation graph is built into the training graph,
+        # sharing the variables with the model under training. The evaluation
+        # is executed in the training session, without save & restore.
+        # async: the training process only saves the checkpoints. A background
+        # process evaluates every new checkpoint on the validation set,
+        # logs the validation metrics and saves the best model.
+        "mode": evaluation.get("mode", "checkpoint"),
+        # How to measure the metrics on the training set at the end of every epoch.
+        # full: evaluate the whole training set.
+        # subsample: evaluate a random subsample of train_examples examples.
+        # streaming: accumulate the metrics measured on the batches
+        # fed to the model by the optimizer during the epoch.
+        "train_metrics": evaluation.get("train_metrics", "full"),
+        # The size of the training set subsample
+        "train_examples": evaluation.get("train_examples", 10000),
+    }
+
+    available_modes = {"checkpoint", "session", "async"}
+    if args["mode"] not in available_modes:
+        raise ValueError("Invalid evaluation mode {}. Valid modes are: {}".
+                         format(args["mode"], available_modes))
+    available_train_metrics = {"full", "subsample", "streaming"}
+    if args["train_metrics"] not in available_train_metrics:
+        raise ValueError("Invalid train_metrics {}. Valid values are: {}".
+                         format(args["train_metrics"],
+                                available_train_metrics))
+    if args["train_examples"] <= 0:
+        raise ValueError("train_examples <= 0")
+    return args
+
+
 def train(model,
           dataset,
           hyperparameters=None,
           surgery=None,
           force_restart=False,
-          comment=""):
+          comment="",
+          evaluation=None):
     """Train the model using the provided dataset and the specifiied hyperparameters.
     Args:
         model: instance of a model interface
@@ -193,6 +250,8 @@ def train(model,
         force_restart: boolean, indicates if restart the train from 0 removing the old model
                        or continue the training.
         comment: string to append at the log dir name
+        evaluation: dictionary of options related to the evaluation performed at the
+                    end of every epoch
     Returns:
         info dict containing the information of the trained model
     """
@@ -201,6 +260,7 @@ def train(model,
     args = {
         **hyperparameters,
         **surgery,
+        "evaluation": _parse_evaluation(evaluation),
         "force_restart": force_restart,
         "model": model,
         "dataset": dataset,
@@ -10,13 +10,15 @@
 import time
 import os
 import math
+import multiprocessing
 from datetime import datetime
 import numpy as np
 import tensorflow as tf
 from .utils import builders, flow
+from .utils.watcher import watch
 
 from ..inputs.interfaces import InputType
-from ..models.utils import tf_log, variables_to_train, count_trainable_parameters
+from ..models.utils import tf_log, variables_to_train, count_trainable_parameters, picklable_copy
 from ..models.collections import SCALAR_SUMMARIES, MEDIA_SUMMARIES
 from ..models.visualization import log_images
 
@@ -119,7 +121,7 @@ class Trainer(object):
                     # Build tensorboard scalar visualizations using placeholder
                     metric_values_.append(tf.placeholder(tf.float32, shape=()))
                     metric_summaries.append(
-                        tf.summary.scalar(metric["name"], metric_values_[idx]))
+                        tf.summary.scalar(metric["name"], metric_values_[-1]))
 
                     metrics_to_measure.append(metric)
 
@@ -140,6 +142,35 @@ class Trainer(object):
                     tf.summary.image(viz["name"], visualization_values_[idx]))
                 visualizations_to_measure.append(viz)
 
+            # validation performed by a background process
+            async_evaluation = self._args["evaluation"]["mode"] == "async"
+            # training set metrics accumulated during the epoch
+            train_metrics = self._args["evaluation"]["train_metrics"]
+            train_ops = [train_op, loss]
+            if train_metrics == "streaming":
+                streaming_values, streaming_update, streaming_reset = self._model.evaluator.build_streaming(
+                    metrics_to_measure, predictions, targets)
+                train_ops.append(streaming_update)
+            # size of the training set subsample to evaluate at the end of every epoch
+            max_train_examples = self._args["evaluation"][
+                "train_examples"] if train_metrics == "subsample" else None
+
+            # evaluation towers that share the variables with the model under training
+            in_graph = {}
+            if self._args["evaluation"]["mode"] == "session":
+                for input_type in (InputType.validation, InputType.train):
+                    if (input_type == InputType.train and
+                            train_metrics == "streaming" and
+                            not visualizations_to_measure):
+                        continue
+                    in_graph[input_type] = self._model.evaluator.build_in_graph(
+                        metrics_to_measure,
+                        visualizations_to_measure,
+                        input_type=input_type,
+                        batch_size=self._args["batch_size"])
+                    if in_graph[input_type] is None:
+                        return
+
             # read collection after that every op added its own
             # summaries in the train_summaries collection.
             # No metrics are addded to the SCALAR_SUMMARIES collection
@@ -161,8 +192,11 @@ class Trainer(object):
             ]
 
             # Start running operations on the Graph.
+            # The watcher process of the async evaluation shares the GPU
             with tf.Session(config=tf.ConfigProto(
-                    allow_soft_placement=True)) as sess:
+                    allow_soft_placement=True,
+                    gpu_options=tf.GPUOptions(
+                        allow_growth=async_evaluation))) as sess:
                 sess.run(init)
 
                 # Start the queue runners with a coordinator
@@ -175,14 +209,27 @@ class Trainer(object):
                 train_log, validation_log = builders.build_loggers(
                     sess.graph, self._paths)
 
-                # If a best model already exists (thus we're continuing a train
-                # process) then restore the best validation metric reached
-                # and place it into best_model_selection_measure
-                best_model_selection_measure = self._model.evaluator.eval(
-                    self._model.evaluator.metrics[model_selection_idx],
-                    self._paths["best"],
-                    input_type=InputType.validation,
-                    batch_size=self._args["batch_size"])
+                if async_evaluation:
+                    # spawn: tensorflow does not support forking a process
+                    # that already initialized its runtime
+                    context = multiprocessing.get_context("spawn")
+                    training_done = context.Event()
+                    watcher = context.Process(
+                        target=watch,
+                        args=(picklable_copy(self._model), self._dataset,
+                              self._args["batch_size"], self._paths,
+                              training_done),
+                        daemon=True)
+                    watcher.start()
+                else:
+                    # If a best model already exists (thus we're continuing a train
+                    # process) then restore the best validation metric reached
+                    # and place it into best_model_selection_measure
+                    best_model_selection_measure = self._model.evaluator.eval(
+                        self._model.evaluator.metrics[model_selection_idx],
+                        self._paths["best"],
+                        input_type=InputType.validation,
+                        batch_size=self._args["batch_size"])
 
                 # Extract previous global step value
                 old_gs = sess.run(global_step)
@@ -190,8 +237,8 @@ class Trainer(object):
                 # Restart from where we were
                 for step in range(old_gs, self._steps["max"] + 1):
                     start_time = time.time()
-                    _, loss_value = sess.run(
-                        [train_op, loss], feed_dict={
+                    _, loss_value, *_ = sess.run(
+                        train_ops, feed_dict={
                             is_training_: True
                         })
 
@@ -235,75 +282,115 @@ class Trainer(object):
                             })
                         train_log.add_summary(summary_lines, global_step=step)
 
-                        # arrays of validation measures
-                        validation_measured_metrics = []
-                        # ta value is the model selection metric evaluate on the training
-                        # set, useful just to output on the CLI
-                        ta_value = 0
+                        # The watcher evaluates the checkpoint and saves the best model:
+                        # log only the metrics accumulated during the epoch
+                        if async_evaluation:
+                            if train_metrics == "streaming":
+                                train_measured_metrics = sess.run(
+                                    streaming_values)
+                                sess.run(streaming_reset)
+                                for idx, metric in enumerate(
+                                        metrics_to_measure):
+                                    train_log.add_summary(
+                                        sess.run(
+                                            metric_summaries[idx],
+                                            feed_dict={
+                                                metric_values_[idx]:
+                                                train_measured_metrics[metric[
+                                                    "name"]]
+                                            }),
+                                        global_step=step)
+                            continue
+
+                        # Measure every metric on the validation and on the training
+                        # set, running the model once per batch
+                        if in_graph:
+                            metrics_fn, _ = in_graph[InputType.validation]
+                            validation_measured_metrics = metrics_fn(sess)
+                        else:
+                            validation_measured_metrics = self._model.evaluator.eval_all(
+                                metrics_to_measure,
+                                self._paths["log"],
+                                input_type=InputType.validation,
+                                batch_size=self._args["batch_size"])
+
+                        if train_metrics == "streaming":
+                            train_measured_metrics = sess.run(streaming_values)
+                            sess.run(streaming_reset)
+                        elif in_graph:
+                            metrics_fn, _ = in_graph[InputType.train]
+                            train_measured_metrics = metrics_fn(
+                                sess, max_train_examples)
+                        else:
+                            train_measured_metrics = self._model.evaluator.eval_all(
+                                metrics_to_measure,
+                                self._paths["log"],
+                                input_type=InputType.train,
+                                batch_size=self._args["batch_size"],
+                                max_examples=max_train_examples)
+
                         for idx, metric in enumerate(metrics_to_measure):
-                            # validation metrics
-                            validation_measured_metrics.append(
-                                self._model.evaluator.eval(
-                                    metric,
-                                    self._paths["log"],
-                                    input_type=InputType.validation,
-                                    batch_size=self._args["batch_size"]))
                             validation_log.add_summary(
                                 sess.run(
                                     metric_summaries[idx],
                                     feed_dict={
                                         metric_values_[idx]:
-                                        validation_measured_metrics[idx]
+                                        validation_measured_metrics[metric[
+                                            "name"]]
                                     }),
                                 global_step=step)
-
-                            # Repeat measurement on the training set
-                            measure = self._model.evaluator.eval(
-                                metric,
-                                self._paths["log"],
-                                input_type=InputType.train,
-                                batch_size=self._args["batch_size"])
                             train_log.add_summary(
                                 sess.run(
                                     metric_summaries[idx],
                                     feed_dict={
-                                        metric_values_[idx]: measure
-                                    }),
-                                global_step=step)
-
-                            # fill ta_value
-                            if idx == model_selection_idx:
-                                ta_value = measure
-
-                        # visualization
-                        for idx, viz in enumerate(visualizations_to_measure):
-                            # validation metrics
-                            measured_viz = self._model.evaluator.visualize(
-                                viz,
-                                self._paths["log"],
-                                input_type=InputType.validation,
-                                batch_size=self._args["batch_size"])
-                            validation_log.add_summary(
-                                sess.run(
-                                    visualization_summaries[idx],
-                                    feed_dict={
-                                        visualization_values_[idx]: measured_viz
+                                        metric_values_[idx]:
+                                        train_measured_metrics[metric["name"]]
                                     }),
                                 global_step=step)
 
-                            # Repeat measurement on the training set
-                            measured_viz = self._model.evaluator.visualize(
-                                viz,
-                                self._paths["log"],
-                                input_type=InputType.train,
-                                batch_size=self._args["batch_size"])
-                            train_log.add_summary(
-                                sess.run(
-                                    visualization_summaries[idx],
-                                    feed_dict={
-                                        visualization_values_[idx]: measured_viz
-                                    }),
-                                global_step=step)
+                        # visualization: the train tower of the session mode
+                        # is not built when only the streaming metrics are needed
+                        if visualizations_to_measure:
+                            if in_graph:
+                                _, visualizations_fn = in_graph[InputType.validation]
+                                validation_measured_viz = visualizations_fn(sess)
+                                _, visualizations_fn = in_graph[InputType.train]
+                                train_measured_viz = visualizations_fn(sess)
+                            else:
+                                validation_measured_viz = {
+                                    viz["name"]: self._model.evaluator.visualize(
+                                        viz,
+                                        self._paths["log"],
+                                        input_type=InputType.validation,
+                                        batch_size=self._args["batch_size"])
+                                    for viz in visualizations_to_measure
+                                }
+                                train_measured_viz = {
+                                    viz["name"]: self._model.evaluator.visualize(
+                                        viz,
+                                        self._paths["log"],
+                                        input_type=InputType.train,
+                                        batch_size=self._args["batch_size"])
+                                    for viz in visualizations_to_measure
+                                }
+
+                            for idx, viz in enumerate(visualizations_to_measure):
+                                validation_log.add_summary(
+                                    sess.run(
+                                        visualization_summaries[idx],
+                                        feed_dict={
+                                            visualization_values_[idx]:
+                                            validation_measured_viz[viz["name"]]
+                                        }),
+                                    global_step=step)
+                                train_log.add_summary(
+                                    sess.run(
+                                        visualization_summaries[idx],
+                                        feed_dict={
+                                            visualization_values_[idx]:
+                                            train_measured_viz[viz["name"]]
+                                        }),
+                                    global_step=step)
 
                         name = self._model.evaluator.metrics[
                             model_selection_idx]["name"]
@@ -312,18 +399,17 @@ class Trainer(object):
                             '{} ({}): train {} = {:.3f} validation {} = {:.3f}'.
                             format(datetime.now(),
                                    int(step / self._steps["epoch"]), name,
-                                   ta_value, name, validation_measured_metrics[
-                                       model_selection_idx]))
+                                   train_measured_metrics[name], name,
+                                   validation_measured_metrics[name]))
 
                         # save best model
                         sign = math.copysign(
-                            1,
-                            validation_measured_metrics[model_selection_idx] -
+                            1, validation_measured_metrics[name] -
                             best_model_selection_measure)
                         if sign == self._model.evaluator.metrics[
                                 model_selection_idx]["positive_trend_sign"]:
                             best_model_selection_measure = validation_measured_metrics[
-                                model_selection_idx]
+                                name]
                             best_saver.save(
                                 sess,
                                 os.path.join(self._paths["best"], 'model.ckpt'),
@@ -340,6 +426,11 @@ class Trainer(object):
                 # Wait for threads to finish.
                 coord.join(threads)
 
+            if async_evaluation:
+                # Wait for the evaluation of the last checkpoints
+                training_done.set()
+                watcher.join()
+
             stats = self._model.evaluator.stats(
                 self._paths["best"], batch_size=self._args["batch_size"])
             self._model.info = {
@@ -0,0 +1,145 @@
+#Copyright (C) 2017 Paolo Galeone <nessuno@nerdz.eu>
+#
+#This Source Code Form is subject to the terms of the Mozilla Public
+#License, v. 2.0. If a copy of the MPL was not distributed with this
+#file, you can obtain one at http://mozilla.org/MPL/2.0/.
+#Exhibit B is not attached; this software is compatible with the
+#licenses expressed under Section 1.12 of the MPL v2.
+"""Evaluation of the checkpoints saved by a training process, in background"""
+
+import math
+import os
+import time
+from datetime import datetime
+import tensorflow as tf
+
+from ...inputs.interfaces import InputType
+
+
+def _global_step(checkpoint_file):
+    """Returns the global step of the checkpoint file model.ckpt-<step>"""
+    return int(checkpoint_file.split('-')[-1])
+
+
+def _save_best(checkpoint_file, best_dir):
+    """Copy the checkpoint_file into best_dir, replacing the previous best model.
+    Args:
+        checkpoint_file: path of the checkpoint file to copy
+        best_dir: path of the directory of the best model
+    """
+    if not tf.gfile.Exists(best_dir):
+        tf.gfile.MakeDirs(best_dir)
+
+    previous = tf.gfile.Glob(os.path.join(best_dir, 'model.ckpt-*'))
+    best_file = os.path.join(best_dir, os.path.basename(checkpoint_file))
+    for filename in tf.gfile.Glob(checkpoint_file + '.*'):
+        tf.gfile.Copy(
+            filename,
+            os.path.join(best_dir, os.path.basename(filename)),
+            overwrite=True)
+    tf.train.update_checkpoint_state(best_dir, best_file)
+
+    for filename in previous:
+        if not filename.startswith(best_file + '.'):
+            tf.gfile.Remove(filename)
+
+
+def watch(model, dataset, batch_size, paths, training_done, poll_interval=5):
+    """Evaluate on the validation set every new checkpoint saved in paths["log"].
+    Logs the validation metrics in the validation summaries and keeps the best
+    model (according to the model selection metric) in paths["best"].
+    Returns when training_done is set and every checkpoint has been evaluated.
+    Args:
+        model: implementation of the Model interface
+        dataset: implementation of the Input interface
+        batch_size: evaluate in batch of size batch_size
+        paths: dict of paths
+        training_done: multiprocessing.Event, set by the trainer when done
+        poll_interval: seconds to wait between two checks of paths["log"]
+    """
+    evaluator = model.evaluator
+    evaluator.dataset = dataset
+    # the GPU is shared with the training process
+    evaluator.session_config = tf.ConfigProto(
+        allow_soft_placement=True,
+        gpu_options=tf.GPUOptions(allow_growth=True))
+
+    metrics = [metric for metric in evaluator.metrics if metric["tensorboard"]]
+    selection = next(
+        metric for metric in evaluator.metrics if metric["model_selection"])
+    if selection not in metrics:
+        metrics.append(selection)
+
+    validation_log = tf.summary.FileWriter(
+        os.path.join(paths["log"], 'validation'))
+
+    # If a best model already exists (thus we're continuing a train
+    # process) then restore the best validation metric reached
+    best_measure = evaluator.eval(
+        selection,
+        paths["best"],
+        input_type=InputType.validation,
+        batch_size=batch_size)
+    if best_measure is None:
+        # the best model can't be evaluated: every checkpoint is better
+        best_measure = math.copysign(float('inf'),
+                                     -selection["positive_trend_sign"])
+
+    last_step = -1
+    while True:
+        # read the flag before looking for checkpoints: the last checkpoint
+        # is saved before the flag is set
+        done = training_done.is_set()
+        checkpoint_file = tf.train.latest_checkpoint(paths["log"])
+        if checkpoint_file and _global_step(checkpoint_file) > last_step:
+            step = _global_step(checkpoint_file)
+            last_step = step
+            try:
+                measured = evaluator.eval_all(
+                    metrics,
+                    checkpoint_file,
+                    input_type=InputType.validation,
+                    batch_size=batch_size)
+            except tf.errors.OpError as error:
+                # the checkpoint has been removed by the trainer or it's
+                # corrupted: skip it and wait for the next one
+                print('[!] Unable to evaluate the checkpoint {}: {}'.format(
+                    checkpoint_file, error.message))
+                continue
+            if measured is None:
+                # the checkpoint has been removed or can't be restored:
+                # skip it and wait for the next one
+                print('[!] Unable to evaluate the checkpoint {}'.format(
+                    checkpoint_file))
+                continue
+
+            for metric in metrics:
+                if not metric["tensorboard"]:
+                    continue
+                validation_log.add_summary(
+                    tf.Summary(value=[
+                        tf.Summary.Value(
+                            tag=metric["name"],
+                            simple_value=measured[metric["name"]])
+                    ]),
+                    global_step=step)
+            validation_log.flush()
+
+            name = selection["name"]
+            print('{} (step {}): validation {} = {:.3f}'.format(
+                datetime.now(), step, name, measured[name]))
+
+            sign = math.copysign(1, measured[name] - best_measure)
+            if sign == selection["positive_trend_sign"]:
+                best_measure = measured[name]
+                try:
+                    _save_best(checkpoint_file, paths["best"])
+                except (tf.errors.OpError, OSError) as error:
+                    print('[!] Unable to copy the checkpoint {}: {}'.format(
+                        checkpoint_file, error))
+        elif done:
+            break
+        else:
+            time.sleep(poll_interval)
+
+    validation_log.close()
@@ -15,6 +15,8 @@ import importlib
 import pprint
 import sys
 import tensorflow as tf
+from ..inputs.augmentation import AUGMENTATIONS
+from ..inputs.processing import PIPELINES
 
 
 class CLIArgs(object):
@@ -99,6 +101,12 @@ class CLIArgs(object):
             required=True,
             choices=self.get_dytb_datasets() + self.get_local_datasets())
         parser.add_argument('--batch_size', type=int, default=128)
+        parser.add_argument(
+            '--pipeline',
+            choices=PIPELINES,
+            default=None,
+            help='the input pipeline of the dataset. '
+            'Default: the default of the dataset')
 
         return parser
 
@@ -123,18 +131,29 @@ class CLIArgs(object):
                 self._args.model)()
 
         # Instantiate the input object
+        kwargs = {}
+        if self._args.pipeline is not None:
+            kwargs["pipeline"] = self._args.pipeline
+        dataset = self._get_dataset_class()(**kwargs)
+
+        return model, dataset
+
+    def _get_dataset_class(self):
+        """Return the class of the dataset.
+        Returns:
+            dataset_class: the class of the input"""
+
+        sys.path.append(os.getcwd())
+
         # Give the precedente to local datasets
         if self._args.dataset in self.get_local_datasets():
-            dataset = getattr(
+            return getattr(
                 importlib.import_module('inputs.' + self._args.dataset),
-                self._args.dataset)()
-        else:
-            dataset = getattr(
-                importlib.import_module(
-                    'dytb.inputs.predefined.' + self._args.dataset),
-                self._args.dataset)()
-
-        return model, dataset
+                self._args.dataset)
+        return getattr(
+            importlib.import_module(
+                'dytb.inputs.predefined.' + self._args.dataset),
+            self._args.dataset)
 
     def parse_eval(self):
         """Parser the CLI arguments for the evaluation procedure
@@ -150,6 +169,34 @@ class CLIArgs(object):
             required=True,
             help='the path to a checkpoint from which load the model')
         parser.add_argument("--test", action="store_true", help='use test set')
+        parser.add_argument(
+            "--exact",
+            action="store_true",
+            help='read every example exactly once: the results do not depend '
+            'on the batch size')
+        parser.add_argument(
+            "--max_workers",
+            type=int,
+            default=1,
+            help='maximum number of processes to use to evaluate the splits in '
+            'parallel. Every split is evaluated by a single process: values '
+            'greater than 3 use 3 processes')
+        parser.add_argument(
+            "--no_cache",
+            action="store_true",
+            help='do not use the cached evaluation results of the checkpoint')
+        parser.add_argument(
+            "--tta",
+            choices=['flip', 'crops', 'flip_crops'],
+            help='test time augmentation: evaluate the model on the views of '
+            'every input batch and reduce the predictions of the views. '
+            'Classifiers only')
+        parser.add_argument(
+            "--tta_reduce",
+            choices=['mean', 'max'],
+            default='mean',
+            help='how to reduce the predictions of the test time augmentation views'
+        )
 
         # Hardware
         parser.add_argument('--eval_device', default='/gpu:0')
@@ -222,6 +269,19 @@ class CLIArgs(object):
             default=150,
             help='number of epochs to train the model')
 
+        # Augmentations
+        parser.add_argument(
+            '--augmentation',
+            default='identity',
+            help='comma separated list of batched augmentations to apply, in '
+            'order. Available: {}'.format(', '.join(sorted(AUGMENTATIONS))))
+        parser.add_argument(
+            '--augmentation_factor',
+            type=int,
+            default=1,
+            help='multiplicative factor of the training set size introduced '
+            'by the augmentation')
+
         # Hardware
         parser.add_argument(
             '--train_device',
@@ -254,6 +314,28 @@ class CLIArgs(object):
             default='',
             help='the path to a checkpoint from which load the model')
 
+        # Evaluation
+        parser.add_argument(
+            '--evaluation_mode',
+            choices=['checkpoint', 'session', 'async'],
+            default='checkpoint',
+            help='checkpoint: evaluate the saved checkpoint into a new graph. '
+            'session: evaluate the model into the training session. '
+            'async: evaluate the saved checkpoints in a background process')
+        parser.add_argument(
+            '--train_metrics',
+            choices=['full', 'subsample', 'streaming'],
+            default='full',
+            help='full: measure the metrics on the whole training set. '
+            'subsample: measure the metrics on a random subsample of the training set. '
+            'streaming: accumulate the metrics measured during the training steps')
+        parser.add_argument(
+            '--train_examples',
+            type=int,
+            default=10000,
+            help='size of the training set subsample, when train_metrics=subsample'
+        )
+
         # Build the object
         self._args = parser.parse_args()
 
@@ -263,3 +345,67 @@ class CLIArgs(object):
         print('Args: {}'.format(pprint.pformat(vars(self._args), indent=4)))
 
         return self._args, model, dataset
+
+    def parse_bench(self):
+        """Parser the CLI arguments for the input benchmark procedure
+        and return
+        Returns:
+            args: args object
+            dataset_class: the class of the input
+        """
+
+        def _list(type_fn):
+            """Returns the parser of a comma separated list of values"""
+            return lambda values: [
+                type_fn(value.strip()) for value in values.split(',')
+            ]
+
+        parser = argparse.ArgumentParser(description=self._description)
+        parser.add_argument(
+            '--dataset',
+            required=True,
+            choices=self.get_dytb_datasets() + self.get_local_datasets())
+        parser.add_argument(
+            '--input_type',
+            choices=['train', 'validation', 'test'],
+            default='train')
+        parser.add_argument(
+            '--batch_sizes',
+            type=_list(int),
+            default=[128],
+            help='comma separated list of batch sizes')
+        parser.add_argument(
+            '--num_threads',
+            type=_list(int),
+            default=[None],
+            help='comma separated list of number of threads of the pipeline. '
+            'Default: the default of the dataset')
+        parser.add_argument(
+            '--pipeline',
+            choices=PIPELINES,
+            default=None,
+            help='the input pipeline of the dataset. '
+            'Default: the default of the dataset')
+        parser.add_argument(
+            '--augmentation',
+            default=None,
+            help='comma separated list of batched augmentations. If present, '
+            'every configuration is measured with and without augmentation. '
+            'Available: {}'.format(', '.join(sorted(AUGMENTATIONS))))
+        parser.add_argument(
+            '--num_steps',
+            type=int,
+            default=100,
+            help='number of measured batches of every configuration')
+        parser.add_argument(
+            '--warmup_steps',
+            type=int,
+            default=10,
+            help='number of batches read before every measurement')
+        parser.add_argument(
+            '--output',
+            default='bench_inputs.json',
+            help='the results file: csv if it ends with .csv, json otherwise')
+
+        self._args = parser.parse_args()
+        return self._args, self._get_dataset_class()
@@ -26,5 +26,8 @@ setup(
     download_url='/'.join((METADATA['url'].rstrip('/'), 'tarball',
                            METADATA['version'])),
     license='MPL',
-    scripts=['scripts/dytb_evaluate', 'scripts/dytb_train'],
+    scripts=[
+        'scripts/dytb_evaluate', 'scripts/dytb_train',
+        'scripts/dytb_bench_inputs'
+    ],
     packages=find_packages())
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+
+from dytb.inputs.processing import build_dataset_batch
+
+
+class TestDatasetBatch(unittest.TestCase):
+
+    NUM_FILES = 3
+    RECORDS_PER_FILE = 7
+    BATCH_SIZE = 4
+
+    def setUp(self):
+        # every record is a single byte: its position in the epoch
+        self._dir = tempfile.mkdtemp()
+        self._filenames = []
+        for i in range(self.NUM_FILES):
+            filename = os.path.join(self._dir, 'data_{}.bin'.format(i))
+            np.arange(
+                i * self.RECORDS_PER_FILE, (i + 1) * self.RECORDS_PER_FILE,
+                dtype=np.uint8).tofile(filename)
+            self._filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _read_labels(self, num_batches, shuffle, drop_remainder):
+        """Read num_batches batches of the files, read by parallel readers,
+        and returns the labels of every batch"""
+
+        def _parse(record):
+            label = tf.to_int32(tf.decode_raw(record, tf.uint8)[0])
+            return tf.fill([2, 2, 1], tf.to_float(label)), label
+
+        with tf.Graph().as_default():
+            images, labels = build_dataset_batch(
+                self._filenames,
+                lambda filename: tf.data.FixedLengthRecordDataset(filename, 1),
+                _parse,
+                10,
+                self.BATCH_SIZE,
+                shuffle=shuffle,
+                num_readers=self.NUM_FILES,
+                drop_remainder=drop_remainder)
+
+            with tf.Session() as sess:
+                batches = []
+                for _ in range(num_batches):
+                    batch_images, batch_labels = sess.run([images, labels])
+                    np.testing.assert_array_equal(batch_images[:, 0, 0, 0],
+                                                  batch_labels)
+                    batches.append(batch_labels.tolist())
+        return batches
+
+    def test_wrap_around(self):
+        num_examples = self.NUM_FILES * self.RECORDS_PER_FILE
+        # the last batch of the first epoch is completed with the next one.
+        # Without shuffle the readers end their files together
+        num_batches = -(-2 * num_examples // self.BATCH_SIZE)
+        values = sum(self._read_labels(num_batches, False, False), [])
+        self.assertEqual(
+            sorted(values[:num_examples]), list(range(num_examples)))
+        self.assertEqual(
+            sorted(values[num_examples:2 * num_examples]),
+            list(range(num_examples)))
+
+    def test_drop_remainder(self):
+        num_examples = self.NUM_FILES * self.RECORDS_PER_FILE
+        batches_per_epoch = num_examples // self.BATCH_SIZE
+        batches = self._read_labels(2 * batches_per_epoch, True, True)
+        for epoch in range(2):
+            values = sum(
+                batches[epoch * batches_per_epoch:(epoch + 1) *
+                        batches_per_epoch], [])
+            # every batch of an epoch comes from that epoch only
+            self.assertEqual(len(set(values)), len(values))
+            self.assertEqual(
+                len(values), num_examples - num_examples % self.BATCH_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
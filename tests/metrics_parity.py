@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+
+from dytb.evaluators import np_metrics
+from dytb.evaluators.metrics import iou_op
+
+
+class TestMetricsParity(unittest.TestCase):
+
+    BATCH_SIZE = 8
+    NUM_BATCHES = 5
+
+    def _boxes(self, random, num_columns):
+        """Returns BATCH_SIZE random boxes, with the label column if num_columns is 5"""
+        corners = np.sort(random.uniform(size=(self.BATCH_SIZE, 2, 2)), axis=1)
+        boxes = np.concatenate([corners[:, 0], corners[:, 1]], axis=1)
+        if num_columns == 5:
+            labels = random.randint(0, 20, size=(self.BATCH_SIZE, 1))
+            boxes = np.concatenate([boxes, labels], axis=1)
+        return boxes.astype(np.float32)
+
+    def test_iou_5_columns_targets(self):
+        random = np.random.RandomState(0)
+        batches = [(self._boxes(random, 4), self._boxes(random, 5))
+                   for _ in range(self.NUM_BATCHES)]
+        # a batch of empty boxes: the IoU is NaN and the batch is skipped
+        empty = np.zeros((self.BATCH_SIZE, 5), dtype=np.float32)
+        batches.append((empty[:, :4], empty))
+
+        predictions_ = tf.placeholder(tf.float32, [None, 4])
+        targets_ = tf.placeholder(tf.float32, [None, 5])
+        iou = iou_op(predictions_, targets_)
+
+        accumulator = np_metrics.Accumulator(np_metrics.iou, average=True)
+        value_sum, count = 0., 0
+        with tf.Session() as sess:
+            for predictions, targets in batches:
+                value = sess.run(
+                    iou, feed_dict={predictions_: predictions,
+                                    targets_: targets})
+                np_value = np_metrics.iou(predictions, targets)
+                if np.isnan(value):
+                    self.assertTrue(np.isnan(np_value))
+                else:
+                    self.assertAlmostEqual(value, np_value, places=5)
+                    # the in-graph evaluation: NaN batches are excluded
+                    value_sum += value * len(targets)
+                    count += len(targets)
+                accumulator.update(predictions, targets)
+
+        self.assertEqual(count, self.NUM_BATCHES * self.BATCH_SIZE)
+        self.assertAlmostEqual(accumulator.value, value_sum / count, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
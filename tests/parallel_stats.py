@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from dytb.inputs.interfaces import InputType
+from dytb.inputs.predefined.Synthetic import Synthetic
+from dytb.models.predefined.LeNet import LeNet
+from dytb.train import train
+
+
+class TestParallelStats(unittest.TestCase):
+
+    BATCH_SIZE = 10
+
+    def setUp(self):
+        # train saves the logs and the checkpoints into the working directory
+        self._cwd = os.getcwd()
+        self._dir = tempfile.mkdtemp()
+        os.chdir(self._dir)
+
+        self._model = LeNet()
+        self._dataset = Synthetic(
+            shape=(28, 28, 1),
+            num_examples={
+                InputType.train: 2 * self.BATCH_SIZE,
+                InputType.validation: self.BATCH_SIZE,
+                InputType.test: self.BATCH_SIZE
+            })
+        self._info = train(
+            model=self._model,
+            dataset=self._dataset,
+            hyperparameters={
+                "epochs": 1,
+                "batch_size": self.BATCH_SIZE,
+                "seed": 0
+            },
+            force_restart=True)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self._dir)
+
+    def test_workers_without_cache(self):
+        # the same of dytb_evaluate --no_cache --max_workers 2
+        evaluator = self._model.evaluator
+        evaluator.cache = None
+        stats = evaluator.stats(
+            self._info["paths"]["best"],
+            batch_size=self.BATCH_SIZE,
+            max_workers=2)
+        self.assertEqual(stats.keys(), self._info["stats"].keys())
+        for split, values in stats.items():
+            for name, value in values.items():
+                np.testing.assert_allclose(
+                    value, self._info["stats"][split][name], rtol=1e-5)
+        self.assertIsNone(evaluator.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
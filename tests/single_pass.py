@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+
+from dytb.inputs.processing import build_batch, build_filename_queue, read_records, shuffle_records, single_pass
+
+
+class TestSinglePass(unittest.TestCase):
+
+    NUM_FILES = 3
+    RECORDS_PER_FILE = 7
+    BATCH_SIZE = 4
+
+    def setUp(self):
+        # every record is a single byte: its position in the epoch
+        self._dir = tempfile.mkdtemp()
+        self._filenames = []
+        for i in range(self.NUM_FILES):
+            filename = os.path.join(self._dir, 'data_{}.bin'.format(i))
+            np.arange(
+                i * self.RECORDS_PER_FILE, (i + 1) * self.RECORDS_PER_FILE,
+                dtype=np.uint8).tofile(filename)
+            self._filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _read_labels(self, num_batches, batch_fn=None):
+        """Read num_batches batches in single pass mode, with parallel readers
+        and preprocess threads, and returns the labels in dequeue order"""
+        with tf.Graph().as_default():
+            single_pass()
+            filename_queue = build_filename_queue(self._filenames)
+            record = shuffle_records(
+                read_records(
+                    lambda queue: tf.FixedLengthRecordReader(record_bytes=1).read(queue)[1],
+                    filename_queue, num_readers=4),
+                1,
+                10,
+                self.BATCH_SIZE,
+                shuffle=True)
+            label = tf.to_int32(tf.decode_raw(record, tf.uint8)[0])
+            image = tf.fill([2, 2, 1], tf.to_float(label))
+            images, labels = build_batch(
+                image,
+                label,
+                10,
+                self.BATCH_SIZE,
+                shuffle=True,
+                num_threads=4,
+                batch_fn=batch_fn)
+
+            with tf.Session() as sess:
+                sess.run(tf.local_variables_initializer())
+                coord = tf.train.Coordinator()
+                threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+                values = []
+                for _ in range(num_batches):
+                    batch_images, batch_labels = sess.run([images, labels])
+                    np.testing.assert_array_equal(batch_images[:, 0, 0, 0],
+                                                  batch_labels)
+                    values.extend(batch_labels.tolist())
+                coord.request_stop()
+                coord.join(threads, stop_grace_period_secs=5)
+        return values
+
+    def test_order_across_epochs(self):
+        num_examples = self.NUM_FILES * self.RECORDS_PER_FILE
+        # two epochs and a half: the batches cross the epoch boundaries
+        num_batches = (5 * num_examples // 2) // self.BATCH_SIZE
+        expected = list(range(num_examples)) * 3
+        for batch_fn in (None, lambda images, labels: (images, labels)):
+            values = self._read_labels(num_batches, batch_fn)
+            self.assertEqual(values, expected[:len(values)])
+            # every example of the first epoch exactly once
+            self.assertEqual(
+                sorted(values[:num_examples]), list(range(num_examples)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dytb.inputs.interfaces import InputType
+from dytb.inputs.predefined.Synthetic import Synthetic
+from dytb.models.predefined.LeNet import LeNet
+from dytb.train import train
+
+
+class TestTrainerStreaming(unittest.TestCase):
+
+    BATCH_SIZE = 10
+
+    def setUp(self):
+        # train saves the logs and the checkpoints into the working directory
+        self._cwd = os.getcwd()
+        self._dir = tempfile.mkdtemp()
+        os.chdir(self._dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self._dir)
+
+    def test_session_mode_without_visualizations(self):
+        # LeNet has no visualizations: the train tower of the session mode
+        # is not built, the training metrics are the streaming ones
+        dataset = Synthetic(
+            shape=(28, 28, 1),
+            num_examples={
+                InputType.train: 3 * self.BATCH_SIZE,
+                InputType.validation: 2 * self.BATCH_SIZE,
+                InputType.test: self.BATCH_SIZE
+            })
+        info = train(
+            model=LeNet(),
+            dataset=dataset,
+            hyperparameters={
+                "epochs": 1,
+                "batch_size": self.BATCH_SIZE,
+                "seed": 0
+            },
+            force_restart=True,
+            evaluation={"mode": "session",
+                        "train_metrics": "streaming"})
+        self.assertIn("accuracy", info["stats"]["train"])
+        self.assertIn("accuracy", info["stats"]["validation"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from dytb.evaluators import tta
+from dytb.evaluators.AutoencoderEvaluator import AutoencoderEvaluator
+from dytb.evaluators.ClassifierEvaluator import ClassifierEvaluator
+from dytb.evaluators.DetectorEvaluator import DetectorEvaluator
+from dytb.evaluators.RegressorEvaluator import RegressorEvaluator
+from dytb.inputs.interfaces import InputType
+
+
+class TestTTA(unittest.TestCase):
+
+    TTA = {"views": tta.VIEWS["flip"], "reduce": "mean"}
+
+    def test_geometric_predictions(self):
+        # boxes and images change with the views: they can't be reduced
+        for evaluator_class in (DetectorEvaluator, AutoencoderEvaluator,
+                                RegressorEvaluator):
+            evaluator = evaluator_class()
+            with self.assertRaisesRegex(ValueError, "test time augmentation"):
+                evaluator.eval_all([], "/nonexistent", InputType.validation,
+                                   16, tta=self.TTA)
+            with self.assertRaisesRegex(ValueError, "test time augmentation"):
+                evaluator.stats("/nonexistent", 16, max_workers=2, tta=self.TTA)
+
+    def test_classifier(self):
+        evaluator = ClassifierEvaluator()
+        # the tta dictionary is checked only after the evaluator support
+        with self.assertRaisesRegex(ValueError, "views"):
+            evaluator.eval_all([], "/nonexistent", InputType.validation, 16,
+                               tta={"views": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
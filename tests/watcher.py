@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import tensorflow as tf
+
+from dytb.trainer.utils.watcher import watch
+
+METRIC = {
+    "name": "accuracy",
+    "positive_trend_sign": +1,
+    "model_selection": True,
+    "average": True,
+    "tensorboard": True,
+}
+
+
+def _save_checkpoint(log_dir, step):
+    """Write the files of a fake checkpoint and make it the latest"""
+    path = os.path.join(log_dir, 'model.ckpt-{}'.format(step))
+    for suffix in ('.index', '.meta', '.data-00000-of-00001'):
+        with open(path + suffix, 'w') as checkpoint:
+            checkpoint.write(str(step))
+    tf.train.update_checkpoint_state(log_dir, path)
+    return path
+
+
+def _remove_checkpoint(path):
+    """Remove the files of a fake checkpoint"""
+    for filename in tf.gfile.Glob(path + '.*'):
+        tf.gfile.Remove(filename)
+
+
+class _Evaluator(object):
+    """Evaluator that deletes the first checkpoint while it's evaluated,
+    then saves the second and last checkpoint"""
+
+    def __init__(self, log_dir, training_done):
+        self.dataset = None
+        self.metrics = [METRIC]
+        self.evaluated = []
+        self._log_dir = log_dir
+        self._training_done = training_done
+
+    def eval(self, metric, checkpoint_path, input_type, batch_size):
+        return float('-inf')
+
+    def eval_all(self, metrics, checkpoint_file, input_type, batch_size):
+        self.evaluated.append(os.path.basename(checkpoint_file))
+        if checkpoint_file.endswith('-1'):
+            _remove_checkpoint(checkpoint_file)
+            _save_checkpoint(self._log_dir, 2)
+            self._training_done.set()
+            return None
+        return {METRIC["name"]: 0.5}
+
+
+class _CorruptEvaluator(_Evaluator):
+    """Evaluator that fails to restore the first checkpoint,
+    then saves the second and last checkpoint"""
+
+    def eval_all(self, metrics, checkpoint_file, input_type, batch_size):
+        self.evaluated.append(os.path.basename(checkpoint_file))
+        if checkpoint_file.endswith('-1'):
+            _save_checkpoint(self._log_dir, 2)
+            self._training_done.set()
+            raise tf.errors.DataLossError(None, None,
+                                          'Unable to open table file')
+        return {METRIC["name"]: 0.5}
+
+
+class _Model(object):
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._paths = {
+            "log": os.path.join(self._dir, 'log'),
+            "best": os.path.join(self._dir, 'best')
+        }
+        os.makedirs(self._paths["log"])
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _watch(self, evaluator_class):
+        """Watch paths["log"] with an evaluator of evaluator_class,
+        starting from its first checkpoint.
+        Returns the evaluator"""
+        training_done = threading.Event()
+        evaluator = evaluator_class(self._paths["log"], training_done)
+        _save_checkpoint(self._paths["log"], 1)
+
+        watcher = threading.Thread(
+            target=watch,
+            args=(_Model(evaluator), None, 16, self._paths, training_done),
+            kwargs={"poll_interval": 0.1})
+        watcher.start()
+        watcher.join(timeout=60)
+
+        self.assertFalse(watcher.is_alive())
+        return evaluator
+
+    def test_deleted_checkpoint(self):
+        evaluator = self._watch(_Evaluator)
+        self.assertEqual(evaluator.evaluated, ['model.ckpt-1', 'model.ckpt-2'])
+        self.assertEqual(
+            tf.train.latest_checkpoint(self._paths["best"]),
+            os.path.join(self._paths["best"], 'model.ckpt-2'))
+
+    def test_corrupt_checkpoint(self):
+        evaluator = self._watch(_CorruptEvaluator)
+        self.assertEqual(evaluator.evaluated, ['model.ckpt-1', 'model.ckpt-2'])
+        self.assertEqual(
+            tf.train.latest_checkpoint(self._paths["best"]),
+            os.path.join(self._paths["best"], 'model.ckpt-2'))
+
+
+if __name__ == '__main__':
+    unittest.main()